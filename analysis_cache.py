@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ===================== 1. 缓存配置 =====================
+# 缓存数据库文件名（位于--cache指定的目录下）
+CACHE_FILENAME = "analysis_cache.sqlite3"
+# 磁盘缓存最大条目数（超出后按最近访问时间淘汰）
+DEFAULT_MAX_ENTRIES = 2_000_000
+# 内存LRU最大条目数
+DEFAULT_MEMORY_ENTRIES = 50_000
+# 每写入多少条检查一次磁盘容量
+EVICT_CHECK_INTERVAL = 10_000
+# SQLite单条语句的参数上限（分块查询）
+SQL_CHUNK = 500
+# 去重表最多保留的分析结果条数（超出后按最近使用淘汰）
+DEDUP_MAX_ENTRIES = 200_000
+
+# 一个句子的分析结果：[[(词, UPOS, 词元), ...], ...]（外层为Stanza切出的子句）
+Analysis = List[List[Tuple[str, str, Optional[str]]]]
+
+# ===================== 2. 内容寻址缓存 =====================
+class AnalysisCache:
+    """
+    Stanza分析结果的持久化缓存
+    键：句子哈希 + 语言 + 处理器组合；值：词/UPOS/词元
+    前端为内存LRU，后端为SQLite（WAL模式，多个进程可同时读取，写入串行）
+    """
+
+    def __init__(self, cache_dir: str, lang: str, processors: str, pretokenized: bool = False,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILENAME)
+        self.namespace = f"{lang}|{processors}|{'pretokenized' if pretokenized else 'raw'}"
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_check = 0
+
+        import sqlite3
+        self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "key BLOB PRIMARY KEY, value TEXT NOT NULL, atime REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS analyses_atime ON analyses(atime)")
+
+    def key(self, text: str) -> bytes:
+        """句子的内容哈希（含语言与处理器组合）"""
+        return hashlib.blake2b(f"{self.namespace}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text: str) -> Optional[Analysis]:
+        return self.get_many([text]).get(text)
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, Analysis]:
+        """批量查询，返回命中的 {句子: 分析结果}"""
+        found = {}
+        missing = {}
+        with self.lock:
+            for text in texts:
+                key = self.key(text)
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[text] = self.memory[key]
+                else:
+                    missing[key] = text
+
+            if missing:
+                keys = list(missing)
+                now = time.time()
+                disk_hits = []
+                for i in range(0, len(keys), SQL_CHUNK):
+                    chunk = keys[i:i + SQL_CHUNK]
+                    rows = self.conn.execute(
+                        f"SELECT key, value FROM analyses WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, value in rows:
+                        analysis = _decode(value)
+                        found[missing[key]] = analysis
+                        self._remember(key, analysis)
+                        disk_hits.append((now, key))
+                if disk_hits:
+                    # 更新访问时间，供容量淘汰使用
+                    self.conn.executemany("UPDATE analyses SET atime = ? WHERE key = ?", disk_hits)
+
+                self.misses += len(missing) - len(disk_hits)
+
+            self.hits += len(found)
+        return found
+
+    def put(self, text: str, analysis: Analysis):
+        self.put_many({text: analysis})
+
+    def put_many(self, items: Dict[str, Analysis]):
+        """批量写入（单个事务）"""
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            rows = []
+            for text, analysis in items.items():
+                key = self.key(text)
+                self._remember(key, analysis)
+                rows.append((key, json.dumps(analysis, ensure_ascii=False), now))
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO analyses (key, value, atime) VALUES (?, ?, ?)", rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._puts_since_check += len(rows)
+            if self._puts_since_check >= EVICT_CHECK_INTERVAL:
+                self._puts_since_check = 0
+                self._evict()
+
+    def _remember(self, key: bytes, analysis: Analysis):
+        self.memory[key] = analysis
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        """磁盘条目超出上限时，删除最久未访问的条目"""
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM analyses").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM analyses WHERE key IN "
+                "(SELECT key FROM analyses ORDER BY atime LIMIT ?)", (excess,)
+            )
+
+    def close(self):
+        with self.lock:
+            self._evict()
+            self.conn.close()
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return f"分析缓存命中 {self.hits}/{total}（{ratio:.2f}%）：{self.path}"
+
+
+# ===================== 3. 句子去重 =====================
+def normalize_text(text: str) -> str:
+    """去重用的规范化：合并连续空白（不改变Stanza的切分结果）"""
+    return " ".join(text.split())
+
+
+class DedupMemo:
+    """
+    句子级去重：按规范化后句子的哈希识别重复句，同一句子只送入Stanza一次，分析结果分发给它的每次出现
+    先用scan()扫描整个文件时只保留确实会重复出现的句子，内存占用与重复句数成正比；
+    不扫描时退化为有界的最近使用表
+    """
+
+    def __init__(self, max_entries: int = DEDUP_MAX_ENTRIES):
+        self.memory = OrderedDict()
+        self.max_entries = max_entries
+        self.repeated = None
+        self.requests = 0   # 需要分析的句子出现次数
+        self.analyzed = 0   # 实际送入Stanza的句子数
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+    def scan(self, texts: Iterable[str]) -> Tuple[int, int]:
+        """预扫描全部句子，记录出现不止一次的句子，返回 (句子出现次数, 不同句子数)"""
+        seen = set()
+        repeated = set()
+        total = 0
+        for text in texts:
+            key = self.key(text)
+            total += 1
+            if key in seen:
+                repeated.add(key)
+            else:
+                seen.add(key)
+        self.repeated = repeated
+        return total, len(seen)
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, Analysis]:
+        found = {}
+        for text in texts:
+            key = self.key(text)
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[text] = self.memory[key]
+        return found
+
+    def put_many(self, items: Dict[str, Analysis]):
+        for text, analysis in items.items():
+            key = self.key(text)
+            if self.repeated is not None and key not in self.repeated:
+                continue
+            self.memory[key] = analysis
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def record(self, requests: int, analyzed: int):
+        self.requests += requests
+        self.analyzed += analyzed
+
+    def ratio(self) -> float:
+        """去重率：未送入Stanza的句子出现次数占比"""
+        return 1 - self.analyzed / self.requests if self.requests else 0.0
+
+    def summary(self) -> str:
+        return (f"句子去重：需分析 {self.requests} 次，实际送入Stanza {self.analyzed} 句"
+                f"（去重率 {self.ratio() * 100:.2f}%）")
+
+
+def doc_to_analysis(doc) -> Analysis:
+    """把Stanza Document转换为可缓存的 [[(词, UPOS, 词元), ...], ...]"""
+    return [[(word.text, word.upos, word.lemma) for word in sent.words] for sent in doc.sentences]
+
+
+def _decode(value: str) -> Analysis:
+    return [[tuple(word) for word in sent] for sent in json.loads(value)]
@@ -0,0 +1,379 @@
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional
+
+from m2_reader import Edit, M2Block
+from token_store import Word
+
+if TYPE_CHECKING:
+    # 只用于类型标注：统计/对比等纯读取命令不必加载分析缓存模块（sqlite3/hashlib）
+    from analysis_cache import Analysis
+
+# ===================== 1. 文件格式 =====================
+# 预分析旁路文件：与M2文件同名加后缀，保存每个句子块的分词/词性/词元、全部编辑记录，
+# 以及每条编辑分类时用到的对齐特征（原始/修正词及其词性、词元），规则修改后可只重跑分类（见reclassify.py）
+SIDECAR_SUFFIX = ".ana"
+MAGIC = b"M2ANA002"
+# 词元为None等缺省值的字符串ID
+NONE_ID = 0xFFFFFFFF
+# 各数据段：(名称, 数组类型)；整数均为小端，字符串统一存入字符串表，其余各段只存字符串ID
+SECTIONS = (
+    ("string_data", "B"),     # 全部字符串的UTF-8字节
+    ("string_offsets", "Q"),  # 第i个字符串占 string_data[offsets[i]:offsets[i+1]]
+    ("block_source", "I"),    # 每个句子块的S行
+    ("block_sents", "I"),     # 块数+1：第i块的子句为 [block_sents[i], block_sents[i+1])
+    ("block_edits", "I"),     # 块数+1：第i块的编辑为 [block_edits[i], block_edits[i+1])
+    ("sent_tokens", "I"),     # 子句数+1：第j个子句的词为 [sent_tokens[j], sent_tokens[j+1])
+    ("token_text", "I"),
+    ("token_upos", "I"),
+    ("token_lemma", "I"),
+    ("edit_span", "I"),       # 原始span字符串（如"4 5"）
+    ("edit_start", "i"),      # span起止位置（无法解析时为-1）
+    ("edit_end", "i"),
+    ("edit_cat", "I"),
+    ("edit_cor", "I"),
+    ("edit_extras", "I"),     # 编辑数+1：第k条编辑的其余字段为 extras[edit_extras[k]:edit_extras[k+1]]
+    ("extras", "I"),
+    ("edit_c_start", "i"),    # 对齐特征：修正句中的起始位置（-1表示该编辑没有保存特征）
+    ("edit_feats", "I"),      # 编辑数+1：第k条编辑的特征词为 feat_*[edit_feats[k]:edit_feats[k+1]]（原始词在前、修正词在后）
+    ("edit_feat_split", "I"), # 第k条编辑特征词中原始词的个数
+    ("feat_text", "I"),
+    ("feat_upos", "I"),
+    ("feat_lemma", "I"),
+)
+# 文件头：魔数、对应M2文件的大小与修改时间（纳秒），随后每段一对 (字节偏移, 元素个数)
+HEADER = struct.Struct("<8sQQ" + "QQ" * len(SECTIONS))
+# 每个数据段在内存中最多缓冲的元素数，超出后写入临时文件
+SPOOL_ITEMS = 1 << 20
+
+
+def sidecar_path_for(m2_path: str) -> str:
+    return m2_path + SIDECAR_SUFFIX
+
+# ===================== 2. 写入 =====================
+class _Spool:
+    """只追加的数组段：内存中攒满后落到临时文件，关闭时整体拷贝进旁路文件"""
+
+    def __init__(self, typecode: str, tmp_dir: str):
+        import tempfile
+        self.typecode = typecode
+        self.buffer = array(typecode)
+        self.file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.count = 0
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= SPOOL_ITEMS:
+            self.flush()
+
+    def extend(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= SPOOL_ITEMS:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder != "little" and self.buffer.itemsize > 1:
+            self.buffer.byteswap()
+        self.buffer.tofile(self.file)
+        self.count += len(self.buffer)
+        self.buffer = array(self.typecode)
+
+    def copy_to(self, f_out):
+        self.flush()
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(1 << 20)
+            if not chunk:
+                break
+            f_out.write(chunk)
+        self.file.close()
+
+
+class AnalyzedCorpusWriter:
+    """
+    流式写出预分析旁路文件
+    每个数据段先写入各自的临时文件，关闭时拼接为一个文件（内存占用与语料大小无关，只与不同字符串数有关）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        tmp_dir = os.path.dirname(os.path.abspath(path))
+        self.sections = {name: _Spool(typecode, tmp_dir) for name, typecode in SECTIONS}
+        self.string_ids: Dict[str, int] = {}
+        self.string_size = 0
+        self.sections["string_offsets"].append(0)
+        self.sections["block_sents"].append(0)
+        self.sections["block_edits"].append(0)
+        self.sections["sent_tokens"].append(0)
+        self.sections["edit_extras"].append(0)
+        self.sections["edit_feats"].append(0)
+        self.n_sents = 0
+        self.n_tokens = 0
+        self.n_edits = 0
+        self.n_extras = 0
+        self.n_feats = 0
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return NONE_ID
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.string_ids)
+            data = value.encode("utf-8")
+            self.sections["string_data"].extend(data)
+            self.string_size += len(data)
+            self.sections["string_offsets"].append(self.string_size)
+        return string_id
+
+    def add_block(self, source: str, analysis: Optional["Analysis"], edits: Iterable[Edit],
+                  features: Optional[List[Optional[dict]]] = None):
+        """
+        追加一个句子块
+        :param analysis: 原始句的 [[(词, UPOS, 词元), ...], ...]（无分析结果时为None）
+        :param edits: 该块写入M2文件的编辑
+        :param features: 与edits一一对应的对齐特征 {"o_start", "c_start", "orig_toks", "cor_toks"}（可选，缺项为None）
+        """
+        s = self.sections
+        edits = list(edits)
+        if features is None:
+            features = [None] * len(edits)
+        s["block_source"].append(self.intern(source))
+        for sent in analysis or ():
+            for text, upos, lemma in sent:
+                s["token_text"].append(self.intern(text))
+                s["token_upos"].append(self.intern(upos))
+                s["token_lemma"].append(self.intern(lemma))
+            self.n_tokens += len(sent)
+            self.n_sents += 1
+            s["sent_tokens"].append(self.n_tokens)
+        for edit, feature in zip(edits, features):
+            s["edit_span"].append(self.intern(edit.span))
+            try:
+                start, end = edit.start, edit.end
+            except (ValueError, IndexError):
+                start, end = -1, -1
+            s["edit_start"].append(start)
+            s["edit_end"].append(end)
+            s["edit_cat"].append(self.intern(edit.cat))
+            s["edit_cor"].append(self.intern(edit.cor))
+            s["extras"].extend([self.intern(field) for field in edit.extra])
+            self.n_extras += len(edit.extra)
+            s["edit_extras"].append(self.n_extras)
+            self.add_feature(feature)
+            self.n_edits += 1
+        s["block_sents"].append(self.n_sents)
+        s["block_edits"].append(self.n_edits)
+
+    def add_feature(self, feature: Optional[dict]):
+        s = self.sections
+        if feature is None:
+            s["edit_c_start"].append(-1)
+            s["edit_feat_split"].append(0)
+        else:
+            s["edit_c_start"].append(feature["c_start"])
+            s["edit_feat_split"].append(len(feature["orig_toks"]))
+            for tok in list(feature["orig_toks"]) + list(feature["cor_toks"]):
+                s["feat_text"].append(self.intern(tok.text))
+                s["feat_upos"].append(self.intern(tok.pos))
+                s["feat_lemma"].append(self.intern(tok.lemma))
+                self.n_feats += 1
+        s["edit_feats"].append(self.n_feats)
+
+    def close(self, m2_path: Optional[str] = None):
+        """
+        拼接各数据段写出旁路文件
+        :param m2_path: 对应的M2文件（应已写完并关闭），记录其大小和修改时间用于判断旁路文件是否过期
+        """
+        stat = os.stat(m2_path) if m2_path else None
+        tmp_path = self.path + ".tmp"
+        fields = []
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * HEADER.size)
+            for name, _ in SECTIONS:
+                spool = self.sections[name]
+                # 每段按8字节对齐
+                f.write(b"\0" * (-f.tell() % 8))
+                offset = f.tell()
+                spool.copy_to(f)
+                fields.extend((offset, spool.count))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, stat.st_size if stat else 0, stat.st_mtime_ns if stat else 0, *fields))
+        os.replace(tmp_path, self.path)
+
+    def abort(self):
+        for spool in self.sections.values():
+            spool.file.close()
+
+# ===================== 3. 基于mmap的读取 =====================
+class AnalyzedCorpus:
+    """
+    以mmap方式读取预分析旁路文件
+    各数据段直接映射为整数数组视图，取某个句子块的词/编辑只解码用到的字符串，无需加载Stanza
+    """
+
+    def __init__(self, path: str, m2_path: Optional[str] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            header = (b"",)
+        if header[0] != MAGIC:
+            self._map.close()
+            raise ValueError(f"不是有效的预分析旁路文件: {path}")
+        self.m2_size, self.m2_mtime_ns = header[1], header[2]
+        if m2_path is not None and not self.matches(m2_path):
+            self._map.close()
+            raise ValueError(f"预分析旁路文件已过期（M2文件在其写出后被修改）: {path}")
+        self._views = []
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, count = header[3 + 2 * i], header[4 + 2 * i]
+            itemsize = array(typecode).itemsize
+            raw = memoryview(self._map)[offset:offset + count * itemsize]
+            self._views.append(raw)
+            if sys.byteorder == "little" or itemsize == 1:
+                view = raw.cast(typecode)
+                self._views.append(view)
+            else:
+                view = array(typecode, raw)
+                view.byteswap()
+            setattr(self, name, view)
+        self._string_cache: Dict[int, str] = {}
+
+    @classmethod
+    def open_for(cls, m2_path: str) -> Optional["AnalyzedCorpus"]:
+        """打开M2文件旁的预分析文件；不存在或已过期时返回None"""
+        path = sidecar_path_for(m2_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path, m2_path)
+        except ValueError:
+            return None
+
+    def matches(self, m2_path: str) -> bool:
+        stat = os.stat(m2_path)
+        return (stat.st_size, stat.st_mtime_ns) == (self.m2_size, self.m2_mtime_ns)
+
+    def __len__(self) -> int:
+        return len(self.block_source)
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id == NONE_ID:
+            return None
+        value = self._string_cache.get(string_id)
+        if value is None:
+            start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+            value = self._string_cache[string_id] = bytes(self.string_data[start:end]).decode("utf-8")
+        return value
+
+    def source(self, i: int) -> str:
+        return self.string(self.block_source[i])
+
+    def analysis(self, i: int) -> "Analysis":
+        """第i个句子块原始句的 [[(词, UPOS, 词元), ...], ...]"""
+        string = self.string
+        sents = []
+        for j in range(self.block_sents[i], self.block_sents[i + 1]):
+            start, end = self.sent_tokens[j], self.sent_tokens[j + 1]
+            sents.append([(string(self.token_text[k]), string(self.token_upos[k]), string(self.token_lemma[k]))
+                          for k in range(start, end)])
+        return sents
+
+    def tokens(self, i: int, sentence: Optional[int] = None) -> List[str]:
+        """第i个句子块原始句的词形（sentence为None时拼接全部子句）"""
+        first, stop = self.block_sents[i], self.block_sents[i + 1]
+        if sentence is not None:
+            if first + sentence >= stop:
+                return []
+            first, stop = first + sentence, first + sentence + 1
+        start, end = self.sent_tokens[first], self.sent_tokens[stop]
+        return [self.string(self.token_text[k]) for k in range(start, end)]
+
+    def edits(self, i: int) -> List[Edit]:
+        string = self.string
+        edits = []
+        for k in range(self.block_edits[i], self.block_edits[i + 1]):
+            extra = tuple(string(self.extras[x]) for x in range(self.edit_extras[k], self.edit_extras[k + 1]))
+            edits.append(Edit(string(self.edit_span[k]), string(self.edit_cat[k]), string(self.edit_cor[k]), extra))
+        return edits
+
+    def features(self, i: int) -> List[Optional[dict]]:
+        """
+        第i个句子块各条编辑的对齐特征（与edits(i)一一对应，未保存特征的编辑为None）
+        特征为classify_edit的输入 {"o_start", "o_end", "c_start", "c_end", "orig_toks", "cor_toks"}，词为token_store.Word
+        """
+        string = self.string
+        features = []
+        for k in range(self.block_edits[i], self.block_edits[i + 1]):
+            c_start = self.edit_c_start[k]
+            if c_start < 0:
+                features.append(None)
+                continue
+            o_start, o_end = self.edit_start[k], self.edit_end[k]
+            first, stop = self.edit_feats[k], self.edit_feats[k + 1]
+            split = first + self.edit_feat_split[k]
+            words = [(string(self.feat_text[x]), string(self.feat_upos[x]), string(self.feat_lemma[x]))
+                     for x in range(first, stop)]
+            orig_toks = [Word(o_start + n + 1, *word) for n, word in enumerate(words[:split - first])]
+            cor_toks = [Word(c_start + n + 1, *word) for n, word in enumerate(words[split - first:])]
+            features.append({
+                "o_start": o_start,
+                "o_end": o_end,
+                "c_start": c_start,
+                "c_end": c_start + len(cor_toks),
+                "orig_toks": orig_toks,
+                "cor_toks": cor_toks,
+            })
+        return features
+
+    def block(self, i: int) -> M2Block:
+        return M2Block(self.source(i), self.edits(i), i)
+
+    def __iter__(self) -> Iterator[M2Block]:
+        for i in range(len(self)):
+            yield self.block(i)
+
+    def count_categories(self, skip_noop: bool = True) -> Counter:
+        """统计编辑类别（M2第2个字段），不解码逐条编辑"""
+        counts = Counter(self.edit_cat)
+        result = Counter()
+        for string_id, count in counts.items():
+            cat = self.string(string_id)
+            if not (skip_noop and cat == "noop"):
+                result[cat] = count
+        return result
+
+    def count_extra_field(self, index: int = 0) -> Counter:
+        """统计编辑其余字段中的第index个（如细粒度文件的第4个字段），没有该字段的编辑不计"""
+        ids = Counter()
+        bounds = self.edit_extras
+        for k in range(len(self.edit_cat)):
+            pos = bounds[k] + index
+            if pos < bounds[k + 1]:
+                ids[self.extras[pos]] += 1
+        return Counter({self.string(string_id): count for string_id, count in ids.items()})
+
+    def close(self):
+        # 先释放派生视图，再释放底层视图，最后才能关闭mmap
+        for view in reversed(self._views):
+            view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def to_analysis(tokenized) -> Optional["Analysis"]:
+    """把分词对象（含.sentences/.words）转换为 [[(词, UPOS, 词元), ...], ...]"""
+    if tokenized is None:
+        return None
+    return [[(word.text, word.pos, word.lemma) for word in sent.words] for sent in tokenized.sentences]
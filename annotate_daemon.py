@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+from m2_reader import iter_batches, iter_m2_text
+from daemon_client import DEFAULT_ADDRESS, connect, parse_address, request
+import run_annotate
+import run_annotate_zh
+import m2_postprocess
+import zh_postprocess
+from zh_error_classifier import ZHErrorClassifier
+from token_align import TokenAligner
+
+# ===================== 1. 常驻模型 =====================
+class WarmModels:
+    """常驻模型表：首次使用时加载，之后一直保留在内存中供后续请求复用"""
+
+    def __init__(self):
+        self.models = {}
+        # Stanza/torch的Pipeline不是线程安全的，所有模型调用串行执行
+        self.lock = threading.RLock()
+
+    def get(self, key, loader):
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = loader()
+            return self.models[key]
+
+
+def _en_pipeline(models, options):
+    pretokenized = bool(options.get("pretokenized"))
+    return models.get(("en", pretokenized), lambda: run_annotate.init_stanza(pretokenized))
+
+
+def _en_annotator(models, options):
+    if options.get("aligner") == "rapidfuzz":
+        return models.get("en_token_aligner", TokenAligner)
+
+    def load():
+        from jp_errant.annotator import Annotator
+        return Annotator(lang="en")
+    return models.get("en_annotator", load)
+
+
+def _zh_classifier(models, options):
+    pretokenized = bool(options.get("pretokenized"))
+    return models.get(("zh_classifier", pretokenized), lambda: ZHErrorClassifier(pretokenized=pretokenized))
+
+# ===================== 2. 各脚本对应的处理操作 =====================
+# 每个操作接收句子块流，逐批产出 (输出文本, 统计)
+def op_run_annotate(models, blocks, options):
+    nlp = _en_pipeline(models, options)
+    annotator = _en_annotator(models, options)
+    for batch in iter_batches(blocks, run_annotate.BATCH_SIZE):
+        analyses = run_annotate.analyze_blocks(nlp, batch, annotator=annotator)
+        out_lines = []
+        error_count = 0
+        for block in batch:
+            lines, block_errors = run_annotate.annotate_block(nlp, annotator, block, analyses)
+            out_lines.extend(lines)
+            error_count += block_errors
+        yield "".join(out_lines), {"blocks": len(batch), "edits": error_count}
+
+
+def op_run_annotate_zh(models, blocks, options):
+    annotator = models.get("zh_annotator", run_annotate_zh.JPErrantZH)
+    for batch in iter_batches(blocks, zh_postprocess.BATCH_SIZE):
+        out_lines = []
+        for block in batch:
+            out_lines.extend(annotator.annotate_block(block))
+        yield "".join(out_lines), {"blocks": len(batch), "edits": sum(len(block.edits) for block in batch)}
+
+
+def op_m2_postprocess(models, blocks, options):
+    nlp = _en_pipeline(models, options)
+    for batch in iter_batches(blocks, run_annotate.BATCH_SIZE):
+        out_lines = []
+        for block in batch:
+            out_lines.extend(m2_postprocess.postprocess_block(nlp, block))
+        yield "".join(out_lines), {"blocks": len(batch), "edits": sum(len(block.edits) for block in batch)}
+
+
+def op_zh_postprocess(models, blocks, options):
+    classifier = _zh_classifier(models, options)
+    for batch in iter_batches(blocks, zh_postprocess.BATCH_SIZE):
+        out_lines = []
+        for lines in zh_postprocess.postprocess_batch(classifier, batch):
+            out_lines.extend(lines)
+        yield "".join(out_lines), {"blocks": len(batch), "edits": sum(len(block.edits) for block in batch)}
+
+
+OPS = {
+    "run_annotate": op_run_annotate,
+    "run_annotate_zh": op_run_annotate_zh,
+    "m2_postprocess": op_m2_postprocess,
+    "zh_postprocess": op_zh_postprocess,
+}
+
+# ===================== 3. 套接字服务 =====================
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """一个连接上可以连续发送多条请求（按行分隔的JSON）"""
+
+    def reply(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        models = self.server.models
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                op = message.get("op")
+                if op == "ping":
+                    self.reply({"done": True, "loaded": sorted(str(key) for key in models.models)})
+                elif op == "shutdown":
+                    self.reply({"done": True})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                elif op in OPS:
+                    blocks = iter_m2_text(message.get("m2", ""), message.get("first_index", 0))
+                    with models.lock:
+                        for out, stats in OPS[op](models, blocks, message.get("options", {})):
+                            self.reply({"out": out, "stats": stats})
+                    self.reply({"done": True})
+                else:
+                    self.reply({"error": f"未知操作: {op}"})
+            except Exception as e:
+                self.reply({"error": f"{type(e).__name__}: {str(e)}"})
+
+
+class UnixDaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPDaemonServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def preload(models, langs):
+    """启动时预先加载指定语言的全部模型"""
+    if "en" in langs:
+        _en_pipeline(models, {})
+        _en_annotator(models, {})
+    if "zh" in langs:
+        _zh_classifier(models, {})
+        models.get("zh_annotator", run_annotate_zh.JPErrantZH)
+
+
+def serve(address=DEFAULT_ADDRESS, preload_langs=()):
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            # 套接字文件仍有守护进程在监听时拒绝启动；连不上说明是上次异常退出留下的，删除后重建
+            try:
+                connect(address).close()
+            except OSError:
+                os.unlink(addr)
+            else:
+                raise RuntimeError(f"已有守护进程在 {address} 上运行（先执行 shutdown 再启动）")
+        server = UnixDaemonServer(addr, DaemonHandler)
+    else:
+        server = TCPDaemonServer(addr, DaemonHandler)
+    server.models = WarmModels()
+    preload(server.models, preload_langs)
+    print(f"JP-Errant守护进程已启动：{address}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+    print("JP-Errant守护进程已退出")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="常驻标注守护进程：保持en/zh的Stanza模型和分类器常驻内存")
+    parser.add_argument("command", nargs="?", choices=["serve", "ping", "shutdown"], default="serve")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Unix套接字路径或本机 host:port")
+    parser.add_argument("--preload", default="", help="启动时预加载的语言，如 en,zh")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            serve(args.address, [lang for lang in args.preload.split(",") if lang])
+        except (RuntimeError, ValueError) as e:
+            print(f"无法启动守护进程: {e}")
+            sys.exit(1)
+    else:
+        try:
+            print(json.dumps(request({"op": args.command}, args.address), ensure_ascii=False))
+        except (OSError, ValueError) as e:
+            print(f"无法连接守护进程 {args.address}: {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
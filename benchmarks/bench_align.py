@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# 基准脚本位于benchmarks/下，需把仓库根目录加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from m2_reader import apply_edits, iter_m2_blocks
+from token_align import TokenAligner
+import run_annotate
+
+# ===================== 1. 构造句对 =====================
+# 修正句的构造方式与run_annotate --aligner rapidfuzz相同（m2_reader.apply_edits）
+def load_pairs(path, limit=None):
+    """
+    读取 (原始句分词对象, 修正句分词对象, 金标span集合)
+    分词对象用空格分词兜底构造（不加载Stanza），对齐比较只看词形
+    """
+    pairs = []
+    for block in iter_m2_blocks(path):
+        edits = block.by_annotator().get(0, [])
+        tokens = block.source.split()
+        cor_tokens = apply_edits(tokens, edits)
+        if not tokens or not cor_tokens:
+            continue
+        gold = {(edit.start, edit.end) for edit in edits if edit.cat != "noop"}
+        pairs.append((run_annotate.tokenize_sent(None, block.source),
+                      run_annotate.tokenize_sent(None, " ".join(cor_tokens)), gold))
+        if limit and len(pairs) >= limit:
+            break
+    return pairs
+
+# ===================== 2. 计时与span准确率 =====================
+def run_backend(name, edits_fn, pairs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [edits_fn(orig, cor) for orig, cor, _ in pairs]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    predicted = gold_total = matched = 0
+    for edits, (_, _, gold) in zip(results, pairs):
+        spans = {(edit["o_start"], edit["o_end"]) for edit in edits}
+        predicted += len(spans)
+        gold_total += len(gold)
+        matched += len(spans & gold)
+    return {
+        "backend": name,
+        "pairs": len(pairs),
+        "seconds": round(best, 4),
+        "pairs_per_sec": round(len(pairs) / best, 1) if best else None,
+        "edits": predicted,
+        "gold_edits": gold_total,
+        "span_precision": round(matched / predicted, 4) if predicted else 0.0,
+        "span_recall": round(matched / gold_total, 4) if gold_total else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比annotator.align逐位置比较与rapidfuzz词级对齐的速度和span准确率")
+    parser.add_argument("--input", default="A.dev.gold.bea19.m2", help="带金标编辑的M2文件")
+    parser.add_argument("--limit", type=int, help="最多使用的句对数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次）")
+    parser.add_argument("--json", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.input, args.limit)
+    print(f"句对数：{len(pairs)}（{args.input}）")
+
+    reports = []
+    try:
+        from jp_errant.annotator import Annotator
+        annotator = Annotator(lang="en")
+    except Exception as e:
+        print(f"JP-Errant不可用，跳过annotator.align基线: {e}")
+    else:
+        reports.append(run_backend("jp_errant", lambda o, c: run_annotate.positional_edits(annotator, o, c),
+                                   pairs, args.repeat))
+    aligner = TokenAligner()
+    reports.append(run_backend("rapidfuzz", aligner.edits, pairs, args.repeat))
+
+    print(f"{'后端':<12} {'耗时(秒)':>10} {'句对/秒':>12} {'编辑数':>8} {'span精确率':>12} {'span召回率':>12}")
+    for r in reports:
+        print(f"{r['backend']:<12} {r['seconds']:>10.4f} {r['pairs_per_sec']:>12} {r['edits']:>8} "
+              f"{r['span_precision']:>12.4f} {r['span_recall']:>12.4f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
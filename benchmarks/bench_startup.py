@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+
+# 基准脚本位于benchmarks/下，需把仓库根目录加入导入路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cli import COMMANDS
+
+# ===================== 1. 配置 =====================
+# 不加载模型的子命令不得导入的重型模块（导入任意一个都说明某处把惰性导入改回了模块级导入）
+HEAVY_MODULES = ("stanza", "torch", "jp_errant", "rapidfuzz", "numpy", "pypinyin",
+                 "sqlite3", "multiprocessing", "concurrent.futures")
+# 子命令本身就需要的模块（不计为违规导入；这些子命令的启动耗时以导入它们为下限，不检查启动耗时上限）
+REQUIRED_MODULES = {"score": ("numpy",)}
+# 实际运行的统计/对比命令（路径相对仓库根目录）
+RUNS = [
+    ("stat", ["annotated_fine.m2"]),
+    ("compare", ["--coarse-m2", "annotated_coarse.m2", "--fine-m2", "annotated_fine.m2"]),
+    ("score", ["-hyp", "A_annotated.m2", "-ref", "A.train.gold.bea19.m2"]),
+]
+# 不加载模型的子命令的启动耗时上限（毫秒，取中位数）；超过时以退出码1结束
+STARTUP_BUDGET_MS = 100.0
+
+# ===================== 2. 测量 =====================
+def time_command(argv, repeat):
+    """在全新解释器中运行 python cli.py <argv>，返回每次的墙钟毫秒数"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "cli.py")] + argv, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def imported_heavy(module):
+    """在全新解释器中导入子命令模块，返回被一并导入的重型模块"""
+    code = (f"import sys, {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各子命令的启动耗时（cli.py <子命令> --help）、统计/对比命令的端到端耗时，以及重型模块导入检查")
+    parser.add_argument("--repeat", type=int, default=10, help="每项重复次数（报告最小值和中位数）")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help="不加载模型的子命令的启动耗时上限（毫秒）")
+    parser.add_argument("--json", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    results = []
+    baseline = time_command(["--help"], args.repeat)
+    results.append({"name": "cli.py --help", "min_ms": min(baseline), "median_ms": median(baseline),
+                    "needs_model": False, "heavy": []})
+    for command, (module, needs_model, _) in COMMANDS.items():
+        times = time_command([command, "--help"], args.repeat)
+        results.append({"name": f"{command} --help", "min_ms": min(times), "median_ms": median(times),
+                        "needs_model": needs_model, "budget": command not in REQUIRED_MODULES,
+                        "heavy": [m for m in imported_heavy(module) if m not in REQUIRED_MODULES.get(command, ())]})
+    for command, inputs in RUNS:
+        times = time_command([command] + inputs, args.repeat)
+        results.append({"name": f"{command} {' '.join(inputs)}", "min_ms": min(times), "median_ms": median(times),
+                        "needs_model": False, "heavy": []})
+
+    failures = []
+    print(f"{'命令':<50} {'最小(毫秒)':>10} {'中位数(毫秒)':>12}  导入的重型模块")
+    for r in results:
+        print(f"{r['name']:<50} {r['min_ms']:>10.1f} {r['median_ms']:>12.1f}  {','.join(r['heavy']) or '-'}")
+        if r["needs_model"]:
+            continue
+        if r["heavy"]:
+            failures.append(f"{r['name']} 导入了 {','.join(r['heavy'])}")
+        if r.get("budget") and r["median_ms"] > args.budget_ms:
+            failures.append(f"{r['name']} 启动耗时 {r['median_ms']:.1f}ms 超过 {args.budget_ms:.0f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    for failure in failures:
+        print(f"检查失败：{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+# 基准脚本位于benchmarks/下，需把仓库根目录加入导入路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ===================== 1. 基准用例 =====================
+# 默认语料（均随仓库提供，路径相对仓库根目录）
+EN_INPUT = "A.dev.gold.bea19.m2"
+ZH_INPUT = "zh.train.auto.m2"
+EN_COARSE = "annotated_coarse.m2"
+EN_FINE = "annotated_fine.m2"
+ZH_ANNOTATED = "zh_annotated.m2"
+# m2_scorer的系统输出与参考答案
+SCORE_HYP = "A_annotated.m2"
+SCORE_REF = "A.train.gold.bea19.m2"
+# 子进程结果行的前缀（子进程中模型加载等输出混在stdout里）
+RESULT_MARKER = "@@BENCH@@"
+
+# (用例名, 入口, 输入, 选项, 输出必须与之逐字节一致的基线用例)
+# 基线为None的用例不做一致性检查（如降级分词、rapidfuzz对齐本来就会改变输出）
+CASES = [
+    ("run_annotate", "run_annotate", "en", {}, None),
+    ("run_annotate:batch1", "run_annotate", "en", {"batch_size": 1}, "run_annotate"),
+    ("run_annotate:pipeline", "run_annotate", "en", {"pipeline": True}, "run_annotate"),
+    ("run_annotate:dedup", "run_annotate", "en", {"dedup": True}, "run_annotate"),
+    ("run_annotate:sidecar", "run_annotate", "en", {"sidecar": True}, "run_annotate"),
+    ("run_annotate:workers2", "run_annotate", "en", {"workers": 2}, "run_annotate"),
+    ("run_annotate:no-stanza", "run_annotate", "en", {"no_stanza": True}, None),
+    ("run_annotate:rapidfuzz", "run_annotate", "en", {"aligner": "rapidfuzz"}, None),
+    ("run_annotate_zh", "run_annotate_zh", "zh", {}, None),
+    ("run_annotate_zh:pipeline", "run_annotate_zh", "zh", {"pipeline": True}, "run_annotate_zh"),
+    ("run_annotate_zh:no-stanza", "run_annotate_zh", "zh", {"no_stanza": True}, None),
+    ("m2_postprocess", "m2_postprocess", "coarse", {}, None),
+    ("m2_postprocess:dedup", "m2_postprocess", "coarse", {"dedup": True}, "m2_postprocess"),
+    ("m2_postprocess:no-stanza", "m2_postprocess", "coarse", {"no_stanza": True}, None),
+    ("zh_postprocess", "zh_postprocess", "zh_annotated", {}, None),
+    ("zh_postprocess:batch1", "zh_postprocess", "zh_annotated", {"batch_size": 1}, "zh_postprocess"),
+    ("zh_postprocess:pretokenized", "zh_postprocess", "zh_annotated", {"pretokenized": True}, None),
+    ("compare", "compare", "coarse+fine", {}, None),
+    ("stat_fine_types", "stat_fine_types", "fine", {}, None),
+    ("m2_scorer", "m2_scorer", "hyp+ref", {}, None),
+    ("m2_scorer:jobs4", "m2_scorer", "hyp+ref", {"jobs": 4}, "m2_scorer"),
+]
+
+# ===================== 2. 子进程：运行单个用例 =====================
+# 每个用例在全新的解释器中运行，峰值内存只反映该用例本身
+def _run_annotate(inputs, output, opts):
+    import run_annotate
+    from token_align import TokenAligner
+    run_annotate.INPUT_FILE, run_annotate.OUTPUT_FILE = inputs[0], output
+    nlp = None if opts.get("no_stanza") else run_annotate.init_stanza(opts.get("pretokenized", False))
+    if opts.get("aligner") == "rapidfuzz":
+        annotator = TokenAligner()
+    else:
+        from jp_errant.annotator import Annotator
+        annotator = Annotator(lang="en")
+    batch_size = opts.get("batch_size", run_annotate.BATCH_SIZE)
+    if opts.get("workers", 1) > 1:
+        run_annotate.process_m2_file_parallel(nlp, annotator, opts["workers"], batch_size=batch_size)
+    else:
+        run_annotate.process_m2_file(nlp, annotator, batch_size=batch_size, pipeline=opts.get("pipeline", False),
+                                     dedup=opts.get("dedup", False), sidecar=opts.get("sidecar", False))
+
+
+def _run_annotate_zh(inputs, output, opts):
+    import run_annotate_zh
+    run_annotate_zh.INPUT_FILE, run_annotate_zh.OUTPUT_FILE = inputs[0], output
+    annotator = run_annotate_zh.JPErrantZH()
+    if opts.get("no_stanza"):
+        annotator.nlp = None
+    if annotator.run(pipeline=opts.get("pipeline", False)) != 0:
+        raise RuntimeError("run_annotate_zh运行失败")
+
+
+def _m2_postprocess(inputs, output, opts):
+    import m2_postprocess
+    if opts.get("no_stanza"):
+        m2_postprocess.init_stanza = lambda pretokenized=False: None
+    m2_postprocess.postprocess_m2(inputs[0], output, opts.get("pretokenized", False), dedup=opts.get("dedup", False))
+
+
+def _zh_postprocess(inputs, output, opts):
+    import zh_postprocess
+    zh_postprocess.postprocess_m2(inputs[0], output, pretokenized=opts.get("pretokenized", False),
+                                  batch_size=opts.get("batch_size", zh_postprocess.BATCH_SIZE))
+
+
+def _compare(inputs, output, opts):
+    from compare import SimpleGranularityComparer
+    comparer = SimpleGranularityComparer()
+    comparer.analyze_coarse(inputs[0])
+    comparer.analyze_fine(inputs[1])
+    comparer.generate_compare_report(output_path=output)
+
+
+def _stat_fine_types(inputs, output, opts):
+    import io
+    from stat_fine_types import stat_fine_error_types
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        stat_fine_error_types(inputs[0])
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(buf.getvalue())
+
+
+def _m2_scorer(inputs, output, opts):
+    from m2_scorer import format_results, score
+    result = score(inputs[0], inputs[1], jobs=opts.get("jobs", 1))
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(format_results(result, cat_level=3))
+
+
+ENTRY_POINTS = {
+    "run_annotate": _run_annotate,
+    "run_annotate_zh": _run_annotate_zh,
+    "m2_postprocess": _m2_postprocess,
+    "zh_postprocess": _zh_postprocess,
+    "compare": _compare,
+    "stat_fine_types": _stat_fine_types,
+    "m2_scorer": _m2_scorer,
+}
+
+
+def peak_rss_kb(who) -> int:
+    """getrusage的ru_maxrss：Linux上为KB，macOS上为字节"""
+    import resource
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_child(spec):
+    """子进程入口：计时运行一个用例，结果以一行JSON写到stdout"""
+    import resource
+    from profiling import PROFILER
+    os.chdir(ROOT)
+    sys.path.append(os.path.join(ROOT, "jp_errant"))
+    PROFILER.enable(keep_samples=True)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ENTRY_POINTS[spec["entry"]](spec["inputs"], spec["output"], spec["options"])
+    seconds = time.perf_counter() - start
+    report = PROFILER.report(spec["name"])
+    print(RESULT_MARKER + json.dumps({
+        "seconds": seconds,
+        "stages": report["stages"],
+        "peak_rss_kb": peak_rss_kb(resource.RUSAGE_SELF),
+        "children_peak_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN),
+    }, ensure_ascii=False))
+
+# ===================== 3. 父进程：调度、汇总与一致性检查 =====================
+def md5_file(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def count_prefix(path, prefix):
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.startswith(prefix))
+
+
+def case_inputs(kind, args):
+    return {
+        "en": [args.en_input],
+        "zh": [args.zh_input],
+        "coarse": [args.coarse],
+        "fine": [args.fine],
+        "coarse+fine": [args.coarse, args.fine],
+        "zh_annotated": [args.zh_annotated],
+        "hyp+ref": [args.score_hyp, args.score_ref],
+    }[kind]
+
+
+def run_case(name, entry, inputs, options, out_dir, repeat):
+    """重复运行repeat次，取最快一次的计时；输出文件取最后一次"""
+    output = os.path.join(out_dir, name.replace(":", "_") + (".txt" if entry in ("compare", "stat_fine_types", "m2_scorer") else ".m2"))
+    spec = {"name": name, "entry": entry, "inputs": inputs, "output": output, "options": options}
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec)],
+                              cwd=ROOT, capture_output=True, text=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+        if proc.returncode != 0 or not lines:
+            return {"name": name, "error": (proc.stderr.strip().splitlines() or ["未知错误"])[-1]}
+        result = json.loads(lines[-1][len(RESULT_MARKER):])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    sentences = count_prefix(os.path.join(ROOT, inputs[0]), b"S ")
+    best.update({
+        "name": name,
+        "entry": entry,
+        "inputs": inputs,
+        "options": options,
+        "output": output,
+        "md5": md5_file(output),
+        "sentences": sentences,
+        "sentences_per_sec": round(sentences / best["seconds"], 1) if best["seconds"] else None,
+    })
+    if output.endswith(".m2"):
+        best["edits"] = count_prefix(output, b"A ")
+    return best
+
+
+def check_gates(results, baselines):
+    """优化模式的输出必须与基线逐字节一致；返回失败信息列表（基线未运行也算失败，不静默跳过）"""
+    by_name = {r["name"]: r for r in results}
+    failures = []
+    for r in results:
+        base = baselines.get(r["name"])
+        if base is None or "error" in r:
+            continue
+        if base not in by_name:
+            failures.append(f"{r['name']} 的基线 {base} 未运行")
+            continue
+        if "error" in by_name[base]:
+            # 基线本身运行失败，已计入运行失败
+            continue
+        r["gate"] = base
+        r["identical"] = r["md5"] == by_name[base]["md5"]
+        if not r["identical"]:
+            failures.append(f"{r['name']} 的输出与 {base} 不一致")
+    return failures
+
+
+def check_against(results, saved_path):
+    """与此前保存的结果比较：同名用例的输出必须一致（防止标注悄悄漂移），并给出速度变化"""
+    with open(saved_path, "r", encoding="utf-8") as f:
+        saved = {r["name"]: r for r in json.load(f)["results"] if "error" not in r}
+    failures = []
+    print(f"\n===== 与 {saved_path} 对比 =====")
+    print(f"{'用例':<30} {'之前(秒)':>10} {'现在(秒)':>10} {'加速比':>8} {'输出':>6}")
+    for r in results:
+        old = saved.get(r["name"])
+        if old is None or "error" in r:
+            continue
+        same = r["md5"] == old["md5"]
+        if not same:
+            failures.append(f"{r['name']} 的输出与保存的结果不一致")
+        speedup = old["seconds"] / r["seconds"] if r["seconds"] else 0.0
+        print(f"{r['name']:<30} {old['seconds']:>10.3f} {r['seconds']:>10.3f} {speedup:>7.2f}x {'一致' if same else '变化':>6}")
+    return failures
+
+
+def print_report(results):
+    print(f"{'用例':<30} {'耗时(秒)':>10} {'句子/秒':>10} {'峰值内存MB':>12} {'一致性':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:<30} 运行失败: {r['error']}")
+            continue
+        peak = max(r["peak_rss_kb"], r["children_peak_rss_kb"]) / 1024
+        gate = "-" if "gate" not in r else ("通过" if r["identical"] else "不一致")
+        print(f"{r['name']:<30} {r['seconds']:>10.3f} {r['sentences_per_sec'] or 0:>10.1f} {peak:>12.1f} {gate:>8}")
+        for stage, s in sorted(r["stages"].items(), key=lambda x: x[1]["seconds"], reverse=True):
+            if "p50_ms" in s:
+                print(f"    {stage:<12} {s['seconds']:>8.3f}秒  p50 {s['p50_ms']:.3f}ms  "
+                      f"p90 {s['p90_ms']:.3f}ms  p99 {s['p99_ms']:.3f}ms  最大 {s['max_ms']:.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各入口/各模式的吞吐、分阶段延迟分位数、峰值内存，以及输出逐字节一致性检查")
+    parser.add_argument("--cases", nargs="*", default=["*"], help="只运行匹配的用例（通配符，如 'run_annotate*'）")
+    parser.add_argument("--list", action="store_true", help="列出全部用例")
+    parser.add_argument("--en-input", default=EN_INPUT, help="英文标注输入（如A.train.gold.bea19.m2、fce.test.gold.bea19.m2）")
+    parser.add_argument("--zh-input", default=ZH_INPUT, help="中文标注输入")
+    parser.add_argument("--coarse", default=EN_COARSE, help="m2_postprocess/compare的粗粒度输入")
+    parser.add_argument("--fine", default=EN_FINE, help="compare/stat_fine_types的细粒度输入")
+    parser.add_argument("--zh-annotated", default=ZH_ANNOTATED, help="zh_postprocess的输入")
+    parser.add_argument("--score-hyp", default=SCORE_HYP, help="m2_scorer的系统输出")
+    parser.add_argument("--score-ref", default=SCORE_REF, help="m2_scorer的参考答案（如ABCN.dev.gold.bea19.m2）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个用例重复次数（取最快一次）")
+    parser.add_argument("--out-dir", help="输出文件目录（默认临时目录）")
+    parser.add_argument("--json", help="把结果另存为JSON")
+    parser.add_argument("--against", help="与之前--json保存的结果对比（输出必须一致，并给出加速比）")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+    matched = {case[0] for case in CASES if any(fnmatch.fnmatch(case[0], pattern) for pattern in args.cases)}
+    # 选中的优化模式用例自动带上其基线用例，一致性检查才不会被跳过
+    baselines = {case[4] for case in CASES if case[0] in matched and case[4]} - matched
+    selected = [case for case in CASES if case[0] in matched or case[0] in baselines]
+    if args.list:
+        for name, entry, kind, options, base in CASES:
+            print(f"{name:<30} 输入 {'+'.join(case_inputs(kind, args))}  选项 {options}  基线 {base or '-'}")
+        return
+
+    out_dir = args.out_dir or tempfile.mkdtemp(prefix="m2_bench_")
+    os.makedirs(out_dir, exist_ok=True)
+    results = []
+    if baselines:
+        print(f"自动加入基线用例：{' '.join(sorted(baselines))}")
+    for name, entry, kind, options, _ in selected:
+        print(f"运行 {name} ...", flush=True)
+        results.append(run_case(name, entry, case_inputs(kind, args), options, os.path.abspath(out_dir), args.repeat))
+    failures = check_gates(results, {case[0]: case[4] for case in selected})
+    print()
+    print_report(results)
+    if args.against:
+        failures += check_against(results, args.against)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n输出目录：{out_dir}")
+    errors = [r["name"] for r in results if "error" in r]
+    for failure in failures:
+        print(f"一致性检查失败：{failure}")
+    if failures or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
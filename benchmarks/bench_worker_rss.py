@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# 基准脚本位于benchmarks/下，需把仓库根目录加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from m2_reader import iter_m2_blocks
+from worker_pool import fork_pool, memory_kb, set_torch_threads
+import run_annotate
+
+# ===================== 1. 工作进程探针 =====================
+# 进程内状态：Stanza Pipeline与同步屏障
+_state = {}
+
+def _init_forked(barrier):
+    _state["barrier"] = barrier
+
+def _init_naive(barrier, pretokenized, torch_threads):
+    """对照组：每个工作进程各自加载一份Stanza模型"""
+    set_torch_threads(torch_threads)
+    _state["barrier"] = barrier
+    _state["nlp"] = run_annotate.init_stanza(pretokenized)
+
+def _probe(texts):
+    """在工作进程中做一批推理，等所有工作进程都到达后再读取内存占用"""
+    start = time.perf_counter()
+    run_annotate.analyze_batch(_state["nlp"], texts)
+    elapsed = time.perf_counter() - start
+    _state["barrier"].wait(timeout=600)
+    return {"pid": os.getpid(), "seconds": round(elapsed, 3), **memory_kb()}
+
+# ===================== 2. 两种模式的测量 =====================
+def run_mode(mode, workers, texts, pretokenized, torch_threads):
+    ctx = multiprocessing.get_context("fork" if mode == "fork" else "spawn")
+    barrier = ctx.Barrier(workers)
+    if mode == "fork":
+        # 先在父进程加载模型，再fork工作进程
+        _state["nlp"] = run_annotate.init_stanza(pretokenized)
+        pool = fork_pool(workers, initializer=_init_forked, initargs=(barrier,), torch_threads=torch_threads)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_naive,
+                                   initargs=(barrier, pretokenized, torch_threads))
+    with pool:
+        results = list(pool.map(_probe, [texts] * workers))
+    parent = memory_kb()
+    _state.pop("nlp", None)
+    return {
+        "mode": mode,
+        "workers": results,
+        "parent": parent,
+        "total_pss_kb": parent["pss"] + sum(r["pss"] for r in results),
+    }
+
+
+def print_report(report):
+    print(f"\n===== 模式：{report['mode']} =====")
+    print(f"{'PID':<10} {'RSS(MB)':>10} {'PSS(MB)':>10} {'共享(MB)':>10} {'私有(MB)':>10} {'推理(秒)':>10}")
+    for r in report["workers"]:
+        print(f"{r['pid']:<10} {r['rss'] / 1024:>10.1f} {r['pss'] / 1024:>10.1f} "
+              f"{r['shared'] / 1024:>10.1f} {r['private'] / 1024:>10.1f} {r['seconds']:>10.3f}")
+    p = report["parent"]
+    print(f"{'父进程':<8} {p['rss'] / 1024:>10.1f} {p['pss'] / 1024:>10.1f} "
+          f"{p['shared'] / 1024:>10.1f} {p['private'] / 1024:>10.1f}")
+    print(f"合计PSS：{report['total_pss_kb'] / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比“先加载后fork”与“每进程各自加载”两种模式下每个工作进程的内存占用")
+    parser.add_argument("--input", default="A.dev.gold.bea19.m2", help="取样句子的M2文件")
+    parser.add_argument("--workers", type=int, default=4, help="工作进程数")
+    parser.add_argument("--sentences", type=int, default=200, help="每个工作进程推理的句子数")
+    parser.add_argument("--mode", choices=["fork", "naive", "both"], default="both")
+    parser.add_argument("--pretokenized", action="store_true")
+    parser.add_argument("--torch-threads", type=int, default=1, help="每个工作进程的torch线程数")
+    parser.add_argument("--json", help="把结果另存为JSON")
+    args = parser.parse_args()
+
+    texts = []
+    for block in iter_m2_blocks(args.input):
+        texts.append(block.source)
+        if len(texts) >= args.sentences:
+            break
+
+    modes = ["naive", "fork"] if args.mode == "both" else [args.mode]
+    reports = [run_mode(mode, args.workers, texts, args.pretokenized, args.torch_threads) for mode in modes]
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+from typing import Dict, Optional
+
+# ===================== 1. 检查点配置 =====================
+# 检查点文件后缀（位于输出文件旁）
+CHECKPOINT_SUFFIX = ".ckpt.json"
+# 默认每处理多少个句子块写一次检查点
+CHECKPOINT_EVERY = 1000
+
+# ===================== 2. 断点续跑 =====================
+class Checkpoint:
+    """
+    标注任务的断点记录
+    记录最后一个已完整写出的句子块之后的输入字节偏移、输出字节偏移和计数器
+    写入时先fsync输出文件，再原子替换检查点文件，保证检查点指向的输出内容一定已落盘
+    """
+
+    def __init__(self, input_file: str, output_file: str, path: Optional[str] = None,
+                 every: int = CHECKPOINT_EVERY):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.path = path or output_file + CHECKPOINT_SUFFIX
+        self.every = max(1, every)
+        self.state = {
+            "input_offset": 0,    # 下一个待处理句子块在输入文件中的字节偏移
+            "output_offset": 0,   # 输出文件中已完整写出部分的字节数
+            "next_index": 0,      # 下一个待处理句子块的序号
+            "block_count": 0,
+            "error_count": 0,
+        }
+        self._last_saved = 0
+
+    def _input_signature(self) -> Dict:
+        stat = os.stat(self.input_file)
+        return {"input_file": os.path.abspath(self.input_file), "input_size": stat.st_size,
+                "input_mtime": stat.st_mtime}
+
+    def load(self) -> bool:
+        """
+        读取已有检查点
+        :return: 是否找到可用的检查点；输入文件已变化或输出文件短于记录的偏移时抛出ValueError
+        """
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        signature = self._input_signature()
+        if any(saved.get(key) != value for key, value in signature.items()):
+            raise ValueError(f"输入文件已变化，检查点不可用: {self.path}")
+        if not os.path.exists(self.output_file) or os.path.getsize(self.output_file) < saved["output_offset"]:
+            raise ValueError(f"输出文件短于检查点记录的偏移，无法续跑: {self.output_file}")
+        for key in self.state:
+            self.state[key] = saved[key]
+        self._last_saved = self.state["block_count"]
+        return True
+
+    def open_output(self, resume: bool):
+        """
+        打开输出文件
+        续跑时截掉最后一个检查点之后写出的残缺内容并追加写入，否则从头覆盖写入
+        """
+        if resume:
+            with open(self.output_file, "r+b") as f:
+                f.truncate(self.state["output_offset"])
+            return open(self.output_file, "a", encoding="utf-8")
+        return open(self.output_file, "w", encoding="utf-8")
+
+    def update(self, f_out, input_offset: int, next_index: int, block_count: int, error_count: int,
+               force: bool = False):
+        """已完整写出到某个句子块后调用：距上次保存满every个块（或force）时写检查点"""
+        self.state.update(input_offset=input_offset, next_index=next_index,
+                          block_count=block_count, error_count=error_count)
+        if force or block_count - self._last_saved >= self.every:
+            self.save(f_out)
+
+    def save(self, f_out):
+        f_out.flush()
+        os.fsync(f_out.fileno())
+        self.state["output_offset"] = f_out.buffer.tell()
+        record = dict(self.state, saved_at=time.time(), **self._input_signature())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_saved = self.state["block_count"]
+
+    def remove(self):
+        """任务正常结束后删除检查点"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,51 @@
+import sys
+import importlib
+
+# ===================== 1. 子命令表 =====================
+# 子命令 -> (模块名, 是否加载Stanza模型, 说明)
+# 只有实际执行的子命令的模块才会被导入；统计/对比/索引类命令不导入stanza/torch/rapidfuzz/sqlite3/multiprocessing，
+# 启动耗时基本等于解释器本身（见benchmarks/bench_startup.py）
+COMMANDS = {
+    "annotate": ("run_annotate", True, "英文M2文件错误标注（JP-Errant对齐 + 规则分类）"),
+    "annotate-zh": ("run_annotate_zh", True, "中文M2文件错误标注"),
+    "postprocess": ("m2_postprocess", True, "英文粗粒度M2 -> 细粒度M2"),
+    "postprocess-zh": ("zh_postprocess", True, "中文M2细粒度后处理"),
+    "reclassify": ("reclassify", False, "规则修改后只重跑分类层（读取预分析旁路文件）"),
+    "compare": ("compare", False, "粗/细粒度M2标注对比报告"),
+    "stat": ("stat_fine_types", False, "细粒度错误类型分布统计"),
+    "score": ("m2_scorer", False, "系统输出对参考答案的P/R/F0.5评分（总体及按类别）"),
+    "index": ("m2_index", False, "M2块偏移索引：随机访问、切片与分片规划"),
+    "daemon": ("annotate_daemon", True, "常驻标注守护进程（模型只加载一次）"),
+}
+PROG = "cli.py"
+
+# ===================== 2. 分发 =====================
+def usage() -> str:
+    width = max(map(len, COMMANDS))
+    lines = [f"用法：python {PROG} <子命令> [参数...]    （python {PROG} <子命令> -h 查看子命令参数）", "", "子命令："]
+    for name, (_, needs_model, description) in COMMANDS.items():
+        lines.append(f"  {name:<{width}}  {description}{'' if needs_model else '（不加载模型）'}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    手工解析第一个参数再导入对应模块（不用argparse子解析器：那样需要预先导入所有子命令模块来注册参数）
+    其余参数原样交给该模块的main(argv)
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"未知子命令：{command}\n", file=sys.stderr)
+        print(usage(), file=sys.stderr)
+        sys.exit(2)
+    # 子命令的argparse用sys.argv[0]生成用法提示
+    sys.argv[0] = f"{PROG} {command}"
+    importlib.import_module(COMMANDS[command][0]).main(rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
+import os
 import argparse
+from array import array
 from collections import defaultdict, Counter
+from itertools import zip_longest
 import re
+from typing import Iterator, List, Tuple
+from m2_reader import Edit, iter_m2_blocks
+from analyzed_corpus import AnalyzedCorpus
+
+# 混淆矩阵中"无对应编辑"的行/列名（第0行/第0列）
+NO_MATCH = "(无对应)"
+# 混淆矩阵的初始行/列容量（类别数超过时翻倍扩容）
+INITIAL_CAPACITY = 32
+# 报告中每个粗类别列出的细类别数
+TOP_CELLS = 5
 
 class SimpleGranularityComparer:
     def __init__(self):
@@ -22,26 +35,26 @@ class SimpleGranularityComparer:
         self.fine_to_coarse = defaultdict(str)
 
     def parse_m2_edits(self, m2_path):
-        """解析M2文件，提取所有错误编辑的类别"""
-        edits = []
-        with open(m2_path, "r", encoding="utf-8") as f:
-            blocks = f.read().strip().split("\n\n")
-            for block in blocks:
-                lines = block.strip().split("\n")
-                for line in lines[1:]:  # 跳过S行，只处理A行
-                    if line.startswith("A "):
-                        parts = line[2:].split("|||")
-                        if len(parts) >= 2:
-                            cat = parts[1].strip()
-                            if cat != "noop":  # 跳过无错误标注
-                                edits.append(cat)
-        return edits
+        """流式解析M2文件，统计所有错误编辑的类别数量（不保留逐条编辑）；存在未过期的预分析旁路文件时直接读取"""
+        corpus = AnalyzedCorpus.open_for(m2_path)
+        if corpus is not None:
+            with corpus:
+                return corpus.count_categories()
+        cat_count = Counter()
+        for block in iter_m2_blocks(m2_path):
+            for edit in block.edits:
+                if edit.cat != "noop":  # 跳过无错误标注
+                    cat_count[edit.cat] += 1
+        return cat_count
 
     def analyze_coarse(self, coarse_m2):
         """分析粗粒度标注文件"""
-        edits = self.parse_m2_edits(coarse_m2)
-        self.stats["coarse"]["total_edits"] = len(edits)
-        self.stats["coarse"]["cat_count"] = Counter(edits)
+        self.set_coarse_counts(self.parse_m2_edits(coarse_m2))
+
+    def set_coarse_counts(self, cat_count):
+        """载入粗粒度类别计数（如来自联接得到的混淆矩阵行合计）"""
+        self.stats["coarse"]["total_edits"] = sum(cat_count.values())
+        self.stats["coarse"]["cat_count"] = cat_count
         
         # 计算OTHER类占比
         other_count = self.stats["coarse"]["cat_count"].get("OTHER", 0)
@@ -52,9 +65,12 @@ class SimpleGranularityComparer:
 
     def analyze_fine(self, fine_m2):
         """分析细粒度标注文件，并归并到粗粒度类别"""
-        edits = self.parse_m2_edits(fine_m2)
-        self.stats["fine"]["total_edits"] = len(edits)
-        self.stats["fine"]["cat_count"] = Counter(edits)
+        self.set_fine_counts(self.parse_m2_edits(fine_m2))
+
+    def set_fine_counts(self, cat_count):
+        """载入细粒度类别计数（如来自联接得到的混淆矩阵列合计），并归并到粗粒度类别"""
+        self.stats["fine"]["total_edits"] = sum(cat_count.values())
+        self.stats["fine"]["cat_count"] = cat_count
         
         # 1. 计算细粒度OTHER类占比
         other_count = self.stats["fine"]["cat_count"].get("OTHER", 0)
@@ -74,8 +90,12 @@ class SimpleGranularityComparer:
                 self.fine_to_coarse[fine_cat] = fine_cat
                 self.stats["fine"]["parent_cat_count"][fine_cat] += count
 
-    def generate_compare_report(self, output_path=None):
-        """生成对比报告"""
+    def generate_compare_report(self, output_path=None, extra_lines=(), quiet=False):
+        """
+        生成对比报告
+        :param extra_lines: 追加在报告末尾的内容（如编辑级联接的混淆矩阵）
+        :param quiet: 只写文件不打印（多文件对比时）
+        """
         report = []
         report.append("="*80)
         report.append(" 粗/细粒度标注文件对比报告")
@@ -129,35 +149,306 @@ class SimpleGranularityComparer:
         fine_cats_with_sub = [c for c in self.stats["fine"]["cat_count"].keys() if ":" in c]
         sub_coverage = len(fine_cats_with_sub) / len(self.stats["fine"]["cat_count"]) * 100 if self.stats["fine"]["cat_count"] else 0.0
         report.append(f" 细粒度标注细分覆盖率：{sub_coverage:.2f}%（{len(fine_cats_with_sub)}/{len(self.stats['fine']['cat_count'])}）")
+        report.extend(extra_lines)
 
         # 拼接并打印报告
         report_str = "\n".join(report)
-        print(report_str)
+        if not quiet:
+            print(report_str)
 
         # 保存报告
         if output_path:
             with open(output_path, "w", encoding="utf-8") as f:
                 f.write(report_str)
-            print(f"\n 对比报告已保存至：{output_path}")
+            if not quiet:
+                print(f"\n 对比报告已保存至：{output_path}")
 
-def main():
-    parser = argparse.ArgumentParser(description="仅用粗/细粒度标注文件完成对比评估（无人工参考）")
-    parser.add_argument("--coarse-m2", required=True, help="粗粒度标注M2文件路径")
-    parser.add_argument("--fine-m2", required=True, help="细粒度标注M2文件路径")
-    parser.add_argument("--output", help="对比报告输出路径（可选）")
-    args = parser.parse_args()
 
-    # 初始化对比器
+class ConfusionMatrix:
+    """
+    粗→细类别混淆矩阵
+    类别名映射为整数下标，计数按行优先存放在一维array('q')中（不用嵌套dict），类别数超过容量时翻倍扩容
+    第0行/第0列为NO_MATCH：第0列计细粒度文件中找不到对应编辑的粗粒度编辑，第0行反之
+    """
+
+    def __init__(self):
+        self.rows: List[str] = [NO_MATCH]
+        self.cols: List[str] = [NO_MATCH]
+        self.row_index = {NO_MATCH: 0}
+        self.col_index = {NO_MATCH: 0}
+        self.row_cap = self.col_cap = INITIAL_CAPACITY
+        self.counts = array("q", bytes(8 * self.row_cap * self.col_cap))
+
+    def row_id(self, coarse_cat: str) -> int:
+        i = self.row_index.get(coarse_cat)
+        if i is None:
+            i = self.row_index[coarse_cat] = len(self.rows)
+            self.rows.append(coarse_cat)
+            if i >= self.row_cap:
+                self._resize(self.row_cap * 2, self.col_cap)
+        return i
+
+    def col_id(self, fine_cat: str) -> int:
+        i = self.col_index.get(fine_cat)
+        if i is None:
+            i = self.col_index[fine_cat] = len(self.cols)
+            self.cols.append(fine_cat)
+            if i >= self.col_cap:
+                self._resize(self.row_cap, self.col_cap * 2)
+        return i
+
+    def _resize(self, row_cap: int, col_cap: int):
+        counts = array("q", bytes(8 * row_cap * col_cap))
+        width = self.col_cap
+        for r in range(min(len(self.rows), self.row_cap)):
+            counts[r * col_cap:r * col_cap + width] = self.counts[r * width:(r + 1) * width]
+        self.counts, self.row_cap, self.col_cap = counts, row_cap, col_cap
+
+    def add(self, row: int, col: int, n: int = 1):
+        self.counts[row * self.col_cap + col] += n
+
+    def get(self, row: int, col: int) -> int:
+        return self.counts[row * self.col_cap + col]
+
+    def row_totals(self) -> List[int]:
+        width, cap = len(self.cols), self.col_cap
+        return [sum(self.counts[r * cap:r * cap + width]) for r in range(len(self.rows))]
+
+    def col_totals(self) -> List[int]:
+        totals = [0] * len(self.cols)
+        for r in range(len(self.rows)):
+            base = r * self.col_cap
+            for c in range(len(self.cols)):
+                totals[c] += self.counts[base + c]
+        return totals
+
+    def cells(self) -> Iterator[Tuple[str, str, int]]:
+        """非零单元格 (粗类别, 细类别, 条数)"""
+        for r, coarse_cat in enumerate(self.rows):
+            base = r * self.col_cap
+            for c, fine_cat in enumerate(self.cols):
+                count = self.counts[base + c]
+                if count:
+                    yield coarse_cat, fine_cat, count
+
+    def merge(self, other: "ConfusionMatrix"):
+        """按类别名累加另一个矩阵（两者的下标分配可以不同）"""
+        for coarse_cat, fine_cat, count in other.cells():
+            self.add(self.row_id(coarse_cat), self.col_id(fine_cat), count)
+
+    def coarse_counts(self) -> Counter:
+        """各粗类别的编辑数（行合计，不含NO_MATCH行）"""
+        return Counter({cat: total for cat, total in zip(self.rows[1:], self.row_totals()[1:]) if total})
+
+    def fine_counts(self) -> Counter:
+        """各细类别的编辑数（列合计，不含NO_MATCH列）"""
+        return Counter({cat: total for cat, total in zip(self.cols[1:], self.col_totals()[1:]) if total})
+
+    def summary(self) -> dict:
+        """
+        联接结果汇总：匹配上的编辑中类别不变/细分到本类（细类别前缀等于粗类别）/改判到其他类的条数，
+        以及只出现在一侧的编辑数
+        """
+        result = {"matched": 0, "same": 0, "refined": 0, "changed": 0, "coarse_only": 0, "fine_only": 0}
+        for coarse_cat, fine_cat, count in self.cells():
+            if coarse_cat == NO_MATCH:
+                result["fine_only"] += count
+            elif fine_cat == NO_MATCH:
+                result["coarse_only"] += count
+            else:
+                result["matched"] += count
+                if fine_cat == coarse_cat:
+                    result["same"] += count
+                elif fine_cat.split(":")[0] == coarse_cat:
+                    result["refined"] += count
+                else:
+                    result["changed"] += count
+        return result
+
+    def report_lines(self, top: int = TOP_CELLS) -> List[str]:
+        s = self.summary()
+        coarse_total = s["matched"] + s["coarse_only"]
+
+        def pct(n, total):
+            return f"{n / total * 100:.2f}%" if total else "0.00%"
+
+        lines = ["", "【粗→细编辑级联接（按句子块序号、span、修正文本）】",
+                 f"匹配编辑：{s['matched']}（占粗粒度编辑 {pct(s['matched'], coarse_total)}）",
+                 f"仅粗粒度：{s['coarse_only']}    仅细粒度：{s['fine_only']}",
+                 f"类别不变：{s['same']}（{pct(s['same'], s['matched'])}）    "
+                 f"细分到本类：{s['refined']}（{pct(s['refined'], s['matched'])}）    "
+                 f"改判到其他类：{s['changed']}（{pct(s['changed'], s['matched'])}）",
+                 "",
+                 f"{'粗类别':<15} {'编辑数':<8} 主要细类别（条数/占比）",
+                 "-" * 80]
+        row_totals = self.row_totals()
+        for r in sorted(range(1, len(self.rows)), key=lambda r: (-row_totals[r], self.rows[r])):
+            base = r * self.col_cap
+            cells = sorted(((self.counts[base + c], self.cols[c]) for c in range(len(self.cols))
+                            if self.counts[base + c]), key=lambda x: (-x[0], x[1]))
+            shown = ", ".join(f"{fine_cat} {count}/{pct(count, row_totals[r])}" for count, fine_cat in cells[:top])
+            lines.append(f"{self.rows[r]:<15} {row_totals[r]:<8} {shown}")
+        return lines
+
+    def write_tsv(self, path: str):
+        """写出完整矩阵（行为粗类别，列为细类别）"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\t".join(["粗\\细"] + self.cols) + "\n")
+            for r, coarse_cat in enumerate(self.rows):
+                base = r * self.col_cap
+                f.write("\t".join([coarse_cat] + [str(self.counts[base + c]) for c in range(len(self.cols))]) + "\n")
+
+
+def iter_block_edits(m2_path) -> Iterator[Tuple[str, List[Edit]]]:
+    """逐块产出 (源句, 编辑列表)；存在未过期的预分析旁路文件时直接读取，否则流式解析M2"""
+    corpus = AnalyzedCorpus.open_for(m2_path)
+    if corpus is not None:
+        with corpus:
+            for i in range(len(corpus)):
+                yield corpus.source(i), corpus.edits(i)
+        return
+    for block in iter_m2_blocks(m2_path):
+        yield block.source, block.edits
+
+
+def join_pair(coarse_m2, fine_m2) -> dict:
+    """
+    单遍流式联接一对粗/细粒度文件：两个文件按块同步读取，
+    以 (块序号, span, 修正文本) 为键做哈希联接——键含块序号，因此哈希表只需按块建立，内存只与单个句子块有关
+    同一键下有多条编辑（多标注者）时按出现顺序一一配对；noop编辑不参与
+    细粒度文件不保留标注者ID字段，故标注者不在键中
+    :return: {"coarse_m2", "fine_m2", "blocks", "misaligned"（源句不一致的块数）, "matrix"}
+    """
+    matrix = ConfusionMatrix()
+    row_id, col_id, add = matrix.row_id, matrix.col_id, matrix.add
+    blocks = misaligned = 0
+    for (coarse_source, coarse_edits), (fine_source, fine_edits) in zip_longest(
+            iter_block_edits(coarse_m2), iter_block_edits(fine_m2), fillvalue=(None, [])):
+        blocks += 1
+        if coarse_source != fine_source:
+            misaligned += 1
+        table = {}
+        for edit in coarse_edits:
+            if edit.cat != "noop":
+                table.setdefault((edit.span, edit.cor), []).append(row_id(edit.cat))
+        for edit in fine_edits:
+            if edit.cat == "noop":
+                continue
+            rows = table.get((edit.span, edit.cor))
+            add(rows.pop(0) if rows else 0, col_id(edit.cat))
+        for rows in table.values():
+            for row in rows:
+                add(row, 0)
+    return {"coarse_m2": coarse_m2, "fine_m2": fine_m2, "blocks": blocks, "misaligned": misaligned, "matrix": matrix}
+
+
+def _join_pair(pair):
+    return join_pair(*pair)
+
+
+def join_pairs(pairs, jobs=1) -> List[dict]:
+    """联接多对粗/细粒度文件（jobs>1时每对文件交给一个工作进程），结果按输入顺序返回"""
+    jobs = min(jobs, len(pairs))
+    if jobs <= 1:
+        return [join_pair(*pair) for pair in pairs]
+    # 只在多进程时导入（multiprocessing拖慢单文件对比的启动）
+    from worker_pool import fork_pool
+    with fork_pool(jobs, torch_threads=1) as pool:
+        return list(pool.map(_join_pair, pairs))
+
+
+def pair_comparer(result) -> SimpleGranularityComparer:
+    """用联接结果的行/列合计填充类别统计（与分别解析两个文件得到的计数相同）"""
     comparer = SimpleGranularityComparer()
+    comparer.set_coarse_counts(result["matrix"].coarse_counts())
+    comparer.set_fine_counts(result["matrix"].fine_counts())
+    return comparer
+
+
+def read_pairs_file(path) -> List[Tuple[str, str]]:
+    """每行一对 "粗粒度M2 细粒度M2"（制表符或空白分隔），空行和#开头的行忽略"""
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                coarse_m2, fine_m2 = line.split("\t") if "\t" in line else line.split()
+                pairs.append((coarse_m2.strip(), fine_m2.strip()))
+    return pairs
+
+
+def summary_table(results) -> List[str]:
+    lines = [f"{'细粒度文件':<40} {'粗编辑':>8} {'细编辑':>8} {'匹配率':>8} {'不变':>8} {'细分':>8} {'改判':>8} "
+             f"{'粗OTHER':>8} {'细OTHER':>8}"]
+    for result in results:
+        s = result["matrix"].summary()
+        comparer = pair_comparer(result)
+        coarse_total = s["matched"] + s["coarse_only"]
+        fine_total = s["matched"] + s["fine_only"]
+        rates = [n / d * 100 if d else 0.0 for n, d in ((s["matched"], coarse_total), (s["same"], s["matched"]),
+                                                         (s["refined"], s["matched"]), (s["changed"], s["matched"]))]
+        lines.append(f"{result['fine_m2']:<40} {coarse_total:>8} {fine_total:>8} "
+                     + " ".join(f"{rate:>7.2f}%" for rate in rates)
+                     + f" {comparer.stats['coarse']['other_ratio']:>7.2f}% {comparer.stats['fine']['other_ratio']:>7.2f}%")
+        if result["misaligned"]:
+            lines.append(f"  警告：{result['misaligned']}/{result['blocks']} 个句子块的源句不一致（两个文件可能不是同一语料）")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="仅用粗/细粒度标注文件完成对比评估（无人工参考）")
+    parser.add_argument("--coarse-m2", help="粗粒度标注M2文件路径")
+    parser.add_argument("--fine-m2", help="细粒度标注M2文件路径")
+    parser.add_argument("--output", help="对比报告输出路径（可选，单对文件时）")
+    parser.add_argument("--pair", nargs=2, action="append", default=[], metavar=("COARSE_M2", "FINE_M2"),
+                        help="再对比一对文件（可重复）")
+    parser.add_argument("--pairs-file", help="文件对列表：每行 \"粗粒度M2 细粒度M2\"")
+    parser.add_argument("--jobs", type=int, default=1, help="并行联接的进程数（每对文件一个任务）")
+    parser.add_argument("--matrix", metavar="FILE.tsv", help="写出完整的粗→细混淆矩阵（单对文件时）")
+    parser.add_argument("--output-dir", help="多对文件时每对的报告/混淆矩阵及汇总表的输出目录")
+    args = parser.parse_args(argv)
+
+    pairs = [tuple(pair) for pair in args.pair]
+    if args.pairs_file:
+        pairs = read_pairs_file(args.pairs_file) + pairs
+    if args.coarse_m2 or args.fine_m2:
+        if not (args.coarse_m2 and args.fine_m2):
+            parser.error("--coarse-m2 与 --fine-m2 需同时给出")
+        pairs.insert(0, (args.coarse_m2, args.fine_m2))
+    if not pairs:
+        parser.error("请给出 --coarse-m2/--fine-m2、--pair 或 --pairs-file")
+
+    # 单遍联接粗/细粒度文件（类别统计取自混淆矩阵的行/列合计）
+    print(f" 联接 {len(pairs)} 对粗/细粒度标注文件...")
+    results = join_pairs(pairs, args.jobs)
 
-    # 分析粗/细粒度文件
-    print(" 解析粗粒度标注文件...")
-    comparer.analyze_coarse(args.coarse_m2)
-    print(" 解析细粒度标注文件...")
-    comparer.analyze_fine(args.fine_m2)
+    if len(pairs) == 1:
+        result = results[0]
+        if result["misaligned"]:
+            print(f" 警告：{result['misaligned']}/{result['blocks']} 个句子块的源句不一致（两个文件可能不是同一语料）")
+        pair_comparer(result).generate_compare_report(output_path=args.output,
+                                                      extra_lines=result["matrix"].report_lines())
+        if args.matrix:
+            result["matrix"].write_tsv(args.matrix)
+            print(f" 混淆矩阵已保存至：{args.matrix}")
+        return
 
-    # 生成对比报告
-    comparer.generate_compare_report(output_path=args.output)
+    # 多对文件：打印汇总表，每对的完整报告和混淆矩阵写入输出目录
+    table = summary_table(results)
+    print("\n".join(table))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        total = ConfusionMatrix()
+        for k, result in enumerate(results):
+            pair_comparer(result).generate_compare_report(
+                output_path=os.path.join(args.output_dir, f"report_{k}.txt"),
+                extra_lines=[f"", f"粗粒度文件：{result['coarse_m2']}", f"细粒度文件：{result['fine_m2']}"]
+                + result["matrix"].report_lines(), quiet=True)
+            result["matrix"].write_tsv(os.path.join(args.output_dir, f"matrix_{k}.tsv"))
+            total.merge(result["matrix"])
+        total.write_tsv(os.path.join(args.output_dir, "matrix_total.tsv"))
+        with open(os.path.join(args.output_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(table) + "\n")
+        print(f"\n 各对文件的报告与混淆矩阵已保存至：{args.output_dir}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
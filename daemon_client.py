@@ -0,0 +1,103 @@
+import json
+import socket
+import ipaddress
+from typing import Dict, Iterator, Optional
+
+from m2_reader import iter_batches, iter_m2_blocks
+
+# ===================== 1. 协议配置 =====================
+# 默认的Unix套接字路径（也可用 host:port 形式的本机TCP地址）
+DEFAULT_ADDRESS = "/tmp/jp_errant_daemon.sock"
+# 协议无认证，能连上的人都可以让守护进程对任意输入运行模型推理（占用其CPU/内存），TCP地址只允许回环地址
+LOOPBACK_HOSTS = ("localhost",)
+# 每次请求发送的句子块数
+CHUNK_BLOCKS = 256
+
+# ===================== 2. 连接与收发 =====================
+def parse_address(address: str):
+    """'host:port' 视为TCP地址（只允许本机回环地址），其余视为Unix套接字路径"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit() and "/" not in address:
+        if not is_loopback(host):
+            raise ValueError(f"守护进程只能监听/连接本机回环地址（如127.0.0.1），不接受：{host}")
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def is_loopback(host: str) -> bool:
+    if host in LOOPBACK_HOSTS:
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def connect(address: str = DEFAULT_ADDRESS) -> socket.socket:
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(addr)
+    return sock
+
+
+def send_message(sock: socket.socket, message: Dict):
+    """协议为按行分隔的JSON，一行一条消息"""
+    sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+def iter_responses(rfile) -> Iterator[Dict]:
+    """读取一条请求的全部响应，直到done/error"""
+    for line in rfile:
+        message = json.loads(line)
+        if "error" in message:
+            raise RuntimeError(f"守护进程处理出错: {message['error']}")
+        yield message
+        if message.get("done"):
+            return
+    raise ConnectionError("守护进程提前关闭了连接")
+
+# ===================== 3. 客户端模式 =====================
+def reject_unsupported_options(parser, args, supported=()):
+    """
+    --daemon客户端模式只转发supported中的参数（含位置参数）；其余参数若显式给出（不等于默认值）则报错退出，
+    避免守护进程悄悄忽略它们、产生与本地运行不同的输出
+    """
+    ignored = ["--" + dest.replace("_", "-") for dest, value in vars(args).items()
+               if dest not in ("daemon",) + tuple(supported) and value != parser.get_default(dest)]
+    if ignored:
+        parser.error(f"--daemon 客户端模式不支持以下参数：{' '.join(ignored)}（去掉这些参数，或不加--daemon在本地运行）")
+
+
+def remote_process(op: str, input_file: str, output_file: str, options: Optional[Dict] = None,
+                   address: str = DEFAULT_ADDRESS, chunk_blocks: int = CHUNK_BLOCKS) -> Dict:
+    """
+    把M2文件按句子块分批发给常驻守护进程处理，流式写回输出文件
+    :param op: run_annotate / run_annotate_zh / m2_postprocess / zh_postprocess
+    :return: 汇总统计（句子块数等）
+    """
+    stats = {"blocks": 0}
+    with connect(address) as sock, open(output_file, "w", encoding="utf-8") as f_out:
+        rfile = sock.makefile("r", encoding="utf-8")
+        for chunk in iter_batches(iter_m2_blocks(input_file), chunk_blocks):
+            send_message(sock, {
+                "op": op,
+                "m2": "".join(block.to_text() for block in chunk),
+                "first_index": chunk[0].index,
+                "options": options or {},
+            })
+            for message in iter_responses(rfile):
+                if "out" in message:
+                    f_out.write(message["out"])
+                for key, value in message.get("stats", {}).items():
+                    stats[key] = stats.get(key, 0) + value
+    return stats
+
+
+def request(message: Dict, address: str = DEFAULT_ADDRESS) -> Dict:
+    """发送单条控制请求（ping/shutdown），返回最后一条响应"""
+    with connect(address) as sock:
+        send_message(sock, message)
+        last = {}
+        for last in iter_responses(sock.makefile("r", encoding="utf-8")):
+            pass
+        return last
@@ -0,0 +1,124 @@
+from typing import Dict, Iterable, List, Tuple
+
+# ===================== 1. 规则表（一次性编译） =====================
+# 规则1：冠词错误（ART）- 限定词（DET）+ 冠词词汇
+ART_WORDS = frozenset({"a", "an", "the"})
+# 规则2：介词错误（PREP）- 介词（ADP）+ 介词词汇
+PREP_WORDS = frozenset({"in", "on", "at", "by", "with", "for", "to", "from", "into", "onto"})
+# 规则3：动词错误（VERB）- 动词/助动词（VERB/AUX），及其时态/形式子规则
+VERB_POS = frozenset({"VERB", "AUX"})
+TENSE_WORDS = frozenset({"is", "are", "was", "were", "has", "have", "had"})
+FORM_WORDS = frozenset({"do", "does", "did", "doing", "done", "go", "goes", "went", "gone"})
+# 规则6：按词性匹配其他类型（按顺序取第一个命中的类型）
+POS_RULES = (
+    ("NOUN", ("NOUN",)),
+    ("ADJ", ("ADJ",)),
+    ("ADV", ("ADV",)),
+    ("PRON", ("PRON",)),
+    ("CONJ", ("CCONJ", "SCONJ")),
+    ("NUM", ("NUM",)),
+    ("PUNCT", ("PUNCT",)),
+)
+# 决策缓存上限（超出后整体清空，学习者错误高度重复，很快会重新填满高频项）
+MEMO_MAX_ENTRIES = 500_000
+
+# 决策键：(原始文本, 修正文本, 原始词性, 修正词性, 词元是否变化, 位置是否变化)
+RuleKey = Tuple[str, str, Tuple[str, ...], Tuple[str, ...], bool, bool]
+
+# ===================== 2. 规则引擎 =====================
+class EditRuleEngine:
+    """
+    run_annotate.classify_edit的编译版本
+    词表和词性表只构建一次；规则只依赖编辑的文本/词性/词元变化/位置变化，
+    因此以它们为键缓存分类结果，重复出现的编辑直接查表
+    """
+
+    def __init__(self, memo_max_entries: int = MEMO_MAX_ENTRIES):
+        # 词性 -> 规则6中的优先级（越小越优先）
+        self.pos_rank = {}
+        for rank, (_, pos_list) in enumerate(POS_RULES):
+            for pos in pos_list:
+                self.pos_rank.setdefault(pos, rank)
+        self.pos_types = [err_type for err_type, _ in POS_RULES]
+        self.memo: Dict[RuleKey, str] = {}
+        self.memo_max_entries = memo_max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def edit_key(edit) -> RuleKey:
+        """提取编辑的分类特征（与原classify_edit读取的字段一致）"""
+        orig_toks = edit.get("orig_toks") or []
+        cor_toks = edit.get("cor_toks") or []
+        return (
+            " ".join([tok.text.lower() for tok in orig_toks]),
+            " ".join([tok.text.lower() for tok in cor_toks]),
+            tuple([tok.pos for tok in orig_toks]),
+            tuple([tok.pos for tok in cor_toks]),
+            [tok.lemma.lower() for tok in orig_toks] != [tok.lemma.lower() for tok in cor_toks],
+            edit.get("o_start") != edit.get("c_start"),
+        )
+
+    def decide(self, key: RuleKey) -> str:
+        """按原规则顺序判定错误类型（不经过缓存）"""
+        orig_text, cor_text, orig_pos, cor_pos, lemma_changed, moved = key
+        pos_set = set(orig_pos)
+        pos_set.update(cor_pos)
+
+        # 规则1/2：冠词、介词
+        if (orig_text in ART_WORDS or cor_text in ART_WORDS) and "DET" in pos_set:
+            return "ART"
+        if (orig_text in PREP_WORDS or cor_text in PREP_WORDS) and "ADP" in pos_set:
+            return "PREP"
+
+        # 规则3：动词（时态/形式/通用）
+        if not pos_set.isdisjoint(VERB_POS):
+            if orig_text in TENSE_WORDS or cor_text in TENSE_WORDS:
+                return "VERB:TENSE"
+            if orig_text in FORM_WORDS or cor_text in FORM_WORDS:
+                return "VERB:FORM"
+            return "VERB"
+
+        # 规则4：形态错误 - 词形不同但词性相同
+        if lemma_changed and orig_pos == cor_pos:
+            return "MORPH"
+
+        # 规则5：句法错误 - 位置变化但词汇相同
+        if orig_text == cor_text and moved:
+            return "SYNTAX"
+
+        # 规则6：按词性匹配其他类型
+        ranks = [self.pos_rank[pos] for pos in pos_set if pos in self.pos_rank]
+        if ranks:
+            return self.pos_types[min(ranks)]
+
+        # 规则7：未匹配到的归为OTHER
+        return "OTHER"
+
+    def classify(self, edit) -> str:
+        """分类单条编辑（edit为含orig_toks/cor_toks/o_start/c_start的字典）"""
+        key = self.edit_key(edit)
+        err_type = self.memo.get(key)
+        if err_type is not None:
+            self.hits += 1
+            return err_type
+        self.misses += 1
+        err_type = self.decide(key)
+        if len(self.memo) >= self.memo_max_entries:
+            self.memo.clear()
+        self.memo[key] = err_type
+        return err_type
+
+    def classify_batch(self, edits: Iterable) -> List[str]:
+        """一次分类一批编辑，返回与edits一一对应的错误类型"""
+        classify = self.classify
+        return [classify(edit) for edit in edits]
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return f"分类决策缓存命中 {self.hits}/{total}（{ratio:.2f}%），缓存 {len(self.memo)} 条"
+
+
+# 进程内共享的默认引擎
+DEFAULT_ENGINE = EditRuleEngine()
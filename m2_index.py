@@ -0,0 +1,212 @@
+import os
+import io
+import sys
+import mmap
+import struct
+import random
+import argparse
+from array import array
+from bisect import bisect_left
+from typing import Iterator, List, Optional, Tuple
+
+from m2_reader import M2Block, _iter_blocks
+
+# ===================== 1. 索引文件格式 =====================
+# 索引文件后缀（位于M2文件旁）
+INDEX_SUFFIX = ".idx"
+# 文件头：魔数、M2文件大小、M2文件修改时间（纳秒）、句子块数
+INDEX_MAGIC = b"M2IDX001"
+HEADER = struct.Struct("<8sQQQ")
+# 偏移表为 块数+1 个小端uint64：第i个块占 [offsets[i], offsets[i+1])，最后一项为文件大小
+OFFSET_TYPE = "Q"
+
+# ===================== 2. 建立索引 =====================
+def index_path_for(m2_path: str) -> str:
+    return m2_path + INDEX_SUFFIX
+
+
+def scan_block_offsets(m2_path: str) -> array:
+    """
+    扫描M2文件，返回每个句子块S行的字节偏移，末尾追加文件大小
+    块边界与m2_reader.iter_m2_blocks一致：以S行开始，块之间可以没有空行
+    """
+    offsets = array(OFFSET_TYPE)
+    offset = 0
+    with open(m2_path, "rb") as f:
+        for raw in f:
+            if raw.strip().startswith(b"S "):
+                offsets.append(offset)
+            offset += len(raw)
+    offsets.append(offset)
+    return offsets
+
+
+def build_index(m2_path: str, index_path: Optional[str] = None) -> str:
+    """为M2文件建立块偏移索引（先写临时文件再原子替换），返回索引文件路径"""
+    index_path = index_path or index_path_for(m2_path)
+    stat = os.stat(m2_path)
+    offsets = scan_block_offsets(m2_path)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(offsets) - 1))
+        offsets.tofile(f)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+# ===================== 3. 基于mmap的随机访问 =====================
+class M2Index:
+    """
+    M2文件的块级随机访问
+    索引和M2文件都以mmap方式打开：按序号取块只读取该块所在的字节范围，
+    取第N个块、切片、按字节均分分片都不需要从头线性读取
+    """
+
+    def __init__(self, m2_path: str, index_path: Optional[str] = None):
+        self.m2_path = m2_path
+        self.index_path = index_path or index_path_for(m2_path)
+        with open(self.index_path, "rb") as f:
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, mtime_ns, count = HEADER.unpack_from(self._index_map, 0)
+        if magic != INDEX_MAGIC:
+            self._index_map.close()
+            raise ValueError(f"不是有效的M2索引文件: {self.index_path}")
+        stat = os.stat(m2_path)
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            self._index_map.close()
+            raise ValueError(f"M2文件在建立索引后已被修改: {m2_path}")
+        self.size = size
+        self.count = count
+        if sys.byteorder == "little":
+            self.offsets = memoryview(self._index_map)[HEADER.size:].cast(OFFSET_TYPE)
+        else:
+            self.offsets = array(OFFSET_TYPE, self._index_map[HEADER.size:])
+            self.offsets.byteswap()
+        with open(m2_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @classmethod
+    def open(cls, m2_path: str, rebuild: bool = True) -> "M2Index":
+        """打开M2文件的索引；索引不存在或已过期时（rebuild=True）自动重建"""
+        try:
+            return cls(m2_path)
+        except (OSError, ValueError, struct.error):
+            if not rebuild:
+                raise
+        build_index(m2_path)
+        return cls(m2_path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def block_range(self, i: int) -> Tuple[int, int]:
+        """第i个块的字节范围 [start, end)"""
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(f"句子块序号越界: {i}")
+        return self.offsets[i], self.offsets[i + 1]
+
+    def raw(self, i: int) -> bytes:
+        """第i个块的原始字节"""
+        start, end = self.block_range(i)
+        return self._data[start:end]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self.iter_range(*i.indices(self.count)[:2]))
+        start, end = self.block_range(i)
+        return next(_iter_blocks(io.BytesIO(self._data[start:end]), start, None, i % self.count))
+
+    def iter_range(self, first: int = 0, stop: Optional[int] = None) -> Iterator[M2Block]:
+        """按序号范围 [first, stop) 流式读取句子块（只读取该范围的字节）"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if first >= stop:
+            return
+        start, end = self.offsets[first], self.offsets[stop]
+        yield from _iter_blocks(io.BytesIO(self._data[start:end]), start, None, first)
+
+    def sample(self, k: int, seed: Optional[int] = None) -> List[M2Block]:
+        """不放回随机抽取k个句子块（按原顺序返回）"""
+        picked = sorted(random.Random(seed).sample(range(self.count), min(k, self.count)))
+        return [self[i] for i in picked]
+
+    def plan_shards(self, n: int) -> List[Tuple[int, int, int, int]]:
+        """
+        按字节大小把文件均分为n个块对齐的分片
+        :return: [(起始块序号, 结束块序号, 起始字节偏移, 结束字节偏移), ...]，空分片省略
+        """
+        n = max(1, n)
+        bounds = [0]
+        for k in range(1, n):
+            # 取最接近 k/n 处的块边界
+            target = self.size * k // n
+            j = bisect_left(self.offsets, target, 0, self.count)
+            if j > 0 and target - self.offsets[j - 1] < self.offsets[j] - target:
+                j -= 1
+            bounds.append(max(j, bounds[-1]))
+        bounds.append(self.count)
+        return [(a, b, self.offsets[a], self.offsets[b]) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    def close(self):
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        self._index_map.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """解析 "K/N" 形式的分片编号（K从0开始）"""
+    k, _, n = spec.partition("/")
+    k, n = int(k), int(n)
+    if not 0 <= k < n:
+        raise ValueError(f"分片编号应为K/N且0<=K<N: {spec}")
+    return k, n
+
+# ===================== 4. 命令行 =====================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="M2文件块偏移索引：随机访问、切片与分片规划")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("build", help="建立（或重建）索引文件")
+    p.add_argument("m2_files", nargs="+")
+    p = sub.add_parser("show", help="输出第START到STOP-1个句子块")
+    p.add_argument("m2_file")
+    p.add_argument("start", type=int)
+    p.add_argument("stop", type=int, nargs="?")
+    p = sub.add_parser("sample", help="随机抽取K个句子块")
+    p.add_argument("m2_file")
+    p.add_argument("-k", type=int, default=100)
+    p.add_argument("--seed", type=int)
+    p = sub.add_parser("shards", help="按字节均分为N个块对齐的分片")
+    p.add_argument("m2_file")
+    p.add_argument("-n", type=int, required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for m2_file in args.m2_files:
+            index_path = build_index(m2_file)
+            with M2Index(m2_file, index_path) as index:
+                print(f"{m2_file}: {len(index)} 个句子块 -> {index_path}")
+        return
+
+    with M2Index.open(args.m2_file) as index:
+        if args.command == "show":
+            stop = args.start + 1 if args.stop is None else args.stop
+            sys.stdout.write("".join(block.to_text() for block in index.iter_range(args.start, stop)))
+        elif args.command == "sample":
+            sys.stdout.write("".join(block.to_text() for block in index.sample(args.k, args.seed)))
+        elif args.command == "shards":
+            for k, (first, stop, start, end) in enumerate(index.plan_shards(args.n)):
+                print(f"{k}\t块 {first}-{stop - 1}\t字节 {start}-{end}\t({(end - start) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
 import sys
 import os
-import stanza
+import argparse
+from m2_reader import iter_m2_blocks, parse_edit_line
+from analysis_cache import AnalysisCache, DedupMemo, doc_to_analysis
+from analyzed_corpus import AnalyzedCorpus, AnalyzedCorpusWriter, sidecar_path_for
+from daemon_client import DEFAULT_ADDRESS, reject_unsupported_options, remote_process
+from profiling import PROFILER, add_profile_arguments, profile_session
 
 # ===================== 1. 初始化Stanza（用于分词/词性分析） =====================
-def init_stanza():
+# Stanza处理器组合（与run_annotate一致，两者可共用同一个分析缓存）
+STANZA_PROCESSORS = "tokenize,pos,lemma,mwt"
+
+def init_stanza(pretokenized=False):
+    """pretokenized=True时信任M2 S行的空格分词，跳过tokenize/mwt神经模型"""
     try:
+        import stanza
         nlp = stanza.Pipeline(
             lang="en",
             dir="./stanza_models",
-            processors="tokenize,pos,lemma,mwt",
+            processors="tokenize,pos,lemma" if pretokenized else STANZA_PROCESSORS,
+            tokenize_pretokenized=pretokenized,
             use_gpu=False,
             download_method=None,
             verbose=False,
@@ -20,16 +31,34 @@ def init_stanza():
         return None
 
 # ===================== 2. 分词函数（兼容Stanza/空格分词） =====================
-def tokenize(nlp, text):
+def tokenize(nlp, text, cache=None, dedup=None):
+    analysis = analyze(nlp, text, cache, dedup)
+    if analysis is not None:
+        return [word[0] for word in analysis[0]]
+    return text.split() if text else []
+
+def analyze(nlp, text, cache=None, dedup=None):
+    """返回Stanza分析结果 [[(词, UPOS, 词元), ...], ...]；无模型或分析失败时返回None"""
     if not text:
-        return []
+        return None
     if nlp:
         try:
-            doc = nlp(text)
-            return [word.text for word in doc.sentences[0].words]
+            analysis = dedup.get_many([text]).get(text) if dedup is not None else None
+            if analysis is None and cache is not None:
+                analysis = cache.get(text)
+            if dedup is not None:
+                dedup.record(1, 0 if analysis is not None else 1)
+            if analysis is None:
+                analysis = doc_to_analysis(nlp(text))
+                if cache is not None:
+                    cache.put(text, analysis)
+            if dedup is not None:
+                dedup.put_many({text: analysis})
+            if analysis:
+                return analysis
         except:
             pass
-    return text.split()
+    return None
 
 # ===================== 3. 细粒度错误分类核心逻辑 =====================
 def get_fine_grain_type(coarse_type, orig_text, cor_text):
@@ -66,60 +95,125 @@ def get_fine_grain_type(coarse_type, orig_text, cor_text):
     # 其他类型直接映射
     return fine_map.get(coarse_type, fine_map["default"])
 
-# ===================== 4. 解析M2文件（独立实现） =====================
-def parse_m2(file_path):
-    m2_data = []
-    current_sent = None
-    current_edits = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("S "):
-                if current_sent:
-                    m2_data.append((current_sent, current_edits))
-                current_sent = line[2:]
-                current_edits = []
-            elif line.startswith("A "):
-                parts = line[2:].split("|||")
-                if len(parts) >= 3:
-                    span = parts[0].strip()
-                    coarse_type = parts[1].strip()
-                    cor_text = parts[2].strip()
-                    # 补充：保留原始A行的其他字段（如REQUIRED/-NONE-/标注者ID）
-                    rest_parts = parts[3:] if len(parts) > 3 else ["REQUIRED", "-NONE-", "0"]
-                    current_edits.append((span, coarse_type, cor_text, rest_parts))
-    if current_sent:
-        m2_data.append((current_sent, current_edits))
-    return m2_data
+# ===================== 4. 生成细粒度M2文件（修正格式） =====================
+def postprocess_block(nlp, block, cache=None, dedup=None, orig_tokens=None):
+    """
+    生成一个句子块的细粒度输出行（S行 + 编辑行 + 空行）
+    :param orig_tokens: 原始句的分词结果（如来自预分析旁路文件），缺省时现场分词
+    """
+    lines = [f"S {block.source}\n"]
+    if orig_tokens is None:
+        with PROFILER.stage("analysis", length=len(block.source.split())):
+            orig_tokens = tokenize(nlp, block.source, cache, dedup)
+    with PROFILER.stage("classify", len(block.edits), len(orig_tokens)):
+        lines.extend(fine_edit_lines(block, orig_tokens))
+    lines.append("\n")
+    return lines
+
+def fine_edit_lines(block, orig_tokens):
+    """逐条编辑生成细粒度A行"""
+    lines = []
+    for edit in block.edits:
+        span, coarse_type, cor_text = edit.span, edit.cat, edit.cor
+        # 保留原始A行的其他字段（如REQUIRED/-NONE-/标注者ID）
+        rest_parts = edit.extra or ("REQUIRED", "-NONE-", "0")
+        # 获取原始文本（兼容span越界）
+        try:
+            start, end = map(int, span.split())
+            orig_text = " ".join(orig_tokens[start:end]) if 0 <= start < end <= len(orig_tokens) else ""
+        except:
+            orig_text = ""
+        # 生成细粒度类型
+        fine_type = get_fine_grain_type(coarse_type, orig_text, cor_text)
+        # 修正：用细粒度类型替换粗粒度类型，符合M2标准格式
+        lines.append(f"A {span}|||{fine_type}|||{cor_text}|||{'|||'.join(rest_parts[:3])}\n")
+    return lines
 
-# ===================== 5. 生成细粒度M2文件（修正格式） =====================
-def postprocess_m2(coarse_m2, fine_m2):
-    nlp = init_stanza()
-    m2_data = parse_m2(coarse_m2)
+def postprocess_m2(coarse_m2, fine_m2, pretokenized=False, cache_dir=None, dedup=False,
+                   sidecar=None, write_sidecar=False):
+    """
+    :param dedup: 先扫描整个文件找出重复的原始句，重复句子只送入Stanza一次
+    :param sidecar: run_annotate写出的预分析旁路文件；给出时直接读取其中的分词和编辑，不加载Stanza
+    :param write_sidecar: 同时为细粒度输出写出预分析旁路文件（输出文件名+.ana）
+    """
+    if sidecar:
+        postprocess_from_sidecar(coarse_m2, fine_m2, sidecar, write_sidecar)
+        return
+    with PROFILER.stage("init"):
+        nlp = init_stanza(pretokenized)
+    cache = AnalysisCache(cache_dir, "en", STANZA_PROCESSORS, pretokenized) if cache_dir else None
+    memo = None
+    if dedup and nlp:
+        memo = DedupMemo()
+        memo.scan(block.source for block in iter_m2_blocks(coarse_m2) if block.source)
     
+    writer = AnalyzedCorpusWriter(sidecar_path_for(fine_m2)) if write_sidecar else None
     with open(fine_m2, "w", encoding="utf-8") as f:
-        for sent, edits in m2_data:
-            f.write(f"S {sent}\n")
-            orig_tokens = tokenize(nlp, sent)
-            for edit in edits:
-                span, coarse_type, cor_text, rest_parts = edit
-                # 获取原始文本（兼容span越界）
-                try:
-                    start, end = map(int, span.split())
-                    orig_text = " ".join(orig_tokens[start:end]) if 0 <= start < end <= len(orig_tokens) else ""
-                except:
-                    orig_text = ""
-                # 生成细粒度类型
-                fine_type = get_fine_grain_type(coarse_type, orig_text, cor_text)
-                # 修正：用细粒度类型替换粗粒度类型，符合M2标准格式
-                f.write(f"A {span}|||{fine_type}|||{cor_text}|||{'|||'.join(rest_parts[:3])}\n")
-            f.write("\n")
+        for block in PROFILER.timed_iter("read", iter_m2_blocks(coarse_m2)):
+            if writer is None:
+                lines = postprocess_block(nlp, block, cache, memo)
+                with PROFILER.stage("write"):
+                    f.writelines(lines)
+                continue
+            with PROFILER.stage("analysis", length=len(block.source.split())):
+                analysis = analyze(nlp, block.source, cache, memo)
+            orig_tokens = [word[0] for word in analysis[0]] if analysis is not None else block.source.split()
+            lines = postprocess_block(nlp, block, orig_tokens=orig_tokens)
+            with PROFILER.stage("write"):
+                f.writelines(lines)
+                writer.add_block(block.source, analysis, [parse_edit_line(line.strip()) for line in lines[1:-1]])
+    if writer is not None:
+        writer.close(fine_m2)
+    if memo is not None:
+        print(memo.summary())
+    if cache is not None:
+        print(cache.summary())
+        cache.close()
     print(f" 生成合规的细粒度M2文件：{fine_m2}")
 
+def postprocess_from_sidecar(coarse_m2, fine_m2, sidecar_path, write_sidecar=False):
+    """直接读取预分析旁路文件中的原始句分词和粗粒度编辑生成细粒度M2（纯I/O，不加载Stanza）"""
+    with AnalyzedCorpus(sidecar_path, coarse_m2) as corpus:
+        writer = AnalyzedCorpusWriter(sidecar_path_for(fine_m2)) if write_sidecar else None
+        with open(fine_m2, "w", encoding="utf-8") as f:
+            for i in range(len(corpus)):
+                with PROFILER.stage("read"):
+                    block = corpus.block(i)
+                    orig_tokens = corpus.tokens(i, 0) or block.source.split()
+                lines = postprocess_block(None, block, orig_tokens=orig_tokens)
+                with PROFILER.stage("write"):
+                    f.writelines(lines)
+                    if writer is not None:
+                        writer.add_block(block.source, corpus.analysis(i), [parse_edit_line(line.strip()) for line in lines[1:-1]])
+        if writer is not None:
+            writer.close(fine_m2)
+    print(f"读取预分析旁路文件：{sidecar_path}")
+    print(f" 生成合规的细粒度M2文件：{fine_m2}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(usage="python m2_postprocess.py <coarse_m2> <fine_m2> [--pretokenized] [--cache DIR] [--dedup] [--sidecar [PATH]] [--write-sidecar] [--daemon [ADDRESS]] [--profile REPORT.json]")
+    parser.add_argument("coarse_m2")
+    parser.add_argument("fine_m2")
+    parser.add_argument("--pretokenized", action="store_true", help="信任M2的空格分词，跳过Stanza的tokenize/mwt")
+    parser.add_argument("--cache", help="Stanza分析结果的持久化缓存目录（可选）")
+    parser.add_argument("--dedup", action="store_true", help="先扫描整个文件找出重复句子，重复句子只送入Stanza一次")
+    parser.add_argument("--sidecar", nargs="?", const="", help="读取run_annotate --sidecar写出的预分析文件（默认为coarse_m2+.ana），不加载Stanza")
+    parser.add_argument("--write-sidecar", action="store_true", help="同时为细粒度输出写出预分析旁路文件")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_ADDRESS, help="客户端模式：交给常驻守护进程处理（可指定套接字地址）")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.daemon:
+        reject_unsupported_options(parser, args, ("coarse_m2", "fine_m2", "pretokenized"))
+    if args.sidecar == "":
+        args.sidecar = sidecar_path_for(args.coarse_m2)
+    if args.daemon:
+        remote_process("m2_postprocess", args.coarse_m2, args.fine_m2, {"pretokenized": args.pretokenized}, address=args.daemon)
+        print(f" 生成合规的细粒度M2文件：{args.fine_m2}")
+    else:
+        with profile_session("m2_postprocess", args.profile, args.profile_trace, args.profile_sample):
+            postprocess_m2(args.coarse_m2, args.fine_m2, args.pretokenized, args.cache, args.dedup,
+                           sidecar=args.sidecar, write_sidecar=args.write_sidecar)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python m2_postprocess.py <coarse_m2> <fine_m2>")
-        sys.exit(1)
-    postprocess_m2(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    main()
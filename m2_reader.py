@@ -0,0 +1,152 @@
+import io
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# ===================== 1. 紧凑的编辑/句子块记录 =====================
+class Edit:
+    """M2文件中的一条A行（使用__slots__，不为每条编辑创建__dict__）"""
+    __slots__ = ("span", "cat", "cor", "extra")
+
+    def __init__(self, span: str, cat: str, cor: str, extra: tuple = ()):
+        self.span = span      # 原始span字符串，如"4 5"
+        self.cat = cat        # 错误类型
+        self.cor = cor        # 修正文本
+        self.extra = extra    # 其余字段（如REQUIRED/-NONE-/标注者ID）
+
+    @property
+    def start(self) -> int:
+        return int(self.span.split()[0])
+
+    @property
+    def end(self) -> int:
+        return int(self.span.split()[1])
+
+    @property
+    def annotator(self) -> int:
+        """标注者ID（M2最后一个字段，缺失或非数字时为0）"""
+        if self.extra and self.extra[-1].isdigit():
+            return int(self.extra[-1])
+        return 0
+
+    def fields(self) -> tuple:
+        return (self.span, self.cat, self.cor) + self.extra
+
+    def to_line(self) -> str:
+        return "A " + "|||".join(self.fields())
+
+    def __repr__(self):
+        return f"Edit({self.to_line()!r})"
+
+
+class M2Block:
+    """一个句子块：S行 + 其下所有A行"""
+    __slots__ = ("source", "edits", "index", "offset", "end_offset")
+
+    def __init__(self, source: str, edits: List[Edit], index: int = 0,
+                 offset: int = 0, end_offset: int = 0):
+        self.source = source          # S行内容（不含"S "前缀）
+        self.edits = edits
+        self.index = index            # 块序号（从0开始）
+        self.offset = offset          # S行在文件中的字节偏移
+        self.end_offset = end_offset  # 下一个块（或文件末尾）的字节偏移
+
+    def by_annotator(self) -> Dict[int, List[Edit]]:
+        """按标注者ID分组编辑（多标注者M2文件）"""
+        groups = defaultdict(list)
+        for edit in self.edits:
+            groups[edit.annotator].append(edit)
+        return dict(groups)
+
+    def to_text(self) -> str:
+        """还原为M2文本（S行 + A行 + 空行）"""
+        return "".join([f"S {self.source}\n"] + [edit.to_line() + "\n" for edit in self.edits] + ["\n"])
+
+    def __repr__(self):
+        return f"M2Block(index={self.index}, source={self.source!r}, edits={len(self.edits)})"
+
+# ===================== 2. S行/A行解析 =====================
+def split_m2_tokens(text: str, lang: str = "en") -> List[str]:
+    """
+    按M2约定切分S行（span偏移即按此切分计数）
+    英文等语言为空格分词；中文S行不含空格时按字符计
+    """
+    if lang == "zh" and not any(ch.isspace() for ch in text):
+        return list(text)
+    return text.split()
+
+
+def parse_edit_line(line: str) -> Optional[Edit]:
+    """
+    解析一条A行
+    :param line: 已去除首尾空白的A行（以"A "开头）
+    :return: Edit对象；少于3个字段（span/类型/修正文本）的A行视为格式错误，返回None
+    """
+    parts = line[2:].split("|||")
+    if len(parts) < 3:
+        return None
+    return Edit(parts[0].strip(), parts[1].strip(), parts[2].strip(),
+                tuple(parts[3:]))
+
+def apply_edits(tokens: List[str], edits: Iterable[Edit]) -> List[str]:
+    """把一位标注者的全部编辑应用到原始句的词序列，得到完整修正句（从右往左替换，避免偏移变化）"""
+    tokens = list(tokens)
+    for edit in sorted(edits, key=lambda e: (e.start, e.end), reverse=True):
+        if edit.cat == "noop" or edit.start < 0:
+            continue
+        tokens[edit.start:edit.end] = edit.cor.split()
+    return tokens
+
+# ===================== 3. 流式读取句子块 =====================
+def iter_m2_blocks(path: str, start: int = 0, end: Optional[int] = None,
+                   first_index: int = 0) -> Iterator[M2Block]:
+    """
+    流式读取M2文件，每次产出一个句子块（整个语料不会同时驻留内存）
+    块以S行开始，空行/注释行（#开头）忽略，因此也兼容没有空行分隔的文件
+    :param path: M2文件路径
+    :param start: 起始字节偏移（必须位于块边界）
+    :param end: 结束字节偏移（不含），None表示读到文件末尾
+    :param first_index: 第一个产出块的序号
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        yield from _iter_blocks(f, start, end, first_index)
+
+
+def iter_m2_text(text: str, first_index: int = 0) -> Iterator[M2Block]:
+    """从字符串读取句子块（用于已在内存中的M2片段）"""
+    data = text.encode("utf-8")
+    yield from _iter_blocks(io.BytesIO(data), 0, None, first_index)
+
+
+def _iter_blocks(f, offset: int, end: Optional[int], index: int) -> Iterator[M2Block]:
+    block = None
+    for raw in f:
+        if end is not None and offset >= end:
+            break
+        line = raw.decode("utf-8").strip()
+        if line.startswith("S "):
+            if block is not None:
+                block.end_offset = offset
+                yield block
+                index += 1
+            block = M2Block(line[2:], [], index, offset)
+        elif line.startswith("A ") and block is not None:
+            edit = parse_edit_line(line)
+            if edit is not None:
+                block.edits.append(edit)
+        offset += len(raw)
+    if block is not None:
+        block.end_offset = offset
+        yield block
+
+
+def iter_batches(blocks: Iterable[M2Block], batch_size: int) -> Iterator[List[M2Block]]:
+    """把句子块流按batch_size个一组切分（保持原顺序）"""
+    blocks = iter(blocks)
+    batch_size = max(1, batch_size)
+    while True:
+        batch = list(islice(blocks, batch_size))
+        if not batch:
+            return
+        yield batch
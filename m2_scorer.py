@@ -0,0 +1,415 @@
+import sys
+import json
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ===================== 1. 配置 =====================
+# F值的beta（GEC惯例为F0.5，精确率权重更高）
+BETA = 0.5
+# 不参与纠错评分的类别：noop（无错误）不算TP/FP/FN；UNK只用于检测任务
+SKIP_CATS = ("noop", "UNK")
+# 报告标题（与ERRANT compare_m2的输出格式一致，方便沿用已有的解析脚本）
+TITLE = " Span-Based Correction "
+
+
+def f_score(tp: int, fp: int, fn: int, beta: float = BETA) -> Tuple[float, float, float]:
+    """精确率/召回率/F值（保留4位小数；与ERRANT一致：无FP时P=1，无FN时R=1）"""
+    p = tp / (tp + fp) if fp else 1.0
+    r = tp / (tp + fn) if fn else 1.0
+    f = (1 + beta ** 2) * p * r / (beta ** 2 * p + r) if p + r else 0.0
+    return round(p, 4), round(r, 4), round(f, 4)
+
+
+def _f_only(tp: int, fp: int, fn: int, beta: float) -> float:
+    """只算f_score的F值（选择最佳标注者的内层循环用，省去P/R的舍入）"""
+    p = tp / (tp + fp) if fp else 1.0
+    r = tp / (tp + fn) if fn else 1.0
+    return round((1 + beta ** 2) * p * r / (beta ** 2 * p + r), 4) if p + r else 0.0
+
+
+def _dense_ids(*columns) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    多列整数的联合编码：取值完全相同的行得到同一ID（按列的字典序编号，第一列为主键）
+    :return: (每行的ID, 排序后的行序)
+    """
+    order = np.lexsort(columns[::-1])
+    change = np.zeros(len(order), dtype=bool)
+    for column in columns:
+        sorted_column = column[order]
+        change[1:] |= sorted_column[1:] != sorted_column[:-1]
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.cumsum(change)
+    return ids, order
+
+
+def _expand(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """第i项重复counts[i]次：返回 (重复后的项下标, 项内序号)"""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    within = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, within
+
+# ===================== 2. 编辑编码 =====================
+class _EditArrays:
+    """一个M2文件片段的全部编辑，按列存为整数数组（句子序号、标注者、span起止、修正文本ID、类别ID）"""
+    COLUMNS = ("sent", "coder", "start", "end", "cor", "cat")
+
+    def __init__(self, path: str, byte_range=None, first: int = 0,
+                 cors: Optional[Dict[str, int]] = None, cats: Optional[Dict[str, int]] = None):
+        """
+        直接逐行解析（不为每条编辑创建Edit对象，评分只需要这几个字段）；
+        字段取法与m2_reader.parse_edit_line/Edit.annotator相同，格式错误的A行同样忽略
+        :param cors/cats: 修正文本/类别到整数ID的映射（两侧共用，使相同的修正文本得到相同的ID）
+        """
+        self.sources: List[str] = []
+        cors = {} if cors is None else cors
+        cats = {} if cats is None else cats
+        columns = {name: [] for name in self.COLUMNS}
+        add_sent, add_coder, add_start, add_end, add_cor, add_cat = (columns[name].append for name in self.COLUMNS)
+        start, end = byte_range or (0, None)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(end - start)
+        sent = first - 1
+        has_edits = True
+        for line in data.decode("utf-8").splitlines():
+            line = line.strip()
+            if line.startswith("A "):
+                if sent < first:
+                    continue
+                parts = line[2:].split("|||")
+                if len(parts) < 3:
+                    continue
+                span = parts[0].split()
+                coder = parts[-1]
+                cor = parts[2].strip()
+                cat = parts[1].strip()
+                add_sent(sent)
+                add_coder(int(coder) if len(parts) > 3 and coder.isdigit() else 0)
+                add_start(int(span[0]))
+                add_end(int(span[1]))
+                add_cor(cors.setdefault(cor, len(cors)))
+                add_cat(cats.setdefault(cat, len(cats)))
+                has_edits = True
+            elif line.startswith("S "):
+                # 没有A行的句子视为标注者0的noop（与ERRANT一致：每个句子至少有一个标注者）
+                if not has_edits:
+                    self._add_noop(columns, sent, cors, cats)
+                sent += 1
+                has_edits = False
+                self.sources.append(line[2:])
+        if not has_edits:
+            self._add_noop(columns, sent, cors, cats)
+        self.columns = {name: np.asarray(values, dtype=np.int64) for name, values in columns.items()}
+
+    @staticmethod
+    def _add_noop(columns, sent, cors, cats):
+        for name, value in zip(_EditArrays.COLUMNS, (sent, 0, -1, -1, cors.setdefault("-NONE-", len(cors)),
+                                                     cats.setdefault("noop", len(cats)))):
+            columns[name].append(value)
+
+
+class _Side:
+    """
+    一侧（系统输出或参考答案）编码后的编辑
+    标注者组：(句子, 标注者) 的稠密编号，同一句子的组编号连续且按句子顺序排列
+    条目：同一标注者组内 (span, 修正文本) 相同的编辑合并为一个条目，rows为其编辑条数（ERRANT按此键比较）
+    """
+
+    def __init__(self, cols: Dict[str, np.ndarray], key: np.ndarray, skip: np.ndarray, n_sents: int, first_sent: int):
+        self.group, _ = _dense_ids(cols["sent"], cols["coder"])
+        n_groups = int(self.group.max()) + 1
+        self.group_sent = np.zeros(n_groups, dtype=np.int64)
+        self.group_sent[self.group] = cols["sent"] - first_sent
+        self.group_coder = np.zeros(n_groups, dtype=np.int64)
+        self.group_coder[self.group] = cols["coder"]
+        # 各句子的第一个标注者组与组数
+        self.sent_group_start = np.searchsorted(self.group_sent, np.arange(n_sents + 1))
+        self.sent_groups = np.diff(self.sent_group_start)
+
+        scored = ~skip
+        self.row_group = self.group[scored]
+        self.row_cat = cols["cat"][scored]
+        self.group_rows = np.bincount(self.row_group, minlength=n_groups)
+        self.row_entry, _ = _dense_ids(self.row_group, key[scored])
+        n_entries = int(self.row_entry.max()) + 1 if len(self.row_entry) else 0
+        self.entry_rows = np.bincount(self.row_entry, minlength=n_entries)
+        self.entry_group = np.zeros(n_entries, dtype=np.int64)
+        self.entry_group[self.row_entry] = self.row_group
+        self.entry_key = np.zeros(n_entries, dtype=np.int64)
+        self.entry_key[self.row_entry] = key[scored]
+        # 按条目排列的行（TP按参考答案条目展开到各行的类别）
+        self.entry_row_order = np.argsort(self.row_entry, kind="stable")
+        self.entry_row_start = np.concatenate(([0], np.cumsum(self.entry_rows)))
+
+# ===================== 3. 分片计数（可在工作进程中运行） =====================
+def count_shard(hyp_m2: str, gold_m2: str, hyp_range=None, gold_range=None, first: int = 0) -> dict:
+    """
+    计算一段句子的每个 (系统标注者, 参考标注者) 组合的TP/FP/FN，以及各组合按类别的明细
+    每句选哪个参考标注者依赖此前所有句子的累计结果，必须顺序进行，由父进程在合并各分片后统一选择（select_best）
+    :param hyp_range: 系统输出文件的字节范围 (start, end)，None表示整个文件
+    :param gold_range: 参考答案文件的字节范围
+    :param first: 本段第一个句子的全局序号
+    :return: 各组合的句子序号/标注者/TP/FP/FN、按 (组合, 类别, TP/FP/FN) 汇总的明细，以及类别表
+    """
+    cors: Dict[str, int] = {}
+    cats: Dict[str, int] = {}
+    hyp_edits = _EditArrays(hyp_m2, hyp_range, first, cors, cats)
+    gold_edits = _EditArrays(gold_m2, gold_range, first, cors, cats)
+    n_sents = len(hyp_edits.sources)
+    if n_sents != len(gold_edits.sources):
+        raise ValueError(f"句子数不一致：{hyp_m2} 有{n_sents}句，{gold_m2} 有{len(gold_edits.sources)}句")
+    misaligned = sum(hyp != gold for hyp, gold in zip(hyp_edits.sources, gold_edits.sources))
+    cat_names = sorted(cats, key=cats.get)
+    skip_ids = np.array([cats[cat] for cat in SKIP_CATS if cat in cats], dtype=np.int64)
+
+    hyp_cols, gold_cols = hyp_edits.columns, gold_edits.columns
+    # 编辑键 (句子, 起, 止, 修正文本) 在两侧统一编号，含句子序号，匹配不会跨句
+    key, _ = _dense_ids(*(np.concatenate((hyp_cols[name], gold_cols[name])) for name in ("sent", "start", "end", "cor")))
+    n_hyp = len(hyp_cols["sent"])
+    hyp = _Side(hyp_cols, key[:n_hyp], np.isin(hyp_cols["cat"], skip_ids), n_sents, first)
+    gold = _Side(gold_cols, key[n_hyp:], np.isin(gold_cols["cat"], skip_ids), n_sents, first)
+
+    # 组合：每句 系统标注者组数 × 参考标注者组数 个，按句子、系统标注者、参考标注者的顺序排列
+    reps = gold.sent_groups[hyp.group_sent]
+    combo_hyp, within = _expand(reps)
+    combo_gold = gold.sent_group_start[hyp.group_sent[combo_hyp]] + within
+    n_combos = len(combo_hyp)
+    sent_combos = hyp.sent_groups * gold.sent_groups
+    combo_start = np.concatenate(([0], np.cumsum(sent_combos)))
+
+    def combo_of(hyp_group, gold_group):
+        sent = hyp.group_sent[hyp_group]
+        return (combo_start[sent] + (hyp_group - hyp.sent_group_start[sent]) * gold.sent_groups[sent]
+                + gold_group - gold.sent_group_start[sent])
+
+    # 哈希联接的向量化形式：参考答案条目按键排序，系统条目二分查找键相同的区间（每个参考标注者组最多一个）
+    gold_order = np.argsort(gold.entry_key, kind="stable")
+    gold_keys = gold.entry_key[gold_order]
+    lo = np.searchsorted(gold_keys, hyp.entry_key, side="left")
+    hi = np.searchsorted(gold_keys, hyp.entry_key, side="right")
+    pair_hyp, within = _expand(hi - lo)
+    pair_gold = gold_order[lo[pair_hyp] + within]
+    pair_combo = combo_of(hyp.entry_group[pair_hyp], gold.entry_group[pair_gold])
+
+    tp = np.bincount(pair_combo, weights=gold.entry_rows[pair_gold], minlength=n_combos).astype(np.int64)
+    hyp_matched = np.bincount(pair_combo, weights=hyp.entry_rows[pair_hyp], minlength=n_combos).astype(np.int64)
+    fp = hyp.group_rows[combo_hyp] - hyp_matched
+    fn = gold.group_rows[combo_gold] - tp
+
+    # 类别明细：TP取参考答案的类别，FP取系统输出的类别，FN取参考答案的类别
+    # TP：匹配上的参考条目展开到各行
+    tp_pair, within = _expand(gold.entry_rows[pair_gold])
+    tp_rows = gold.entry_row_order[gold.entry_row_start[pair_gold[tp_pair]] + within]
+    tp_detail = (pair_combo[tp_pair], gold.row_cat[tp_rows])
+    # FP：系统输出的每行 × 该句的每个参考标注者组，去掉在该组合中匹配上的
+    fp_row, within = _expand(gold.sent_groups[hyp.group_sent[hyp.row_group]])
+    fp_combo = combo_of(hyp.row_group[fp_row], gold.sent_group_start[hyp.group_sent[hyp.row_group[fp_row]]] + within)
+    n_hyp_entries = len(hyp.entry_rows)
+    fp_keep = ~np.isin(fp_combo * n_hyp_entries + hyp.row_entry[fp_row], pair_combo * n_hyp_entries + pair_hyp)
+    fp_detail = (fp_combo[fp_keep], hyp.row_cat[fp_row[fp_keep]])
+    # FN：参考答案的每行 × 该句的每个系统标注者组，去掉在该组合中匹配上的
+    fn_row, within = _expand(hyp.sent_groups[gold.group_sent[gold.row_group]])
+    fn_combo = combo_of(hyp.sent_group_start[gold.group_sent[gold.row_group[fn_row]]] + within, gold.row_group[fn_row])
+    n_gold_entries = len(gold.entry_rows)
+    fn_keep = ~np.isin(fn_combo * n_gold_entries + gold.row_entry[fn_row], pair_combo * n_gold_entries + pair_gold)
+    fn_detail = (fn_combo[fn_keep], gold.row_cat[fn_row[fn_keep]])
+
+    n_cats = max(len(cat_names), 1)
+    codes = np.concatenate([(combo * n_cats + cat) * 3 + kind
+                            for kind, (combo, cat) in enumerate((tp_detail, fp_detail, fn_detail))])
+    detail_codes, detail_counts = np.unique(codes, return_counts=True)
+    return {
+        "first": first,
+        "sents": n_sents,
+        "misaligned": misaligned,
+        "combo_start": combo_start,
+        "combo_hyp_coder": hyp.group_coder[combo_hyp],
+        "combo_gold_coder": gold.group_coder[combo_gold],
+        "tp": tp, "fp": fp, "fn": fn,
+        "detail_combo": detail_codes // 3 // n_cats,
+        "detail_cat": detail_codes // 3 % n_cats,
+        "detail_kind": detail_codes % 3,
+        "detail_count": detail_counts,
+        "cats": cat_names,
+    }
+
+
+def _count_shard(args):
+    return count_shard(*args)
+
+# ===================== 4. 合并、选择最佳标注者与汇总 =====================
+def merge_shards(shards: List[dict]) -> dict:
+    """按句子顺序拼接各分片的计数（组合编号加偏移，类别ID映射到统一的类别表）"""
+    cats: Dict[str, int] = {}
+    merged = {name: [] for name in ("combo_start", "combo_hyp_coder", "combo_gold_coder", "tp", "fp", "fn",
+                                    "detail_combo", "detail_cat", "detail_kind", "detail_count")}
+    offset = 0
+    for shard in sorted(shards, key=lambda shard: shard["first"]):
+        cat_map = np.array([cats.setdefault(cat, len(cats)) for cat in shard["cats"]] or [0], dtype=np.int64)
+        merged["combo_start"].append(shard["combo_start"][:-1] + offset)
+        for name in ("combo_hyp_coder", "combo_gold_coder", "tp", "fp", "fn", "detail_kind", "detail_count"):
+            merged[name].append(shard[name])
+        merged["detail_combo"].append(shard["detail_combo"] + offset)
+        merged["detail_cat"].append(cat_map[shard["detail_cat"]])
+        offset += len(shard["tp"])
+    result = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64) for name, parts in merged.items()}
+    result["combo_start"] = np.concatenate((result["combo_start"], [offset]))
+    result["cats"] = sorted(cats, key=cats.get)
+    result["misaligned"] = sum(shard["misaligned"] for shard in shards)
+    return result
+
+
+def select_best(combo_start: np.ndarray, tp: np.ndarray, fp: np.ndarray, fn: np.ndarray,
+                beta: float = BETA) -> np.ndarray:
+    """
+    每句选出使累计F值最高的组合（同分时依次取TP多、FP少、FN少的；与ERRANT的选择规则一致）
+    只有一个组合的句子无需选择，其计数用前缀和一次性累加，Python循环只经过有多个组合的句子
+    :return: 每句被选中的组合编号
+    """
+    sent_combos = np.diff(combo_start)
+    chosen = combo_start[:-1].copy()
+    multi = np.flatnonzero(sent_combos > 1)
+    if not len(multi):
+        return chosen
+    single = np.where(sent_combos == 1, chosen, -1)
+    prefix = [np.concatenate(([0], np.cumsum(np.where(single >= 0, counts[np.maximum(single, 0)], 0))))
+              for counts in (tp, fp, fn)]
+    tp_list, fp_list, fn_list, start_list = tp.tolist(), fp.tolist(), fn.tolist(), combo_start.tolist()
+    acc_tp = acc_fp = acc_fn = 0
+    for s in multi.tolist():
+        base_tp, base_fp, base_fn = int(prefix[0][s]) + acc_tp, int(prefix[1][s]) + acc_fp, int(prefix[2][s]) + acc_fn
+        best = None
+        for c in range(start_list[s], start_list[s + 1]):
+            t, p, n = tp_list[c], fp_list[c], fn_list[c]
+            f = _f_only(base_tp + t, base_fp + p, base_fn + n, beta)
+            if best is None or f > best[0] or (f == best[0] and (t > best[1] or (t == best[1] and (
+                    p < best[2] or (p == best[2] and n < best[3]))))):
+                best = (f, t, p, n, c)
+        chosen[s] = best[4]
+        acc_tp, acc_fp, acc_fn = acc_tp + best[1], acc_fp + best[2], acc_fn + best[3]
+    return chosen
+
+
+def summarize(merged: dict, beta: float = BETA) -> dict:
+    """选出每句的最佳组合后汇总总体与各类别的TP/FP/FN/P/R/F"""
+    chosen = select_best(merged["combo_start"], merged["tp"], merged["fp"], merged["fn"], beta)
+    tp, fp, fn = (int(merged[name][chosen].sum()) for name in ("tp", "fp", "fn"))
+    is_chosen = np.zeros(len(merged["tp"]), dtype=bool)
+    is_chosen[chosen] = True
+    keep = is_chosen[merged["detail_combo"]]
+    n_cats = len(merged["cats"])
+    cat_counts = np.bincount(merged["detail_cat"][keep] * 3 + merged["detail_kind"][keep],
+                             weights=merged["detail_count"][keep], minlength=n_cats * 3).astype(np.int64)
+    cat_counts = cat_counts.reshape(n_cats, 3) if n_cats else cat_counts.reshape(0, 3)
+    categories = {cat: [int(x) for x in cat_counts[i]] for i, cat in enumerate(merged["cats"]) if cat_counts[i].any()}
+    prec, rec, f = f_score(tp, fp, fn, beta)
+    return {
+        "tp": tp, "fp": fp, "fn": fn, "prec": prec, "rec": rec, "f": f,
+        "beta": beta,
+        "sentences": len(chosen),
+        "misaligned": merged["misaligned"],
+        "categories": categories,
+        "best_hyp_coder": merged["combo_hyp_coder"][chosen],
+        "best_gold_coder": merged["combo_gold_coder"][chosen],
+    }
+
+
+def group_categories(categories: Dict[str, list], level: int) -> Dict[str, list]:
+    """
+    按ERRANT的类别层级合并：1 只看操作（M/R/U）；2 去掉操作前缀（如M:VERB:FORM -> VERB:FORM）；3 完整类别
+    本仓库的粗/细粒度类别没有操作前缀时，层级1/2按原类别统计
+    """
+    if level == 3:
+        return categories
+    grouped: Dict[str, list] = {}
+    for cat, counts in categories.items():
+        if cat != "UNK" and len(cat) > 2 and cat[1] == ":" and cat[0] in "MRU":
+            cat = cat[0] if level == 1 else cat[2:]
+        total = grouped.setdefault(cat, [0, 0, 0])
+        for i in range(3):
+            total[i] += counts[i]
+    return grouped
+
+# ===================== 5. 入口 =====================
+def score(hyp_m2: str, gold_m2: str, jobs: int = 1, beta: float = BETA) -> dict:
+    """
+    评分：jobs>1时用M2块偏移索引把系统输出按字节均分为块对齐的分片，参考答案取相同句子范围，各分片并行计数
+    """
+    if jobs <= 1:
+        return summarize(merge_shards([count_shard(hyp_m2, gold_m2)]), beta)
+    from m2_index import M2Index
+    with M2Index.open(hyp_m2) as hyp_index, M2Index.open(gold_m2) as gold_index:
+        if len(hyp_index) != len(gold_index):
+            raise ValueError(f"句子数不一致：{hyp_m2} 有{len(hyp_index)}句，{gold_m2} 有{len(gold_index)}句")
+        tasks = [(hyp_m2, gold_m2, (start, end), (int(gold_index.offsets[first]), int(gold_index.offsets[stop])), first)
+                 for first, stop, start, end in hyp_index.plan_shards(jobs) if stop > first]
+    # 只在多进程时导入（multiprocessing拖慢单进程评分的启动）
+    from worker_pool import fork_pool
+    with fork_pool(min(jobs, len(tasks)), torch_threads=1) as pool:
+        shards = list(pool.map(_count_shard, tasks))
+    return summarize(merge_shards(shards), beta)
+
+
+def format_results(result: dict, cat_level: Optional[int] = None) -> str:
+    """与ERRANT compare_m2相同的输出格式"""
+    beta = result["beta"]
+    lines = []
+    if cat_level:
+        lines.append("")
+        lines.append("{:=^66}".format(TITLE))
+        lines.append(" ".join(["Category".ljust(14), "TP".ljust(8), "FP".ljust(8), "FN".ljust(8),
+                               "P".ljust(8), "R".ljust(8), f"F{beta}"]))
+        for cat, (tp, fp, fn) in sorted(group_categories(result["categories"], cat_level).items()):
+            p, r, f = f_score(tp, fp, fn, beta)
+            lines.append(" ".join([cat.ljust(14), str(tp).ljust(8), str(fp).ljust(8), str(fn).ljust(8),
+                                   str(p).ljust(8), str(r).ljust(8), str(f)]))
+    lines.append("")
+    lines.append("{:=^46}".format(TITLE))
+    lines.append("\t".join(["TP", "FP", "FN", "Prec", "Rec", f"F{beta}"]))
+    lines.append("\t".join(map(str, [result["tp"], result["fp"], result["fn"],
+                                     result["prec"], result["rec"], result["f"]])))
+    lines.append("{:=^46}".format(""))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="M2评分：系统输出对参考答案（如ABCN.dev.gold.bea19.m2）的TP/FP/FN与P/R/F0.5，总体及按类别，每句选最佳参考标注者")
+    parser.add_argument("-hyp", "--hyp", required=True, help="系统输出M2文件")
+    parser.add_argument("-ref", "--ref", required=True, help="参考答案M2文件")
+    parser.add_argument("-b", "--beta", type=float, default=BETA, help="F值的beta")
+    parser.add_argument("-cat", "--cat", type=int, choices=[1, 2, 3],
+                        help="按类别输出：1 操作（M/R/U）；2 主类别；3 完整类别")
+    parser.add_argument("--jobs", type=int, default=1, help="并行计数的进程数（数十万句以上的测试集才值得：dev集上进程启动开销大于计数本身）")
+    parser.add_argument("--json", metavar="FILE", help="同时把结果写为JSON（-表示标准输出，此时不打印表格）")
+    parser.add_argument("--best-annotators", metavar="FILE", help="写出每句选中的 系统标注者\\t参考标注者")
+    args = parser.parse_args(argv)
+
+    try:
+        result = score(args.hyp, args.ref, args.jobs, args.beta)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    if result["misaligned"]:
+        print(f"警告：{result['misaligned']}/{result['sentences']} 个句子的S行不一致（两个文件可能不是同一测试集）",
+              file=sys.stderr)
+    if args.best_annotators:
+        with open(args.best_annotators, "w", encoding="utf-8") as f:
+            for hyp_coder, gold_coder in zip(result["best_hyp_coder"].tolist(), result["best_gold_coder"].tolist()):
+                f.write(f"{hyp_coder}\t{gold_coder}\n")
+    if args.json:
+        payload = {key: value for key, value in result.items() if not key.startswith("best_")}
+        text = json.dumps(payload, ensure_ascii=False, indent=2)
+        if args.json == "-":
+            print(text)
+            return
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(format_results(result, args.cat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import threading
+from collections import Counter
+from typing import Callable, Iterable, List, Optional
+
+# ===================== 1. 配置 =====================
+# 状态文件/Prometheus文本文件的刷新间隔（秒）
+METRICS_INTERVAL = 5.0
+# Prometheus指标名前缀
+METRIC_PREFIX = "m2_annotate"
+
+# ===================== 2. 内存与进度 =====================
+def child_pids(pid="self") -> List[int]:
+    """当前进程的直接子进程（多进程模式下的工作进程），读取失败时返回空列表"""
+    pids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", "r") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+def rss_bytes(pid="self") -> Optional[int]:
+    from worker_pool import memory_kb
+    try:
+        return memory_kb(pid)["rss"] * 1024
+    except OSError:
+        return None
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# ===================== 3. 指标导出 =====================
+class MetricsExporter:
+    """
+    长任务的运行指标：句子/秒、编辑/秒、队列深度、常驻内存、预计剩余时间、各错误类别计数
+    后台守护线程按固定间隔刷新JSON状态文件和Prometheus文本文件（node_exporter textfile collector格式），
+    与是否有新的句子块写出无关：任务卡住时文件照常刷新，近期速率降为0，内存照常采样
+    两者都先写临时文件再原子替换，读取方不会看到写了一半的文件
+    用法：每写出一个句子块调用一次record()（只更新计数），结束时调用finish()（停止刷新线程并写出最终状态）
+    """
+
+    def __init__(self, script: str, status_path: Optional[str] = None, prom_path: Optional[str] = None,
+                 interval: float = METRICS_INTERVAL, total_bytes: Optional[int] = None, start_bytes: int = 0):
+        """
+        :param script: 脚本名（Prometheus标签）
+        :param total_bytes: 输入的结束字节偏移（按已处理的字节数估算进度和剩余时间）
+        :param start_bytes: 输入的起始字节偏移（分片/续跑时不为0）
+        """
+        self.script = script
+        self.status_path = status_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self.total_bytes = total_bytes
+        self.start_bytes = start_bytes
+        self.done_bytes = start_bytes
+        self.sentences = 0
+        self.edits = 0
+        self.categories = Counter()
+        # 返回各队列当前长度的函数（如Pipeline.depths），由调用方设置
+        self.queue_depths: Optional[Callable[[], List[int]]] = None
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.last = (self.started, 0, 0)
+        self.peak_rss = 0
+        # 计数由写出线程更新、由刷新线程读取
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        if status_path or prom_path:
+            self.thread = threading.Thread(target=self._refresh, name="metrics", daemon=True)
+            self.thread.start()
+
+    def _refresh(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def record(self, sentences: int = 1, categories: Iterable[str] = (), offset: Optional[int] = None):
+        """
+        记录已写出的句子块
+        :param categories: 这些句子块各条编辑的错误类别
+        :param offset: 已处理到的输入字节偏移
+        """
+        categories = list(categories)
+        with self.lock:
+            self.sentences += sentences
+            self.edits += len(categories)
+            self.categories.update(categories)
+            if offset is not None:
+                self.done_bytes = offset
+
+    def status(self, now: float, state: str = "running") -> dict:
+        elapsed = now - self.started
+        last_time, last_sentences, last_edits = self.last
+        window = now - last_time
+        progress = eta = None
+        if self.total_bytes and self.total_bytes > self.start_bytes:
+            progress = min(1.0, (self.done_bytes - self.start_bytes) / (self.total_bytes - self.start_bytes))
+            if state == "done":
+                progress, eta = 1.0, 0.0
+            elif progress > 0:
+                eta = elapsed * (1 - progress) / progress
+        rss = rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+        workers = [child_rss for child_rss in map(rss_bytes, child_pids()) if child_rss is not None]
+        return {
+            "script": self.script,
+            "state": state,
+            "pid": os.getpid(),
+            "started_at": round(self.started_at, 3),
+            "updated_at": round(time.time(), 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "sentences": self.sentences,
+            "edits": self.edits,
+            "sentences_per_sec": round(self.sentences / elapsed, 3) if elapsed else 0.0,
+            "edits_per_sec": round(self.edits / elapsed, 3) if elapsed else 0.0,
+            # 最近一个刷新间隔内的速率（任务卡住时迅速降为0）
+            "recent_sentences_per_sec": round((self.sentences - last_sentences) / window, 3) if window else 0.0,
+            "recent_edits_per_sec": round((self.edits - last_edits) / window, 3) if window else 0.0,
+            "progress": round(progress, 6) if progress is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "rss_bytes": rss,
+            "peak_rss_bytes": self.peak_rss or None,
+            "worker_rss_bytes": sum(workers) if workers else None,
+            "workers": len(workers),
+            "queue_depths": list(self.queue_depths()) if self.queue_depths is not None else [],
+            "categories": dict(self.categories.most_common()),
+        }
+
+    def write(self, now: Optional[float] = None, state: str = "running"):
+        with self.lock:
+            now = time.monotonic() if now is None else now
+            status = self.status(now, state)
+            self.last = (now, self.sentences, self.edits)
+        if self.status_path:
+            self._replace(self.status_path, json.dumps(status, ensure_ascii=False, indent=2))
+        if self.prom_path:
+            self._replace(self.prom_path, self.prometheus_text(status))
+
+    def begin(self, offset: int):
+        """从输入的offset字节处开始处理（分片/续跑），进度和剩余时间只按本次要处理的部分估算"""
+        with self.lock:
+            self.start_bytes = self.done_bytes = offset
+
+    def finish(self):
+        """任务结束：停止刷新线程，立即写出最终状态（state=done）"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.write(state="done")
+
+    def prometheus_text(self, status: dict) -> str:
+        script = f'script="{_escape_label(self.script)}"'
+        metrics = [
+            ("sentences_total", "counter", "已写出的句子块数", status["sentences"]),
+            ("edits_total", "counter", "已写出的编辑数", status["edits"]),
+            ("sentences_per_second", "gauge", "最近刷新间隔内的句子/秒", status["recent_sentences_per_sec"]),
+            ("edits_per_second", "gauge", "最近刷新间隔内的编辑/秒", status["recent_edits_per_sec"]),
+            ("progress_ratio", "gauge", "按输入字节估算的进度", status["progress"]),
+            ("eta_seconds", "gauge", "预计剩余秒数", status["eta_seconds"]),
+            ("rss_bytes", "gauge", "主进程常驻内存", status["rss_bytes"]),
+            ("worker_rss_bytes", "gauge", "工作进程常驻内存之和", status["worker_rss_bytes"]),
+            ("elapsed_seconds", "gauge", "已运行秒数", status["elapsed_seconds"]),
+            ("last_update_timestamp_seconds", "gauge", "本文件的刷新时间（Unix时间戳）", status["updated_at"]),
+            ("done", "gauge", "任务是否已结束", 1 if status["state"] == "done" else 0),
+        ]
+        lines = []
+        for name, metric_type, help_text, value in metrics:
+            if value is None:
+                continue
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+            lines.append(f"{METRIC_PREFIX}_{name}{{{script}}} {value}")
+        if status["queue_depths"]:
+            lines.append(f"# HELP {METRIC_PREFIX}_queue_depth 流水线各队列当前长度")
+            lines.append(f"# TYPE {METRIC_PREFIX}_queue_depth gauge")
+            for i, depth in enumerate(status["queue_depths"]):
+                lines.append(f'{METRIC_PREFIX}_queue_depth{{{script},queue="{i}"}} {depth}')
+        if status["categories"]:
+            lines.append(f"# HELP {METRIC_PREFIX}_category_edits_total 各错误类别的编辑数")
+            lines.append(f"# TYPE {METRIC_PREFIX}_category_edits_total counter")
+            for category, count in status["categories"].items():
+                lines.append(f'{METRIC_PREFIX}_category_edits_total{{{script},category="{_escape_label(category)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _replace(path: str, text: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+def edit_categories(lines: Iterable[str]) -> List[str]:
+    """从输出的A行中取出错误类别（第2个字段）"""
+    return [line.split("|||", 2)[1] for line in lines if line.startswith("A ")]
+
+
+def add_metrics_arguments(parser):
+    """标注脚本共用的指标导出参数"""
+    parser.add_argument("--metrics-status", metavar="STATUS.json", help="定期写出JSON运行状态（速率/内存/预计剩余时间/类别计数）")
+    parser.add_argument("--metrics-prom", metavar="FILE.prom", help="定期写出Prometheus文本文件（供node_exporter textfile collector采集）")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL, help="指标文件的刷新间隔（秒）")
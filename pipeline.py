@@ -0,0 +1,125 @@
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# ===================== 1. 流水线配置 =====================
+# 相邻阶段之间队列的最大长度（以批为单位），队列满时上游阻塞，内存占用保持平稳
+QUEUE_SIZE = 4
+
+# 队列结束标记
+_DONE = object()
+
+# ===================== 2. 分阶段流水线 =====================
+class _StageError:
+    """某个阶段抛出的异常，沿队列传到下游并在调用方线程重新抛出"""
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Pipeline:
+    """
+    读取 → 各处理阶段 → 调用方（写出）的线程流水线
+    每个阶段一个线程、阶段之间为有界队列：读盘/格式化等纯Python阶段与Stanza推理（torch推理期间释放GIL）重叠执行；
+    每个阶段单线程、队列先进先出，因此输出顺序与输入一致
+    用法：for item in Pipeline(source, [stage1, stage2], queue_size): 写出item
+    """
+
+    def __init__(self, source: Iterable, stages: List[Callable], queue_size: int = QUEUE_SIZE):
+        self.source = source
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.queues: List[queue.Queue] = []
+        self.threads: List[threading.Thread] = []
+        self.stopped = threading.Event()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """放入下游队列；流水线已停止时放弃并返回False"""
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _read(self, out_q: queue.Queue):
+        try:
+            for item in self.source:
+                if not self._put(out_q, item):
+                    return
+        except BaseException as e:
+            self._put(out_q, _StageError(e))
+            return
+        self._put(out_q, _DONE)
+
+    def _work(self, fn: Callable, in_q: queue.Queue, out_q: queue.Queue):
+        while True:
+            item = self._get(in_q)
+            if item is _DONE or isinstance(item, _StageError):
+                self._put(out_q, item)
+                return
+            try:
+                result = fn(item)
+            except BaseException as e:
+                self._put(out_q, _StageError(e))
+                return
+            if not self._put(out_q, result):
+                return
+
+    def depths(self) -> List[int]:
+        """各队列当前长度（用于观察哪个阶段是瓶颈）"""
+        return [q.qsize() for q in self.queues]
+
+    def __iter__(self) -> Iterator:
+        self.queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.threads = [threading.Thread(target=self._read, args=(self.queues[0],), daemon=True)]
+        for i, fn in enumerate(self.stages):
+            self.threads.append(threading.Thread(target=self._work, args=(fn, self.queues[i], self.queues[i + 1]),
+                                                 daemon=True))
+        for thread in self.threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(self.queues[-1])
+                if item is _DONE:
+                    return
+                if isinstance(item, _StageError):
+                    raise item.error
+                yield item
+        finally:
+            # 正常结束、下游异常或提前退出时都通知所有阶段停止
+            self.stopped.set()
+            for thread in self.threads:
+                thread.join()
+
+
+class LockedPipeline:
+    """
+    Stanza Pipeline的加锁代理
+    Stanza/torch的Pipeline不是线程安全的：流水线中分析阶段之外的线程（如按需补充分析）也经由同一把锁调用
+    """
+
+    def __init__(self, nlp, lock: Optional[threading.Lock] = None):
+        self.nlp = nlp
+        self.lock = lock or threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            return self.nlp(*args, **kwargs)
+
+    def bulk_process(self, *args, **kwargs):
+        with self.lock:
+            return self.nlp.bulk_process(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.nlp, name)
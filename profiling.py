@@ -0,0 +1,309 @@
+import sys
+import json
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, Optional
+
+# ===================== 1. 配置 =====================
+# 句长直方图的分桶上界（按词数，中文按字数）；超过最后一个上界的归入最后一个桶
+LENGTH_BUCKETS = (5, 10, 20, 40, 80)
+LENGTH_LABELS = tuple(
+    [f"{lo + 1}-{hi}" if lo else f"0-{hi}" for lo, hi in zip((0,) + LENGTH_BUCKETS, LENGTH_BUCKETS)]
+    + [f">{LENGTH_BUCKETS[-1]}"]
+)
+# 报告中给出的单次耗时分位数（需enable(keep_samples=True)）
+PERCENTILES = (50, 90, 99)
+# 采样分析器的采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+# 关闭计时时各阶段共用的空上下文（不产生任何计时开销）
+_NULL = nullcontext()
+
+
+def length_label(length: int) -> str:
+    return LENGTH_LABELS[bisect_left(LENGTH_BUCKETS, length)]
+
+
+def percentile(sorted_values, p: float) -> float:
+    """最近秩法分位数（sorted_values已升序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+# ===================== 2. 分阶段计时与计数 =====================
+class _Stage:
+    __slots__ = ("profiler", "name", "items", "length", "start")
+
+    def __init__(self, profiler, name, items, length):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+        self.length = length
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start, self.items, self.length)
+
+
+class Profiler:
+    """
+    各阶段（读取/分析/对齐/分类/写出等）的累计耗时、调用次数、处理条数，以及按句长分桶的耗时直方图
+    默认关闭：关闭时stage()返回共享的空上下文，热路径上只多一次属性判断
+    用法：with PROFILER.stage("align", length=词数): ...
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.keep_samples = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        # 阶段名 -> [调用次数, 处理条数, 累计秒数, 单次最大秒数]
+        self.stages: Dict[str, list] = {}
+        # 阶段名 -> {句长桶: [次数, 累计秒数]}
+        self.lengths: Dict[str, Dict[str, list]] = {}
+        self.counters = Counter()
+        # 阶段名 -> 每次调用的秒数（只在keep_samples时记录，用于分位数）
+        self.samples: Dict[str, array] = {}
+
+    def enable(self, keep_samples: bool = False):
+        """
+        :param keep_samples: 保留每次调用的耗时，报告中给出p50/p90/p99（基准测试用，内存随调用次数增长）
+        """
+        self.enabled = True
+        self.keep_samples = keep_samples
+        self.reset()
+
+    def stage(self, name: str, items: int = 1, length: Optional[int] = None):
+        """
+        计时一个阶段
+        :param items: 本次处理的条数（如一批的句子数）
+        :param length: 句子长度（给出时计入该阶段的句长直方图）
+        """
+        if not self.enabled:
+            return _NULL
+        return _Stage(self, name, items, length)
+
+    def add(self, name: str, seconds: float, items: int = 1, length: Optional[int] = None):
+        with self.lock:
+            stat = self.stages.get(name)
+            if stat is None:
+                stat = self.stages[name] = [0, 0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += items
+            stat[2] += seconds
+            if seconds > stat[3]:
+                stat[3] = seconds
+            if self.keep_samples:
+                self.samples.setdefault(name, array("d")).append(seconds)
+            if length is not None:
+                bucket = self.lengths.setdefault(name, {}).setdefault(length_label(length), [0, 0.0])
+                bucket[0] += 1
+                bucket[1] += seconds
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += n
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """对迭代器逐项计时（如从文件读取句子块），关闭时原样返回"""
+        if not self.enabled:
+            return iter(iterable)
+        return self._timed_iter(name, iter(iterable))
+
+    def _timed_iter(self, name, it):
+        perf_counter = time.perf_counter
+        while True:
+            start = perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, perf_counter() - start, 0)
+                return
+            self.add(name, perf_counter() - start)
+            yield item
+
+    def snapshot(self) -> dict:
+        """原始统计（可跨进程传回父进程后merge）"""
+        with self.lock:
+            return {
+                "stages": {name: list(stat) for name, stat in self.stages.items()},
+                "lengths": {name: {label: list(b) for label, b in buckets.items()}
+                            for name, buckets in self.lengths.items()},
+                "counters": dict(self.counters),
+                "samples": {name: values.tolist() for name, values in self.samples.items()},
+            }
+
+    def drain(self) -> dict:
+        """取出并清空统计（保留计时起点），用于工作进程逐分片上报"""
+        raw = self.snapshot()
+        started = self.started
+        with self.lock:
+            self.reset()
+            self.started = started
+        return raw
+
+    def merge(self, raw: dict):
+        with self.lock:
+            for name, (calls, items, seconds, max_seconds) in raw["stages"].items():
+                stat = self.stages.setdefault(name, [0, 0, 0.0, 0.0])
+                stat[0] += calls
+                stat[1] += items
+                stat[2] += seconds
+                stat[3] = max(stat[3], max_seconds)
+            for name, buckets in raw["lengths"].items():
+                for label, (count, seconds) in buckets.items():
+                    bucket = self.lengths.setdefault(name, {}).setdefault(label, [0, 0.0])
+                    bucket[0] += count
+                    bucket[1] += seconds
+            self.counters.update(raw["counters"])
+            for name, values in raw.get("samples", {}).items():
+                self.samples.setdefault(name, array("d")).extend(values)
+
+    def report(self, script: Optional[str] = None) -> dict:
+        """
+        生成报告：各阶段耗时/占比/单条平均，以及句长直方图
+        流水线/多进程模式下各阶段重叠执行（或分布在多个进程），占比之和可超过100%
+        """
+        wall = time.perf_counter() - self.started
+        raw = self.snapshot()
+        stages = {}
+        for name, (calls, items, seconds, max_seconds) in raw["stages"].items():
+            stages[name] = {
+                "calls": calls,
+                "items": items,
+                "seconds": round(seconds, 6),
+                "share": round(seconds / wall, 4) if wall else 0.0,
+                "ms_per_item": round(seconds * 1000 / items, 4) if items else None,
+                "max_ms": round(max_seconds * 1000, 3),
+            }
+            if name in raw["samples"]:
+                values = sorted(raw["samples"][name])
+                for p in PERCENTILES:
+                    stages[name][f"p{p}_ms"] = round(percentile(values, p) * 1000, 4)
+        lengths = {}
+        for name, buckets in raw["lengths"].items():
+            lengths[name] = {
+                label: {"count": buckets[label][0], "seconds": round(buckets[label][1], 6),
+                        "mean_ms": round(buckets[label][1] * 1000 / buckets[label][0], 4)}
+                for label in LENGTH_LABELS if label in buckets
+            }
+        return {
+            "script": script,
+            "wall_seconds": round(wall, 6),
+            "stages": stages,
+            "length_histograms": lengths,
+            "counters": raw["counters"],
+        }
+
+    def format_table(self, report: dict) -> str:
+        lines = [f"===== 分阶段耗时（总耗时 {report['wall_seconds']:.2f} 秒） =====",
+                 f"{'阶段':<12} {'次数':>8} {'条数':>8} {'耗时(秒)':>10} {'占比':>8} {'毫秒/条':>10}"]
+        for name, s in sorted(report["stages"].items(), key=lambda x: x[1]["seconds"], reverse=True):
+            per_item = f"{s['ms_per_item']:.3f}" if s["ms_per_item"] is not None else "-"
+            lines.append(f"{name:<12} {s['calls']:>8} {s['items']:>8} {s['seconds']:>10.3f} "
+                         f"{s['share'] * 100:>7.1f}% {per_item:>10}")
+        for name, buckets in report["length_histograms"].items():
+            cells = ", ".join(f"{label}: {b['count']}次/{b['mean_ms']:.3f}ms" for label, b in buckets.items())
+            lines.append(f"{name} 按句长：{cells}")
+        return "\n".join(lines)
+
+
+# 进程内共享的计时器（各脚本在--profile时调用enable()）
+PROFILER = Profiler()
+
+# ===================== 3. 可选的整体追踪 =====================
+class StackSampler:
+    """
+    采样分析器：后台线程定时抓取所有线程的调用栈，按折叠栈格式计数
+    输出每行 "外层;...;内层 次数"，可直接交给flamegraph.pl或speedscope查看；覆盖流水线的全部线程
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, path: str):
+        self.stopped.set()
+        self.thread.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_session(script: str, report_path: Optional[str] = None, trace_path: Optional[str] = None,
+                    sample_path: Optional[str] = None):
+    """
+    脚本级的计时会话：开启PROFILER，按需启动cProfile/采样分析器，结束时写出JSON报告并打印汇总表
+    三个路径都未给出时不做任何事
+    :param report_path: JSON报告路径（--profile）
+    :param trace_path: cProfile结果路径（.prof，可用pstats/snakeviz查看；只覆盖主线程）
+    :param sample_path: 采样分析器的折叠栈输出路径（覆盖所有线程）
+    """
+    if not (report_path or trace_path or sample_path):
+        yield None
+        return
+    PROFILER.enable()
+    tracer = sampler = None
+    if trace_path:
+        import cProfile
+        tracer = cProfile.Profile()
+        tracer.enable()
+    if sample_path:
+        sampler = StackSampler()
+        sampler.start()
+    try:
+        yield PROFILER
+    finally:
+        if tracer is not None:
+            tracer.disable()
+            tracer.dump_stats(trace_path)
+            print(f"cProfile结果：{trace_path}")
+        if sampler is not None:
+            sampler.stop(sample_path)
+            print(f"采样调用栈：{sample_path}")
+        report = PROFILER.report(script)
+        print(PROFILER.format_table(report))
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"计时报告：{report_path}")
+        PROFILER.enabled = False
+
+
+def add_profile_arguments(parser):
+    """四个标注/后处理脚本共用的计时参数"""
+    parser.add_argument("--profile", metavar="REPORT.json", help="记录各阶段耗时/计数/句长直方图，写出JSON报告")
+    parser.add_argument("--profile-trace", metavar="TRACE.prof", help="同时用cProfile记录主线程的完整调用耗时")
+    parser.add_argument("--profile-sample", metavar="STACKS.txt",
+                        help="同时运行采样分析器，写出所有线程的折叠调用栈（flamegraph.pl/speedscope格式）")
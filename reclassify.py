@@ -0,0 +1,142 @@
+import os
+import sys
+import argparse
+from collections import Counter
+
+from analyzed_corpus import AnalyzedCorpus, AnalyzedCorpusWriter, sidecar_path_for
+from m2_reader import Edit
+
+# ===================== 1. 配置 =====================
+# 报告中列出的类别变化条数
+TOP_CHANGES = 10
+
+# ===================== 2. 按旁路文件重写M2 =====================
+def open_sidecar(m2_path):
+    """打开M2文件旁未过期的预分析旁路文件，不存在时提示如何生成并退出"""
+    corpus = AnalyzedCorpus.open_for(m2_path)
+    if corpus is None:
+        print(f"找不到 {m2_path} 对应的预分析旁路文件（{sidecar_path_for(m2_path)}），或M2文件在其写出后被修改")
+        print("请先用 --sidecar（run_annotate.py）或 --write-sidecar（zh_postprocess.py）重新生成一次")
+        sys.exit(1)
+    return corpus
+
+
+def rewrite_m2(m2_path, output_path, reclassify_block, blank_line):
+    """
+    逐块重新分类并写出新的M2文件和旁路文件（特征原样保留，只替换类别字段）
+    :param reclassify_block: (corpus, i) -> 新的编辑列表
+    :param blank_line: 句子块之间是否有空行（run_annotate输出没有，zh_postprocess输出有）
+    :return: 类别变化计数 {(旧类别, 新类别): 条数}，编辑总数
+    """
+    output_path = output_path or m2_path
+    corpus = open_sidecar(m2_path)
+    writer = AnalyzedCorpusWriter(sidecar_path_for(output_path))
+    changes = Counter()
+    total = 0
+    tmp_path = output_path + ".tmp"
+    try:
+        with corpus, open(tmp_path, "w", encoding="utf-8") as f:
+            for i in range(len(corpus)):
+                source = corpus.source(i)
+                old_edits = corpus.edits(i)
+                new_edits = reclassify_block(corpus, i)
+                f.write(f"S {source}\n")
+                f.writelines(edit.to_line() + "\n" for edit in new_edits)
+                if blank_line:
+                    f.write("\n")
+                writer.add_block(source, corpus.analysis(i), new_edits, corpus.features(i))
+                for old, new in zip(old_edits, new_edits):
+                    total += 1
+                    if old.cat != new.cat:
+                        changes[(old.cat, new.cat)] += 1
+    except BaseException:
+        writer.abort()
+        raise
+    # 旁路文件映射关闭后再替换（Windows下不能替换正在映射的文件）
+    os.replace(tmp_path, output_path)
+    writer.close(output_path)
+    return changes, total
+
+
+def report(changes, total, output_path):
+    changed = sum(changes.values())
+    ratio = changed / total * 100 if total else 0.0
+    print(f"重新分类 {total} 条编辑，类别变化 {changed} 条（{ratio:.2f}%）")
+    for (old, new), count in changes.most_common(TOP_CHANGES):
+        print(f"  {old} -> {new}: {count}")
+    print(f"输出文件：{output_path}")
+
+# ===================== 3. 各分类层 =====================
+def reclassify_en(m2_path, output_path=None):
+    """只重跑run_annotate.classify_edit（读取旁路文件中保存的对齐词/词性/词元）"""
+    import run_annotate
+    from edit_rules import EditRuleEngine
+    engine = EditRuleEngine()
+
+    def reclassify_block(corpus, i):
+        new_edits = []
+        for edit, feature in zip(corpus.edits(i), corpus.features(i)):
+            cat = edit.cat
+            if feature is not None:
+                try:
+                    cat = run_annotate.classify_edit(feature, None, None, engine)
+                except Exception as e:
+                    print(f"句子{i + 1}分类出错（保留原类别）: {str(e)}")
+            new_edits.append(Edit(edit.span, cat, edit.cor, edit.extra))
+        return new_edits
+
+    changes, total = rewrite_m2(m2_path, output_path, reclassify_block, blank_line=False)
+    print(engine.summary())
+    report(changes, total, output_path or m2_path)
+
+
+def reclassify_zh(m2_path, output_path=None):
+    """只重跑ZH_ERROR_RULES规则匹配（读取旁路文件中保存的容错分词结果，不加载Stanza）"""
+    from zh_error_classifier import ZHErrorClassifier
+    classifier = ZHErrorClassifier(pretokenized=True)
+
+    def reclassify_block(corpus, i):
+        edits = corpus.edits(i)
+        fine_types = classifier.classify_blocks([edits], [corpus.tokens(i)])[0]
+        return [Edit(edit.span, fine_type, edit.cor,
+                     (edit.extra[0], edit.extra[1], classifier.get_error_desc(fine_type)) + edit.extra[3:])
+                if len(edit.extra) >= 3 else Edit(edit.span, fine_type, edit.cor, edit.extra)
+                for edit, fine_type in zip(edits, fine_types)]
+
+    changes, total = rewrite_m2(m2_path, output_path, reclassify_block, blank_line=True)
+    report(changes, total, output_path or m2_path)
+
+
+def reclassify_fine(coarse_m2, fine_m2):
+    """只重跑m2_postprocess.get_fine_grain_type（读取粗粒度文件旁路文件中的分词和编辑）"""
+    import m2_postprocess
+    corpus = open_sidecar(coarse_m2)
+    corpus.close()
+    m2_postprocess.postprocess_from_sidecar(coarse_m2, fine_m2, sidecar_path_for(coarse_m2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="规则修改后只重跑分类层：读取预分析旁路文件中保存的特征，重写M2的类别字段（不重新分词/对齐）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("en", help="重跑classify_edit（需run_annotate.py --sidecar的输出）")
+    p.add_argument("m2_file")
+    p.add_argument("-o", "--output", help="输出M2文件（默认原地改写）")
+    p = sub.add_parser("fine", help="重跑get_fine_grain_type（需run_annotate.py --sidecar的粗粒度输出）")
+    p.add_argument("coarse_m2")
+    p.add_argument("fine_m2")
+    p = sub.add_parser("zh", help="重跑ZH_ERROR_RULES（需zh_postprocess.py --write-sidecar的输出）")
+    p.add_argument("m2_file")
+    p.add_argument("-o", "--output", help="输出M2文件（默认原地改写）")
+    args = parser.parse_args(argv)
+
+    if args.command == "en":
+        reclassify_en(args.m2_file, args.output)
+    elif args.command == "zh":
+        reclassify_zh(args.m2_file, args.output)
+    elif args.command == "fine":
+        reclassify_fine(args.coarse_m2, args.fine_m2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import sys
 import os
-import stanza
+import argparse
+from collections import deque
+from m2_reader import apply_edits, iter_batches, iter_m2_blocks, parse_edit_line
+from analysis_cache import AnalysisCache, DedupMemo, doc_to_analysis
+from token_store import from_analysis, from_whitespace
+from analyzed_corpus import AnalyzedCorpusWriter, sidecar_path_for, to_analysis
+from daemon_client import DEFAULT_ADDRESS, reject_unsupported_options, remote_process
+from checkpoint import CHECKPOINT_EVERY, Checkpoint
+from m2_index import M2Index, parse_shard_spec
+from edit_rules import DEFAULT_ENGINE
+from token_align import TokenAligner
+from pipeline import QUEUE_SIZE, LockedPipeline, Pipeline
+from profiling import PROFILER, add_profile_arguments, profile_session
+from metrics import MetricsExporter, add_metrics_arguments, edit_categories
 
 # ===================== 1. 环境配置 =====================
 # 确保jp_errant模块可导入
@@ -10,8 +23,16 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "jp_errant"))
 # 适配Lang8数据集（修改输入/输出文件名）
 INPUT_FILE = "docs/data/GEC_European_Datasets/English/A.train.gold.bea19.m2"
 OUTPUT_FILE = "docs/data/GEC_European_Datasets/English/A_annotated.m2"  
+# 每批送入Stanza的句子块数（1表示逐句处理）
+BATCH_SIZE = 32
+# 多进程模式下每个分片的句子块数
+SHARD_SIZE = 256
 # Stanza模型路径（本地缓存）
 STANZA_MODEL_DIR = "./stanza_models"
+# Stanza处理器组合（预分词模式下去掉tokenize的神经模型和mwt）
+STANZA_PROCESSORS = "tokenize,pos,lemma,mwt"
+# 对齐后端：jp_errant（annotator.align后逐位置比较）/ rapidfuzz（Levenshtein编辑操作，输出真实的插入/删除span）
+ALIGNERS = ("jp_errant", "rapidfuzz")
 # 支持的错误类型
 ERROR_TYPES = {
     "ART": "冠词错误",
@@ -32,21 +53,26 @@ ERROR_TYPES = {
 }
 
 # ===================== 3. 初始化Stanza（离线模式） =====================
-def init_stanza():
-    """初始化Stanza处理器（优先读取本地模型，无外网依赖）"""
+def init_stanza(pretokenized=False):
+    """
+    初始化Stanza处理器（优先读取本地模型，无外网依赖）
+    :param pretokenized: 信任M2 S行的空格分词，跳过tokenize/mwt神经模型，只做词性和词形还原
+    """
     print("初始化Stanza模型（离线模式）...")
     try:
+        import stanza
         # 强制使用本地模型，禁用任何下载，通过logging_level控制日志
         nlp = stanza.Pipeline(
             lang="en",
             dir=STANZA_MODEL_DIR,
-            processors="tokenize,pos,lemma,mwt",
+            processors="tokenize,pos,lemma" if pretokenized else STANZA_PROCESSORS,
+            tokenize_pretokenized=pretokenized,
             use_gpu=False,
             download_method=None,
             verbose=False,
             logging_level="ERROR"  # 直接通过Pipeline参数关闭日志
         )
-        print("Stanza模型加载成功！")
+        print("Stanza模型加载成功！" + ("（预分词模式）" if pretokenized else ""))
         return nlp
     except Exception as e:
         print(f"Stanza加载失败: {str(e)}")
@@ -54,11 +80,13 @@ def init_stanza():
         return None
 
 # ===================== 4. 精准分词函数（Stanza） =====================
-def tokenize_sent(nlp, sent_str):
+def tokenize_sent(nlp, sent_str, analysis=None, cache=None):
     """
     使用Stanza进行精准分词，生成JP-Errant要求的结构化对象
     :param nlp: Stanza Pipeline对象
     :param sent_str: 待分词的句子字符串
+    :param analysis: 已（批量）分析好的结果，传入时不再调用nlp
+    :param cache: AnalysisCache分析缓存（可选）
     :return: 包含text/lemma/pos属性的分词对象
     """
     if not sent_str:
@@ -67,234 +95,553 @@ def tokenize_sent(nlp, sent_str):
     # 方案1：Stanza精准分词（优先）
     if nlp is not None:
         try:
-            doc = nlp(sent_str)
-            # 构造JP-Errant兼容的对象结构
-            class WordObj:
-                def __init__(self, word):
-                    self.text = word.text
-                    self.lemma = word.lemma
-                    self.pos = word.upos  # 通用词性标注（UPOS）
-                    self.idx = word.id    # 单词在句子中的位置
-
-            class SentenceObj:
-                def __init__(self, words):
-                    self.words = words
-
-            class TokenizedObj:
-                def __init__(self, sentences):
-                    self.sentences = sentences
-
-            # 提取Stanza分词结果
-            sentences = []
-            for sent in doc.sentences:
-                words = [WordObj(word) for word in sent.words]
-                sentences.append(SentenceObj(words))
-            return TokenizedObj(sentences)
+            if analysis is None and cache is not None:
+                analysis = cache.get(sent_str)
+            if analysis is None:
+                analysis = doc_to_analysis(nlp(sent_str))
+                if cache is not None:
+                    cache.put(sent_str, analysis)
+            # 构造JP-Errant兼容的对象结构（token_store中的紧凑类型）
+            return from_analysis(analysis)
         except Exception as e:
             print(f"Stanza分词失败: {str(e)}")
 
     # 方案2：降级为空格分词（兜底）
-    class WordObj:
-        def __init__(self, text, idx):
-            self.text = text
-            self.lemma = text.lower()
-            self.pos = "UNK"
-            self.idx = idx
+    return from_whitespace(sent_str)
 
-    class SentenceObj:
-        def __init__(self, words):
-            self.words = words
+def analyze_batch(nlp, texts, cache=None, dedup=None):
+    """
+    批量分词：一次调用Stanza处理多个句子（提高短句的推理吞吐）
+    :param nlp: Stanza Pipeline对象
+    :param texts: 待分词的句子字符串列表（可以有重复，重复句子只分析一次）
+    :param cache: AnalysisCache分析缓存（可选），命中的句子不再送入Stanza
+    :param dedup: DedupMemo句子去重表（可选），跨批复用重复句子的分析结果
+    :return: 与texts一一对应的分词对象列表
+    """
+    if nlp is None:
+        return [tokenize_sent(nlp, text) for text in texts]
 
-    class TokenizedObj:
-        def __init__(self, sentences):
-            self.sentences = sentences
+    non_empty = [text for text in dict.fromkeys(texts) if text]
+    analyses = dedup.get_many(non_empty) if dedup is not None else {}
+    if cache is not None:
+        analyses.update(cache.get_many([text for text in non_empty if text not in analyses]))
+    todo = [text for text in non_empty if text not in analyses]
+    if dedup is not None:
+        dedup.record(sum(1 for text in texts if text), len(todo))
+    computed = {}
+    if len(todo) > 1:
+        try:
+            from stanza import Document
+            docs = nlp.bulk_process([Document([], text=text) for text in todo])
+        except Exception as e:
+            print(f"Stanza批量分词失败: {str(e)}，改为逐句分词")
+        else:
+            computed = {text: doc_to_analysis(doc) for text, doc in zip(todo, docs)}
+    elif todo:
+        try:
+            computed = {todo[0]: doc_to_analysis(nlp(todo[0]))}
+        except Exception:
+            pass  # 交给tokenize_sent逐句分析（失败时降级为空格分词）
+    if computed:
+        if cache is not None:
+            cache.put_many(computed)
+        analyses.update(computed)
+    if dedup is not None:
+        dedup.put_many(analyses)
 
-    word_list = sent_str.split()
-    words = [WordObj(word, idx+1) for idx, word in enumerate(word_list)]
-    return TokenizedObj([SentenceObj(words)])
+    return [tokenize_sent(nlp, text, analysis=analyses.get(text), cache=cache) for text in texts]
 
 # ===================== 5. 核心：错误分类规则 =====================
-def classify_edit(edit, orig_sent, cor_sent):
+# 规则表与决策缓存见edit_rules.EditRuleEngine（规则顺序：ART > PREP > VERB > MORPH > SYNTAX > 词性 > OTHER）
+def classify_edit(edit, orig_sent, cor_sent, engine=DEFAULT_ENGINE):
     """
     对编辑对象进行精准错误分类
     :param edit: 包含原始/修正单词的编辑对象
     :param orig_sent: 原始句分词对象
     :param cor_sent: 修正句分词对象
+    :param engine: 规则引擎（默认使用进程内共享的引擎及其决策缓存）
     :return: 错误类型（如ART/PREP/VERB）
     """
-    # 提取编辑核心特征
-    orig_toks = edit.get("orig_toks", [])
-    cor_toks = edit.get("cor_toks", [])
-    orig_text = " ".join([tok.text.lower() for tok in orig_toks]) if orig_toks else ""
-    cor_text = " ".join([tok.text.lower() for tok in cor_toks]) if cor_toks else ""
-    orig_pos = [tok.pos for tok in orig_toks] if orig_toks else []
-    cor_pos = [tok.pos for tok in cor_toks] if cor_toks else []
-    orig_lemma = [tok.lemma.lower() for tok in orig_toks] if orig_toks else []
-    cor_lemma = [tok.lemma.lower() for tok in cor_toks] if cor_toks else []
-
-    # 规则1：冠词错误（ART）- 限定词（DET）+ 冠词词汇
-    art_words = {"a", "an", "the"}
-    if (orig_text in art_words or cor_text in art_words) and \
-       any(pos == "DET" for pos in orig_pos + cor_pos):
-        return "ART"
-
-    # 规则2：介词错误（PREP）- 介词（ADP）+ 介词词汇
-    prep_words = {"in", "on", "at", "by", "with", "for", "to", "from", "into", "onto"}
-    if (orig_text in prep_words or cor_text in prep_words) and \
-       any(pos == "ADP" for pos in orig_pos + cor_pos):
-        return "PREP"
-
-    # 规则3：动词错误（VERB）- 动词/助动词（VERB/AUX）
-    if any(pos in ["VERB", "AUX"] for pos in orig_pos + cor_pos):
-        # 子规则：时态错误
-        tense_words = {"is", "are", "was", "were", "has", "have", "had"}
-        if orig_text in tense_words or cor_text in tense_words:
-            return "VERB:TENSE"
-        # 子规则：形式错误
-        form_words = {"do", "does", "did", "doing", "done", "go", "goes", "went", "gone"}
-        if orig_text in form_words or cor_text in form_words:
-            return "VERB:FORM"
-        # 通用动词错误
-        return "VERB"
-
-    # 规则4：形态错误（MORPH）- 词形不同但词性相同
-    if orig_lemma != cor_lemma and orig_pos == cor_pos:
-        return "MORPH"
-
-    # 规则5：句法错误（SYNTAX）- 位置变化但词汇相同
-    if orig_text == cor_text and edit.get("o_start") != edit.get("c_start"):
-        return "SYNTAX"
-
-    # 规则6：按词性匹配其他类型
-    pos_map = {
-        "NOUN": ["NOUN"],
-        "ADJ": ["ADJ"],
-        "ADV": ["ADV"],
-        "PRON": ["PRON"],
-        "CONJ": ["CCONJ", "SCONJ"],
-        "NUM": ["NUM"],
-        "PUNCT": ["PUNCT"]
-    }
-    for err_type, pos_list in pos_map.items():
-        if any(pos in pos_list for pos in orig_pos + cor_pos):
-            return err_type
-
-    # 规则7：未匹配到的归为OTHER
-    return "OTHER"
+    return engine.classify(edit)
 
 # ===================== 6. 处理M2文件（完整流程） =====================
-def process_m2_file(nlp, annotator):
-    """处理M2文件，生成带精准错误分类的标注结果"""
-    print(f"开始处理M2文件: {INPUT_FILE}")
+def positional_edits(annotator, current_source, current_cor):
+    """jp_errant对齐：annotator.align后逐位置比较，只处理有差异的位置"""
+    alignment = annotator.align(current_source, current_cor)
+    edits = []
+    for idx in range(min(len(alignment.orig), len(alignment.cor))):
+        orig_tok = alignment.orig[idx]
+        cor_tok = alignment.cor[idx]
+        if orig_tok.text != cor_tok.text:
+            edits.append({
+                "o_start": idx,
+                "o_end": idx + 1,
+                "c_start": idx,
+                "c_end": idx + 1,
+                "orig_toks": [orig_tok],
+                "cor_toks": [cor_tok]
+            })
+    return edits
+
+def classified_edits(annotator, current_source, current_cor, engine=DEFAULT_ENGINE):
+    """
+    对齐原始句和修正句并分类，返回 [(编辑对象, 错误类型), ...]
+    :param annotator: JP-Errant标注器，或token_align.TokenAligner（rapidfuzz对齐后端）
+    :param current_source: 原始句分词对象
+    :param current_cor: 修正句分词对象
+    :param engine: 错误分类规则引擎
+    """
+    length = sum(len(sent.words) for sent in current_source.sentences) if PROFILER.enabled else None
+
+    # 1. 对齐原始句和修正句，生成编辑对象
+    with PROFILER.stage("align", length=length):
+        if isinstance(annotator, TokenAligner):
+            edits = annotator.edits(current_source, current_cor)
+        else:
+            edits = positional_edits(annotator, current_source, current_cor)
+
+    # 2. 整句编辑一次性分类
+    with PROFILER.stage("classify", len(edits), length):
+        err_types = engine.classify_batch(edits)
+    return list(zip(edits, err_types))
+
+def format_edit_line(edit, err_type):
+    """生成标准M2格式的A行（删除编辑的修正文本为空）"""
+    return (
+        f"A {edit['o_start']} {edit['o_end']}|||"
+        f"{err_type}|||"
+        f"{' '.join(tok.text for tok in edit['cor_toks'])}|||"
+        f"JP_Errant|||REQUIRED|||-NONE-|||0\n"
+    )
+
+def iter_edit_lines(annotator, current_source, current_cor, engine=DEFAULT_ENGINE):
+    """对齐原始句和修正句，逐条产出标准M2格式的A行"""
+    for edit, err_type in classified_edits(annotator, current_source, current_cor, engine):
+        yield format_edit_line(edit, err_type)
+
+def correction_texts(block, annotator=None):
+    """
+    句子块的候选修正文本（按顺序尝试，第一条成功对齐的生成该句的标注）
+    jp_errant：各A行的修正片段；rapidfuzz：各标注者的完整修正句（把该标注者的全部编辑应用到原始句），
+    因为rapidfuzz对齐整句对整句，拿片段对齐会把几乎整句标成一条删除/替换
+    """
+    if isinstance(annotator, TokenAligner):
+        tokens = block.source.split()
+        return (" ".join(apply_edits(tokens, edits)) for edits in block.by_annotator().values())
+    return (m2_edit.cor for m2_edit in block.edits if m2_edit.cor)
+
+def block_texts(block, annotator=None):
+    """句子块需要分析的句子：原始句 + 第一条候选修正文本"""
+    yield block.source
+    first_cor = next((text for text in correction_texts(block, annotator) if text), None)
+    if first_cor:
+        yield first_cor
+
+def analyze_blocks(nlp, blocks, cache=None, dedup=None, annotator=None):
+    """
+    批量分析一组句子块：每块的原始句 + 第一条候选修正文本一起送入Stanza
+    :param dedup: DedupMemo句子去重表（可选）
+    :param annotator: 对齐后端（决定候选修正文本是A行片段还是完整修正句，见correction_texts）
+    :return: {句子字符串: 分词对象}
+    """
+    texts = [text for block in blocks for text in block_texts(block, annotator)]
+    with PROFILER.stage("analysis", len(texts)):
+        return dict(zip(texts, analyze_batch(nlp, texts, cache, dedup)))
+
+def annotate_block(nlp, annotator, block, analyses=None, cache=None, features=None):
+    """
+    生成一个句子块的输出行
+    :param block: M2Block句子块
+    :param analyses: 预先批量分析的 {句子字符串: 分词对象}，缺失的句子按需逐句分析
+    :param cache: AnalysisCache分析缓存（可选）
+    :param features: 传入列表时依次追加每条输出A行的编辑对象（对齐特征，供预分析旁路文件保存）
+    :return: (输出行列表, 标注错误数)
+    """
+    analyses = analyses or {}
+
+    def lookup(text):
+        if text in analyses:
+            return analyses[text]
+        return tokenize_sent(nlp, text, cache=cache)
+
+    # 原始S行
+    lines = [f"S {block.source}\n"]
+    error_count = 0
+    current_source = lookup(block.source)
+    if not current_source:
+        return lines, error_count
+
+    # 依次尝试各条候选修正文本，第一条成功对齐的生成该句的标注
+    for cor_text in correction_texts(block, annotator):
+        if not cor_text:
+            continue
+        current_cor = lookup(cor_text)
+        if not current_cor:
+            continue
+
+        try:
+            edit_lines = [(format_edit_line(edit, err_type), edit)
+                          for edit, err_type in classified_edits(annotator, current_source, current_cor)]
+        except Exception as e:
+            print(f"句子{block.index + 1}处理出错: {str(e)}")
+            continue
+        for a_line, edit in edit_lines:
+            error_count += 1
+            lines.append(a_line)
+            if features is not None:
+                features.append(edit)
+        break
+    return lines, error_count
+
+def annotate_batch(nlp, annotator, batch, analyses, cache=None):
+    """标注一批句子块，返回 [(句子块, 输出行列表, 标注错误数, 原始句分词对象, 各A行的对齐特征), ...]"""
+    results = []
+    for block in batch:
+        features = []
+        lines, block_errors = annotate_block(nlp, annotator, block, analyses, cache, features)
+        results.append((block, lines, block_errors, analyses.get(block.source), features))
+    return results
+
+def open_output(checkpoint=None, resume=False, block_range=None):
+    """
+    打开输出文件，返回 (文件对象, 输入起始偏移, 起始块序号, 已处理块数, 已标注错误数)
+    续跑时从检查点记录的位置继续，并截掉检查点之后的残缺输出
+    :param block_range: 只处理输入文件的一段 (起始字节偏移, 结束字节偏移, 起始块序号)
+    """
+    start_offset, _, first_index = block_range or (0, None, 0)
+    if checkpoint is None:
+        return open(OUTPUT_FILE, "w", encoding="utf-8"), start_offset, first_index, 0, 0
+    state = checkpoint.state
+    if not resume:
+        return checkpoint.open_output(False), start_offset, first_index, 0, 0
+    print(f"从检查点续跑：已完成 {state['block_count']} 个句子，输入偏移 {state['input_offset']} 字节")
+    return (checkpoint.open_output(True), state["input_offset"], state["next_index"],
+            state["block_count"], state["error_count"])
+
+def process_m2_file(nlp, annotator, batch_size=BATCH_SIZE, cache=None, checkpoint=None, resume=False,
+                    block_range=None, pipeline=False, queue_size=QUEUE_SIZE, dedup=False, sidecar=False,
+                    metrics=None):
+    """
+    处理M2文件，生成带精准错误分类的标注结果
+    :param batch_size: 每次送入Stanza的句子块数（输出仍按原顺序写入）
+    :param cache: AnalysisCache分析缓存（可选）
+    :param checkpoint: Checkpoint断点记录（可选），定期记录已完成的输入/输出偏移
+    :param resume: 是否从checkpoint已加载的断点继续
+    :param block_range: 只处理输入文件的一段 (起始字节偏移, 结束字节偏移, 起始块序号)，见m2_index
+    :param pipeline: 读取 → Stanza分析 → 对齐分类 → 写出 分阶段在不同线程中重叠执行
+    :param queue_size: 流水线相邻阶段之间最多缓冲的批数
+    :param dedup: 先扫描整个文件找出重复句子，重复句子只送入Stanza一次
+    :param sidecar: 同时写出预分析旁路文件（输出文件名+.ana），供后处理/统计直接读取（不支持续跑）
+    :param metrics: MetricsExporter运行指标（可选），每写出一个句子块记录一次
+    """
+    print(f"开始处理M2文件: {INPUT_FILE}" + ("（流水线模式）" if pipeline else ""))
     print("支持的错误类型：" + ", ".join(ERROR_TYPES.keys()))
     
-    with open(INPUT_FILE, "r", encoding="utf-8") as f_in, \
-         open(OUTPUT_FILE, "w", encoding="utf-8") as f_out:
-        
-        current_source = None
-        current_source_str = ""
-        line_count = 0
-        error_count = 0
-
-        for line in f_in:
-            line = line.strip()
-            line_count += 1
-
-            # 打印进度（每200行）
-            if line_count % 200 == 0:
-                print(f"已处理 {line_count} 行，已标注 {error_count} 个错误")
-
-            # 处理S行（原始错误句）
-            if line.startswith("S "):
-                current_source_str = line[2:]
-                current_source = tokenize_sent(nlp, current_source_str)
-                # 写入原始S行
-                f_out.write(f"{line}\n")
-                continue
-
-            # 处理A行（修正信息）
-            if line.startswith("A ") and current_source:
-                a_parts = line.split("|||")
-                if len(a_parts) < 3:
-                    continue
-                
-                # 提取修正句
-                current_cor_str = a_parts[2]
-                current_cor = tokenize_sent(nlp, current_cor_str)
-                if not current_cor:
-                    continue
-
-                try:
-                    # 1. 对齐原始句和修正句
-                    alignment = annotator.align(current_source, current_cor)
-                    
-                    # 2. 遍历对齐结果，生成编辑对象
-                    for idx in range(min(len(alignment.orig), len(alignment.cor))):
-                        orig_tok = alignment.orig[idx]
-                        cor_tok = alignment.cor[idx]
-                        
-                        # 只处理有差异的编辑
-                        if orig_tok.text != cor_tok.text:
-                            # 构造编辑对象
-                            edit = {
-                                "o_start": idx,
-                                "o_end": idx + 1,
-                                "c_start": idx,
-                                "c_end": idx + 1,
-                                "orig_toks": [orig_tok],
-                                "cor_toks": [cor_tok]
-                            }
-                            
-                            # 3. 精准分类错误类型
-                            err_type = classify_edit(edit, current_source, current_cor)
-                            error_count += 1
-                            
-                            # 4. 写入标准M2格式的A行
-                            a_line = (
-                                f"A {edit['o_start']} {edit['o_end']}|||"
-                                f"{err_type}|||"
-                                f"{cor_tok.text}|||"
-                                f"JP_Errant|||REQUIRED|||-NONE-|||0\n"
-                            )
-                            f_out.write(a_line)
-                except Exception as e:
-                    print(f"行{line_count}处理出错: {str(e)}")
-                    continue
-                
-                # 重置当前句
-                current_source = None
+    f_out, start_offset, first_index, block_count, error_count = open_output(checkpoint, resume, block_range)
+    writer = AnalyzedCorpusWriter(sidecar_path_for(OUTPUT_FILE)) if sidecar else None
+    if metrics is not None:
+        metrics.begin(start_offset)
+    with f_out:
+        end_offset = block_range[1] if block_range else None
+
+        def read_blocks():
+            return iter_m2_blocks(INPUT_FILE, start=start_offset, end=end_offset, first_index=first_index)
 
+        memo = None
+        if dedup and nlp is not None:
+            memo = DedupMemo()
+            total, unique = memo.scan(text for block in read_blocks() for text in block_texts(block, annotator))
+            print(f"去重预扫描：{total} 次句子出现，{unique} 个不同句子，其中 {len(memo.repeated)} 个重复出现")
+
+        batches = iter_batches(PROFILER.timed_iter("read", read_blocks()), batch_size)
+        if pipeline:
+            # 分析阶段与对齐分类阶段都可能调用Stanza（后者按需补充分析），经同一把锁串行
+            nlp = LockedPipeline(nlp) if nlp is not None else None
+            results = Pipeline(batches, [
+                lambda batch: (batch, analyze_blocks(nlp, batch, cache, memo, annotator)),
+                lambda item: annotate_batch(nlp, annotator, *item, cache),
+            ], queue_size)
+            if metrics is not None:
+                metrics.queue_depths = results.depths
+        else:
+            results = (annotate_batch(nlp, annotator, batch, analyze_blocks(nlp, batch, cache, memo, annotator), cache)
+                       for batch in batches)
+
+        for annotated in results:
+            for block, lines, block_errors, source_tokens, features in annotated:
+                block_count += 1
+
+                # 打印进度（每200个句子）
+                if block_count % 200 == 0:
+                    print(f"已处理 {block_count} 个句子，已标注 {error_count} 个错误")
+
+                with PROFILER.stage("write"):
+                    f_out.writelines(lines)
+                    if writer is not None:
+                        writer.add_block(block.source, to_analysis(source_tokens),
+                                         [parse_edit_line(line.strip()) for line in lines[1:]], features)
+                    if checkpoint is not None:
+                        checkpoint.update(f_out, block.end_offset, block.index + 1, block_count,
+                                          error_count + block_errors)
+                error_count += block_errors
+                PROFILER.count("sentences")
+                PROFILER.count("edits", block_errors)
+                if metrics is not None:
+                    metrics.record(1, edit_categories(lines), block.end_offset)
+
+    if writer is not None:
+        writer.close(OUTPUT_FILE)
+        print(f"预分析旁路文件：{writer.path}")
+    if checkpoint is not None:
+        checkpoint.remove()
+    if metrics is not None:
+        metrics.finish()
     # 输出统计信息
     print("\n处理完成！")
-    print(f"总计处理行数：{line_count}")
+    print(f"总计处理句子数：{block_count}")
     print(f"总计标注错误：{error_count}")
     print(f"输出文件：{OUTPUT_FILE}")
+    print(DEFAULT_ENGINE.summary())
+    if memo is not None:
+        print(memo.summary())
+    if cache is not None:
+        print(cache.summary())
+
+# ===================== 7. 多进程分片标注 =====================
+# 工作进程内的Stanza/标注器/缓存
+# 父进程先加载好Stanza和标注器再fork，子进程通过写时复制共享模型权重
+_worker_state = {}
+
+def _init_worker(pretokenized, cache_dir):
+    """工作进程初始化：只打开本进程自己的缓存连接（SQLite连接不能跨fork共享）"""
+    # fork时复制来的父进程计时数据不属于本进程，清空后逐分片上报
+    PROFILER.drain()
+    _worker_state["cache"] = AnalysisCache(cache_dir, "en", STANZA_PROCESSORS, pretokenized) if cache_dir else None
+
+def _annotate_shard(blocks):
+    """
+    工作进程：标注一个按块对齐的分片
+    单个句子块出错只影响该块（只写出S行并记录失败），不影响分片内其他块
+    :return: (输出文本, 句子块数, 标注错误数, 失败信息列表, 计时统计（未开启计时时为None）)
+    """
+    nlp = _worker_state["nlp"]
+    annotator = _worker_state["annotator"]
+    cache = _worker_state["cache"]
+    out_lines = []
+    error_count = 0
+    failures = []
+    for batch in iter_batches(blocks, _worker_state["batch_size"]):
+        try:
+            analyses = analyze_blocks(nlp, batch, cache, annotator=annotator)
+        except Exception:
+            analyses = {}
+        for block in batch:
+            try:
+                lines, block_errors = annotate_block(nlp, annotator, block, analyses, cache)
+            except Exception as e:
+                lines, block_errors = [f"S {block.source}\n"], 0
+                failures.append(f"句子{block.index + 1}: {str(e)}")
+            out_lines.extend(lines)
+            error_count += block_errors
+    PROFILER.count("sentences", len(blocks))
+    PROFILER.count("edits", error_count)
+    return "".join(out_lines), len(blocks), error_count, failures, PROFILER.drain() if PROFILER.enabled else None
+
+def process_m2_file_parallel(nlp, annotator, workers, batch_size=BATCH_SIZE, shard_size=SHARD_SIZE,
+                             pretokenized=False, cache_dir=None, torch_threads=None,
+                             checkpoint=None, resume=False, block_range=None, metrics=None):
+    """
+    多进程处理M2文件：按句子块切分成分片，由fork出的工作进程并行标注
+    结果流式返回，并按输入顺序写出
+    :param nlp: 父进程已加载的Stanza Pipeline（子进程共享其权重页，父进程在fork前不应做推理）
+    :param annotator: 父进程已初始化的JP-Errant标注器
+    :param workers: 工作进程数
+    :param shard_size: 每个分片的句子块数
+    :param torch_threads: 每个工作进程的torch线程数（默认按CPU核数均分）
+    :param checkpoint: Checkpoint断点记录（可选），按分片写出顺序记录进度
+    :param resume: 是否从checkpoint已加载的断点继续
+    :param block_range: 只处理输入文件的一段 (起始字节偏移, 结束字节偏移, 起始块序号)，见m2_index
+    :param metrics: MetricsExporter运行指标（可选），每写出一个分片记录一次，队列深度为在途分片数
+    """
+    from worker_pool import fork_pool
+    print(f"开始处理M2文件: {INPUT_FILE}（{workers}个工作进程）")
+    print("支持的错误类型：" + ", ".join(ERROR_TYPES.keys()))
+    _worker_state.update(nlp=nlp, annotator=annotator, batch_size=batch_size)
+
+    failed_count = 0
+    f_out, start_offset, first_index, block_count, error_count = open_output(checkpoint, resume, block_range)
+    if metrics is not None:
+        metrics.begin(start_offset)
+
+    def write_result(future, end_offset, next_index):
+        nonlocal block_count, error_count, failed_count
+        text, n_blocks, n_errors, failures, timings = future.result()
+        if timings is not None:
+            PROFILER.merge(timings)
+        with PROFILER.stage("write"):
+            f_out.write(text)
+        block_count += n_blocks
+        error_count += n_errors
+        failed_count += len(failures)
+        for failure in failures:
+            print(f"处理出错（已跳过）: {failure}")
+        print(f"已处理 {block_count} 个句子，已标注 {error_count} 个错误")
+        if checkpoint is not None:
+            checkpoint.update(f_out, end_offset, next_index, block_count, error_count)
+        if metrics is not None:
+            metrics.record(n_blocks, edit_categories(text.splitlines()), end_offset)
+
+    with fork_pool(workers, initializer=_init_worker, initargs=(pretokenized, cache_dir),
+                   torch_threads=torch_threads) as pool, f_out:
+        # 最多保留 workers*2 个在途分片，既让进程保持忙碌，又限制内存
+        pending = deque()
+        if metrics is not None:
+            metrics.queue_depths = lambda: [len(pending)]
+        end_offset = block_range[1] if block_range else None
+        blocks = iter_m2_blocks(INPUT_FILE, start=start_offset, end=end_offset, first_index=first_index)
+        for shard in iter_batches(PROFILER.timed_iter("read", blocks), shard_size):
+            pending.append((pool.submit(_annotate_shard, shard), shard[-1].end_offset, shard[-1].index + 1))
+            if len(pending) >= workers * 2:
+                write_result(*pending.popleft())
+        while pending:
+            write_result(*pending.popleft())
+
+    if checkpoint is not None:
+        checkpoint.remove()
+    if metrics is not None:
+        metrics.finish()
+
+    # 输出统计信息
+    print("\n处理完成！")
+    print(f"总计处理句子数：{block_count}")
+    print(f"总计标注错误：{error_count}")
+    if failed_count:
+        print(f"处理失败的句子数：{failed_count}")
+    print(f"输出文件：{OUTPUT_FILE}")
+
+# ===================== 8. 主函数 =====================
+def main(argv=None):
+    global INPUT_FILE, OUTPUT_FILE
+    parser = argparse.ArgumentParser(description="JP-Errant英文M2文件错误标注")
+    parser.add_argument("--input", default=INPUT_FILE, help="输入M2文件路径")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="输出M2文件路径")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批送入Stanza的句子块数")
+    parser.add_argument("--pretokenized", action="store_true", help="信任M2的空格分词，跳过Stanza的tokenize/mwt")
+    parser.add_argument("--cache", help="Stanza分析结果的持久化缓存目录（可选）")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数（大于1时按句子块分片并行标注）")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="多进程模式下每个分片的句子块数")
+    parser.add_argument("--torch-threads", type=int, help="多进程模式下每个工作进程的torch线程数（默认按CPU核数均分）")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_ADDRESS, help="客户端模式：交给常驻守护进程标注（可指定套接字地址）")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="每处理多少个句子写一次检查点（0表示不写检查点）")
+    parser.add_argument("--resume", action="store_true", help="从上次中断时的检查点继续标注")
+    parser.add_argument("--aligner", choices=ALIGNERS, default="jp_errant",
+                        help="对齐后端：jp_errant（默认）或rapidfuzz（输出真实的插入/删除/替换span）")
+    parser.add_argument("--pipeline", action="store_true", help="读取/分析/分类/写出分阶段在不同线程中重叠执行")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="流水线阶段之间最多缓冲的批数")
+    parser.add_argument("--dedup", action="store_true", help="先扫描整个文件找出重复句子，重复句子只送入Stanza一次")
+    parser.add_argument("--sidecar", action="store_true",
+                        help="同时写出预分析旁路文件（输出文件名+.ana，含每条编辑的对齐特征），"
+                             "m2_postprocess/stat_fine_types/compare可直接读取，reclassify.py可只重跑分类")
+    add_profile_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--shard", help="只标注输入文件的第K个分片（共N个，按字节均分、块对齐），格式K/N")
+    args = parser.parse_args(argv)
+    if args.daemon:
+        reject_unsupported_options(parser, args, ("input", "output", "pretokenized", "aligner"))
+    INPUT_FILE = args.input
+    OUTPUT_FILE = args.output
+
+    # 分片模式：借助块偏移索引直接定位分片的字节范围（索引缺失或过期时自动重建）
+    block_range = None
+    if args.shard:
+        k, n = parse_shard_spec(args.shard)
+        with M2Index.open(INPUT_FILE) as index:
+            shards = index.plan_shards(n)
+        first, stop, start, end = shards[k] if k < len(shards) else (0, 0, 0, 0)
+        block_range = (start, end, first)
+        print(f"分片 {k}/{n}：句子块 {first}-{stop - 1}，字节 {start}-{end}")
 
-# ===================== 7. 主函数 =====================
-if __name__ == "__main__":
     # 1. 安装依赖提示（仅首次运行）
     print("所需依赖：stanza")
     print("安装命令：pip install stanza")
     
-    # 2. 初始化Stanza
-    nlp = init_stanza()
-    
-    # 3. 初始化JP-Errant标注器
-    print("初始化JP-Errant标注器...")
-    try:
-        from jp_errant.annotator import Annotator
-        annotator = Annotator(lang="en")
-        print("JP-Errant标注器初始化成功！")
-    except Exception as e:
-        print(f"JP-Errant初始化失败: {str(e)}")
+    if args.daemon:
+        # 客户端模式：模型常驻在守护进程中，本进程不加载Stanza
+        print(f"客户端模式：交给守护进程 {args.daemon} 标注 {INPUT_FILE}")
+        stats = remote_process("run_annotate", INPUT_FILE, OUTPUT_FILE,
+                               {"pretokenized": args.pretokenized, "aligner": args.aligner}, address=args.daemon)
+        print(f"总计处理句子数：{stats.get('blocks', 0)}")
+        print(f"总计标注错误：{stats.get('edits', 0)}")
+        print(f"输出文件：{OUTPUT_FILE}")
+        sys.exit(0)
+
+    if args.sidecar and (args.resume or args.workers > 1):
+        print("--sidecar 需要完整的单进程运行，不能与 --resume 或 --workers 同时使用")
         sys.exit(1)
+
+    # 检查点：记录已完成的输入/输出偏移，任务正常结束后自动删除
+    checkpoint = None
+    resume = False
+    if args.checkpoint_every > 0 or args.resume:
+        checkpoint = Checkpoint(INPUT_FILE, OUTPUT_FILE, every=args.checkpoint_every or CHECKPOINT_EVERY)
+        if args.resume:
+            try:
+                resume = checkpoint.load()
+            except ValueError as e:
+                print(f"无法续跑: {str(e)}")
+                sys.exit(1)
+            if not resume:
+                print(f"未找到检查点 {checkpoint.path}，从头开始标注")
+
+    # 运行指标：按已处理的输入字节估算进度
+    metrics = None
+    if args.metrics_status or args.metrics_prom:
+        metrics = MetricsExporter("run_annotate", args.metrics_status, args.metrics_prom, args.metrics_interval,
+                                  total_bytes=block_range[1] if block_range else os.path.getsize(INPUT_FILE))
+
+    with profile_session("run_annotate", args.profile, args.profile_trace, args.profile_sample):
+        # 2. 初始化Stanza（多进程模式下也只在父进程加载一次）
+        with PROFILER.stage("init"):
+            nlp = init_stanza(pretokenized=args.pretokenized)
     
-    # 4. 处理M2文件
-    process_m2_file(nlp, annotator)
+        # 3. 初始化JP-Errant标注器（rapidfuzz对齐后端不需要）
+        if args.aligner == "rapidfuzz":
+            print("使用rapidfuzz词级对齐后端")
+            annotator = TokenAligner()
+        else:
+            print("初始化JP-Errant标注器...")
+            try:
+                from jp_errant.annotator import Annotator
+                annotator = Annotator(lang="en")
+                print("JP-Errant标注器初始化成功！")
+            except Exception as e:
+                print(f"JP-Errant初始化失败: {str(e)}")
+                sys.exit(1)
+    
+        # 4. 处理M2文件
+        if args.workers > 1:
+            process_m2_file_parallel(nlp, annotator, args.workers, batch_size=args.batch_size,
+                                     shard_size=args.shard_size, pretokenized=args.pretokenized,
+                                     cache_dir=args.cache, torch_threads=args.torch_threads,
+                                     checkpoint=checkpoint, resume=resume, block_range=block_range,
+                                     metrics=metrics)
+        else:
+            cache = AnalysisCache(args.cache, "en", STANZA_PROCESSORS, args.pretokenized) if args.cache else None
+            process_m2_file(nlp, annotator, batch_size=args.batch_size, cache=cache,
+                            checkpoint=checkpoint, resume=resume, block_range=block_range,
+                            pipeline=args.pipeline, queue_size=args.queue_size, dedup=args.dedup,
+                            sidecar=args.sidecar, metrics=metrics)
+            if cache is not None:
+                cache.close()
     
     # 5. 验证输出文件
     if os.path.exists(OUTPUT_FILE):
         file_size = os.path.getsize(OUTPUT_FILE) / 1024
         print(f"\n验证通过：输出文件大小 {file_size:.2f} KB")
     else:
-        print("\n验证失败：输出文件未生成")
\ No newline at end of file
+        print("\n验证失败：输出文件未生成")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 import os
 import sys
 import argparse
-from typing import List, Tuple, Dict
-import stanza
-from stanza.models.common.doc import Document, Sentence, Token
+from typing import Iterable, Iterator, List, Tuple
+from m2_reader import M2Block, iter_batches, iter_m2_blocks
+from pipeline import QUEUE_SIZE, Pipeline
+from daemon_client import DEFAULT_ADDRESS, reject_unsupported_options, remote_process
+from profiling import PROFILER, add_profile_arguments, profile_session
+from metrics import MetricsExporter, add_metrics_arguments
+from token_store import from_whitespace
 
 # ===================== 还原原有路径配置 =====================
 # 与你原本的路径保持一致
 INPUT_FILE = "docs/data/GEC_European_Datasets/Chinese/zh.train.auto.m2"
 OUTPUT_FILE = "docs/data/GEC_European_Datasets/Chinese/zh_annotated.m2"
 STANZA_MODEL_DIR = "./stanza_models"
+# 流水线模式下每批分析的句子块数
+BATCH_SIZE = 32
 
 # 中文错误类型映射
 ZH_ERROR_TYPES = {
@@ -26,10 +32,11 @@ class JPErrantZH:
         self.nlp = self.init_stanza()
         self.error_count = 0
 
-    def init_stanza(self) -> stanza.Pipeline:
+    def init_stanza(self) -> "stanza.Pipeline":
         """初始化Stanza中文模型（含依赖分析）"""
         print("初始化Stanza中文模型...")
         try:
+            import stanza
             nlp = stanza.Pipeline(
                 lang="zh",
                 dir=STANZA_MODEL_DIR,
@@ -46,109 +53,114 @@ class JPErrantZH:
             print("降级为基础分词模式运行...")
             return None
 
-    def parse_m2_file(self, input_file: str) -> List[Dict]:
-        """解析中文M2格式文件"""
+    def parse_m2_file(self, input_file: str) -> Iterator[M2Block]:
+        """流式解析中文M2格式文件（逐个产出句子块，不整体加载到内存）"""
         if not os.path.exists(input_file):
             raise FileNotFoundError(f"输入文件不存在: {input_file}\n请确认文件路径是否正确，或将数据集文件放到指定路径下")
-        
-        data = []
-        current_sent = None
-        current_edits = []
-        
-        with open(input_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # 处理句子行
-            if line.startswith("S "):
-                if current_sent is not None:
-                    data.append({
-                        "sentence": current_sent,
-                        "edits": current_edits
-                    })
-                current_sent = line[2:]
-                current_edits = []
-            # 处理编辑行
-            elif line.startswith("A "):
-                parts = line[2:].split("|||")
-                if len(parts) >= 3:
-                    span = parts[0].strip()
-                    error_type = parts[1].strip()
-                    correction = parts[2].strip()
-                    current_edits.append({
-                        "span": span,
-                        "error_type": error_type,
-                        "correction": correction,
-                        "meta": parts[3:] if len(parts) > 3 else []
-                    })
-                    self.error_count += 1
-        
-        # 添加最后一个句子
-        if current_sent is not None:
-            data.append({
-                "sentence": current_sent,
-                "edits": current_edits
-            })
-        
-        print(f"解析完成 - 共加载 {len(data)} 个句子，{self.error_count} 个标注错误")
-        return data
+        return self._iter_blocks(input_file)
+
+    def _iter_blocks(self, input_file: str) -> Iterator[M2Block]:
+        for block in PROFILER.timed_iter("read", iter_m2_blocks(input_file)):
+            self.error_count += len(block.edits)
+            yield block
 
-    def analyze_sentence(self, sentence: str) -> Tuple[List[Token], Sentence]:
+    def analyze_sentence(self, sentence: str) -> Tuple[list, "Sentence"]:
         """分析中文句子（分词+词性+依赖分析）"""
         if self.nlp:
-            doc = self.nlp(sentence)
+            with PROFILER.stage("analysis", length=len(sentence)):
+                doc = self.nlp(sentence)
             if doc.sentences:
                 sent = doc.sentences[0]
                 return [token for token in sent.tokens], sent
-        # 降级分词（空格分词）
-        tokens = [Token(text=word) for word in sentence]
-        return tokens, None
+        # 降级分词（空格分词；不依赖stanza，未安装stanza时同样可用）
+        return from_whitespace(sentence).sentences[0].words, None
 
-    def generate_m2_output(self, data: List[Dict], output_file: str):
-        """生成中文标注后的M2文件（自动创建输出目录）"""
+    def annotate_block(self, block: M2Block, analysis: Tuple[list, "Sentence"] = None) -> List[str]:
+        """
+        生成一个句子块的输出行（S行 + 编辑行 + 空行）
+        :param analysis: 已分析好的 analyze_sentence 结果（流水线模式下由分析阶段提供）
+        """
+        sentence = block.source
+        # 写入句子行
+        lines = [f"S {sentence}\n"]
+        
+        # 分析句子（获取分词/依赖信息）
+        tokens, sent_analysis = analysis if analysis is not None else self.analyze_sentence(sentence)
+        
+        # 写入编辑行
+        with PROFILER.stage("format", len(block.edits), len(sentence)):
+            lines.extend(self.edit_lines(block))
+        
+        # 空行分隔
+        lines.append("\n")
+        return lines
+
+    def edit_lines(self, block: M2Block) -> List[str]:
+        """逐条编辑生成A行（补充中文错误类型说明）"""
+        lines = []
+        for edit in block.edits:
+            span = edit.span
+            error_type = edit.cat
+            correction = edit.cor
+            meta = edit.extra
+            
+            # 补充中文错误类型说明
+            zh_error = ZH_ERROR_TYPES.get(error_type, "未知错误")
+            
+            # 构建M2编辑行（与原格式一致）
+            meta_str = "|||".join(meta) if meta else "-NONE-"
+            lines.append(f"A {span}|||{error_type}|||{correction}|||JP-Errant-ZH|||REQUIRED|||{zh_error}|||0\n")
+        return lines
+
+    def generate_m2_output(self, data: Iterable[M2Block], output_file: str, pipeline: bool = False,
+                           queue_size: int = QUEUE_SIZE, metrics: MetricsExporter = None):
+        """
+        生成中文标注后的M2文件（自动创建输出目录）
+        :param pipeline: 读取 → Stanza分析 → 格式化 → 写出 分阶段在不同线程中重叠执行
+        :param queue_size: 流水线相邻阶段之间最多缓冲的批数
+        :param metrics: MetricsExporter运行指标（可选），每写出一个句子块记录一次
+        """
         # 自动创建输出目录（避免路径不存在报错）
         output_dir = os.path.dirname(output_file)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             print(f"创建输出目录: {output_dir}")
         
+        sent_count = 0
         with open(output_file, "w", encoding="utf-8") as f:
-            for idx, item in enumerate(data):
-                sentence = item["sentence"]
-                edits = item["edits"]
-                
-                # 写入句子行
-                f.write(f"S {sentence}\n")
-                
-                # 分析句子（获取分词/依赖信息）
-                tokens, sent_analysis = self.analyze_sentence(sentence)
-                
-                # 写入编辑行
-                for edit in edits:
-                    span = edit["span"]
-                    error_type = edit["error_type"]
-                    correction = edit["correction"]
-                    meta = edit["meta"]
-                    
-                    # 补充中文错误类型说明
-                    zh_error = ZH_ERROR_TYPES.get(error_type, "未知错误")
-                    
-                    # 构建M2编辑行（与原格式一致）
-                    meta_str = "|||".join(meta) if meta else "-NONE-"
-                    edit_line = f"A {span}|||{error_type}|||{correction}|||JP-Errant-ZH|||REQUIRED|||{zh_error}|||0\n"
-                    f.write(edit_line)
-                
-                # 空行分隔
-                f.write("\n")
+            if pipeline:
+                stages = [
+                    lambda batch: [(block, self.analyze_sentence(block.source)) for block in batch],
+                    lambda analyzed: [(block, self.annotate_block(block, analysis)) for block, analysis in analyzed],
+                ]
+                results = Pipeline(iter_batches(data, BATCH_SIZE), stages, queue_size)
+                if metrics is not None:
+                    metrics.queue_depths = results.depths
+                for batch_lines in results:
+                    for block, lines in batch_lines:
+                        sent_count += 1
+                        with PROFILER.stage("write"):
+                            f.writelines(lines)
+                        if metrics is not None:
+                            metrics.record(1, [edit.cat for edit in block.edits], block.end_offset)
+            else:
+                for block in data:
+                    sent_count += 1
+                    lines = self.annotate_block(block)
+                    with PROFILER.stage("write"):
+                        f.writelines(lines)
+                    if metrics is not None:
+                        metrics.record(1, [edit.cat for edit in block.edits], block.end_offset)
+        if metrics is not None:
+            metrics.finish()
+        PROFILER.count("sentences", sent_count)
+        PROFILER.count("edits", self.error_count)
         
+        print(f"解析完成 - 共加载 {sent_count} 个句子，{self.error_count} 个标注错误")
         print(f"标注完成 - 输出文件: {output_file}")
-        print(f"统计信息 - 总句子数: {len(data)}, 总错误数: {self.error_count}")
+        print(f"统计信息 - 总句子数: {sent_count}, 总错误数: {self.error_count}")
 
-    def run(self):
+    def run(self, pipeline: bool = False, queue_size: int = QUEUE_SIZE, metrics: MetricsExporter = None):
         """主运行函数（使用全局路径配置）"""
         try:
             # 使用全局配置的输入输出路径
@@ -159,17 +171,43 @@ class JPErrantZH:
             data = self.parse_m2_file(input_file)
             
             # 生成标注输出
-            self.generate_m2_output(data, output_file)
+            self.generate_m2_output(data, output_file, pipeline=pipeline, queue_size=queue_size, metrics=metrics)
             
             return 0
         except Exception as e:
             print(f"运行出错: {str(e)}", file=sys.stderr)
             return 1
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JP-Errant中文M2文件标注")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_ADDRESS, help="客户端模式：交给常驻守护进程标注（可指定套接字地址）")
+    parser.add_argument("--pipeline", action="store_true", help="读取/分析/格式化/写出分阶段在不同线程中重叠执行")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="流水线阶段之间最多缓冲的批数")
+    add_profile_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.daemon:
+        # 客户端模式：模型常驻在守护进程中，本进程不加载Stanza
+        reject_unsupported_options(parser, args)
+        try:
+            stats = remote_process("run_annotate_zh", INPUT_FILE, OUTPUT_FILE, address=args.daemon)
+        except Exception as e:
+            print(f"运行出错: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        print(f"标注完成 - 输出文件: {OUTPUT_FILE}")
+        print(f"统计信息 - 总句子数: {stats.get('blocks', 0)}, 总错误数: {stats.get('edits', 0)}")
+        sys.exit(0)
+
     # 保持极简的主函数（与原代码风格一致）
-    annotator = JPErrantZH()
-    exit_code = annotator.run()
+    metrics = None
+    if args.metrics_status or args.metrics_prom:
+        metrics = MetricsExporter("run_annotate_zh", args.metrics_status, args.metrics_prom, args.metrics_interval,
+                                  total_bytes=os.path.getsize(INPUT_FILE) if os.path.exists(INPUT_FILE) else None)
+    with profile_session("run_annotate_zh", args.profile, args.profile_trace, args.profile_sample):
+        with PROFILER.stage("init"):
+            annotator = JPErrantZH()
+        exit_code = annotator.run(pipeline=args.pipeline, queue_size=args.queue_size, metrics=metrics)
     sys.exit(exit_code)
 
 if __name__ == "__main__":
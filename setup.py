@@ -19,7 +19,7 @@ setup(
     author_email = "jungyeul.park@gmail.com",
     url = "",    
     python_requires = ">= 3.7",
-    install_requires = ["rapidfuzz>=3.4.0", "errant>=3.0.0", "stanza", "pypinyin"],
+    install_requires = ["rapidfuzz>=3.4.0", "errant>=3.0.0", "stanza", "pypinyin", "numpy"],
     package_data={
         "jp_errant": ["en/resources/*", "stanza_resources_1.7.0.json", "zh/方正黑体简体.ttf"]
     },
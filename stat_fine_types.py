@@ -1,19 +1,25 @@
 import sys
+import argparse
 from collections import defaultdict
+from m2_reader import iter_m2_blocks
+from analyzed_corpus import AnalyzedCorpus
 
 def stat_fine_error_types(fine_m2_path: str):
-    """统计细粒度错误类型分布"""
+    """统计细粒度错误类型分布（存在未过期的预分析旁路文件时直接读取，不逐行解析M2）"""
     fine_count = defaultdict(int)
     total_edits = 0
 
     try:
-        with open(fine_m2_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("A "):
-                    parts = line.split("|||")
-                    if len(parts) >=4:
-                        fine_type = parts[3]
+        corpus = AnalyzedCorpus.open_for(fine_m2_path)
+        if corpus is not None:
+            with corpus:
+                fine_count.update(corpus.count_extra_field(0))
+            total_edits = sum(fine_count.values())
+        else:
+            for block in iter_m2_blocks(fine_m2_path):
+                for edit in block.edits:
+                    if edit.extra:
+                        fine_type = edit.extra[0]
                         fine_count[fine_type] += 1
                         total_edits += 1
 
@@ -27,8 +33,13 @@ def stat_fine_error_types(fine_m2_path: str):
         print(f"统计失败：{e}")
         sys.exit(1)
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(usage="python stat_fine_types.py <fine_m2_file>",
+                                     description="细粒度错误类型分布统计")
+    parser.add_argument("fine_m2_file")
+    args = parser.parse_args(argv)
+    stat_fine_error_types(args.fine_m2_file)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python stat_fine_types.py <fine_m2_file>")
-        sys.exit(1)
-    stat_fine_error_types(sys.argv[1])
\ No newline at end of file
+    main()
@@ -0,0 +1,50 @@
+from typing import Dict, List
+
+# 词表上限：超过后在下一次对齐前清空（ID只需在一次对齐的两句之间一致，常驻进程中词表不会无限增长）
+VOCAB_LIMIT = 100000
+
+# ===================== 1. 词级对齐后端（rapidfuzz） =====================
+class TokenAligner:
+    """
+    基于rapidfuzz的词级对齐
+    原始句/修正句的词先映射为整数ID（同一词形共用一个ID），再由rapidfuzz的C实现计算
+    Levenshtein编辑操作；每个非equal操作即为一条编辑，插入/删除不会使后续位置错位
+    """
+
+    def __init__(self):
+        # rapidfuzz只在真正使用该后端时导入，不拖慢其他命令的启动
+        from rapidfuzz.distance import Levenshtein
+        self.opcodes = Levenshtein.opcodes
+        self.vocab: Dict[str, int] = {}
+
+    def intern(self, words) -> List[int]:
+        vocab = self.vocab
+        return [vocab.setdefault(word.text, len(vocab)) for word in words]
+
+    @staticmethod
+    def sentence_words(tokenized) -> list:
+        """取出分词对象的全部词（多个子句按顺序拼接，span按拼接后的位置计）"""
+        return [word for sent in tokenized.sentences for word in sent.words]
+
+    def edits(self, orig_sent, cor_sent) -> List[dict]:
+        """
+        对齐两个分词对象，返回编辑列表
+        每条编辑为 {"o_start", "o_end", "c_start", "c_end", "orig_toks", "cor_toks"}（与classify_edit的输入一致）
+        """
+        orig_words = self.sentence_words(orig_sent)
+        cor_words = self.sentence_words(cor_sent)
+        if len(self.vocab) > VOCAB_LIMIT:
+            self.vocab.clear()
+        edits = []
+        for op in self.opcodes(self.intern(orig_words), self.intern(cor_words)):
+            if op.tag == "equal":
+                continue
+            edits.append({
+                "o_start": op.src_start,
+                "o_end": op.src_end,
+                "c_start": op.dest_start,
+                "c_end": op.dest_end,
+                "orig_toks": orig_words[op.src_start:op.src_end],
+                "cor_toks": cor_words[op.dest_start:op.dest_end]
+            })
+        return edits
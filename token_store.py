@@ -0,0 +1,57 @@
+import sys
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from analysis_cache import Analysis
+
+# ===================== 1. 紧凑的词/句子对象 =====================
+# 类型只在模块加载时定义一次；使用__slots__，每个词不再携带__dict__
+# 词形/词性/词元字符串经sys.intern驻留，重复出现的词在整个进程中共用同一个字符串对象
+_intern = sys.intern
+
+
+class Word:
+    """JP-Errant要求的词对象：text/lemma/pos/idx"""
+    __slots__ = ("text", "lemma", "pos", "idx")
+
+    def __init__(self, idx: int, text: str, pos: str, lemma: Optional[str]):
+        self.text = text
+        self.lemma = lemma
+        self.pos = pos   # 通用词性标注（UPOS）
+        self.idx = idx   # 单词在句子中的位置（从1开始）
+
+    def __repr__(self):
+        return f"Word({self.idx}, {self.text!r}, {self.pos!r}, {self.lemma!r})"
+
+
+class Sentence:
+    __slots__ = ("words",)
+
+    def __init__(self, words: List[Word]):
+        self.words = words
+
+
+class Tokenized:
+    __slots__ = ("sentences",)
+
+    def __init__(self, sentences: List[Sentence]):
+        self.sentences = sentences
+
+# ===================== 2. 构造函数 =====================
+def _intern_optional(value):
+    return _intern(value) if isinstance(value, str) else value
+
+
+def from_analysis(analysis: "Analysis") -> Tokenized:
+    """由 [[(词, UPOS, 词元), ...], ...] 分析结果构造分词对象（每个子句内idx从1开始）"""
+    return Tokenized([
+        Sentence([Word(idx + 1, _intern(text), _intern_optional(upos), _intern_optional(lemma))
+                  for idx, (text, upos, lemma) in enumerate(sent)])
+        for sent in analysis
+    ])
+
+
+def from_whitespace(text: str) -> Tokenized:
+    """降级方案：按空格分词，词元为小写词形，词性为UNK"""
+    return Tokenized([Sentence([Word(idx + 1, _intern(word), "UNK", _intern(word.lower()))
+                                for idx, word in enumerate(text.split())])])
@@ -0,0 +1,85 @@
+import gc
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+# ===================== 1. 先加载、后fork的工作进程池 =====================
+class ForkPool(ProcessPoolExecutor):
+    """关闭时在父进程解除gc.freeze：冻结只需覆盖fork期间，否则在训练循环等进程内反复调用时父进程的堆会不断移入永久代、其中的循环引用永远不被回收"""
+
+    def shutdown(self, *args, **kwargs):
+        try:
+            super().shutdown(*args, **kwargs)
+        finally:
+            gc.unfreeze()
+
+
+def fork_pool(workers: int, initializer: Optional[Callable] = None, initargs: tuple = (),
+              torch_threads: Optional[int] = None) -> ForkPool:
+    """
+    创建以fork方式启动的进程池
+    父进程应在调用前加载好Stanza Pipeline等模型（且尚未做过推理），
+    子进程通过fork继承模型权重所在的内存页（写时复制），不必各自再加载一份
+    :param workers: 工作进程数
+    :param initializer: 子进程初始化函数（如打开各自的缓存连接）
+    :param torch_threads: 每个子进程的torch线程数，默认按CPU核数均分，避免线程超额订阅
+    须用with语句或显式shutdown()关闭，关闭时解除父进程的gc.freeze
+    """
+    if torch_threads is None:
+        torch_threads = default_torch_threads(workers)
+    # 冻结父进程现有对象，避免子进程中的垃圾回收遍历它们而触发写时复制（工作进程按需fork，冻结保持到进程池关闭）
+    gc.freeze()
+    return ForkPool(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_child,
+        initargs=(torch_threads, initializer, initargs)
+    )
+
+
+def default_torch_threads(workers: int) -> int:
+    """每个工作进程分到的CPU核数（至少1）"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def set_torch_threads(threads: int):
+    """限制本进程的torch/OpenMP线程数（torch未被导入时只设置环境变量）"""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _init_child(torch_threads, initializer, initargs):
+    set_torch_threads(torch_threads)
+    if initializer is not None:
+        initializer(*initargs)
+
+# ===================== 2. 内存统计（/proc） =====================
+def memory_kb(pid="self") -> Dict[str, int]:
+    """
+    读取进程内存占用（KB）
+    Rss：常驻内存；Pss：按共享进程数均摊后的内存；Shared/Private：共享页与私有页
+    """
+    stats = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    stats[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        # 旧内核没有smaps_rollup，退回status中的VmRSS
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    stats["Rss"] = int(line.split()[1])
+    return {
+        "rss": stats.get("Rss", 0),
+        "pss": stats.get("Pss", stats.get("Rss", 0)),
+        "shared": stats.get("Shared_Clean", 0) + stats.get("Shared_Dirty", 0),
+        "private": stats.get("Private_Clean", 0) + stats.get("Private_Dirty", 0),
+    }
@@ -1,9 +1,14 @@
 import sys
 import os
-import stanza
+from m2_reader import split_m2_tokens
+from analysis_cache import AnalysisCache, doc_to_analysis
 from collections import defaultdict
 
+# Stanza中文处理器组合（分类只读取分词结果，不做依存分析）
+STANZA_PROCESSORS = "tokenize,pos,lemma"
+
 # 中文特有错误判定规则（深度优化核心）
+# 字典顺序即优先级；带keywords的规则由ZHRuleMatcher按关键词编译，rule仅作为等价的参考定义
 ZH_ERROR_RULES = {
     "QUANTIFIER": {  # 量词错误
         "keywords": {"个", "本", "只", "条", "张", "把", "位"},
@@ -30,23 +35,151 @@ ZH_ERROR_RULES = {
     }
 }
 
+class ZHRuleMatcher:
+    """
+    ZH_ERROR_RULES的编译版本
+    所有关键词规则合并为一张 字符 -> 优先级 的表，原始/修正文本逐字扫描一遍即得到命中的最高优先级关键词规则；
+    无关键词的规则（如WORD_ORDER）只在其优先级高于该关键词规则时才求值
+    结果与按字典顺序逐条调用rule的首个命中一致，新增关键词规则不增加每条编辑的扫描次数
+    """
+
+    def __init__(self, rules=None):
+        rules = ZH_ERROR_RULES if rules is None else rules
+        self.names = list(rules) + ["OTHER"]
+        self.no_match = len(rules)
+        self.char_rank = {}    # 单字关键词 -> 最高优先级
+        self.multi_char = []   # (优先级, 多字关键词)，按子串匹配
+        self.custom = []       # (优先级, rule)，无关键词的规则
+        for rank, (err_type, rule_info) in enumerate(rules.items()):
+            if "rule" not in rule_info:
+                continue
+            keywords = rule_info.get("keywords")
+            if not keywords:
+                self.custom.append((rank, rule_info["rule"]))
+                continue
+            for word in keywords:
+                if len(word) == 1:
+                    self.char_rank.setdefault(word, rank)
+                else:
+                    self.multi_char.append((rank, word))
+
+    def match(self, orig_text, cor_text):
+        """返回span的错误类型（未命中任何规则时为OTHER）"""
+        char_rank = self.char_rank
+        best = self.no_match
+        for ch in orig_text + cor_text:
+            rank = char_rank.get(ch)
+            if rank is not None and rank < best:
+                best = rank
+        for rank, word in self.multi_char:
+            if rank < best and (word in orig_text or word in cor_text):
+                best = rank
+        for rank, rule in self.custom:
+            if rank >= best:
+                break
+            if rule(orig_text, cor_text):
+                return self.names[rank]
+        return self.names[best]
+
+    def match_many(self, pairs):
+        """批量分类 [(原始span文本, 修正文本), ...]"""
+        match = self.match
+        return [match(orig_text, cor_text) for orig_text, cor_text in pairs]
+
+
+class PhraseTrie:
+    """
+    容错短语词典（字符级前缀树）
+    在分词序列上从左到右做最长匹配：若干相邻词拼接后恰好等于词典中的短语，则合并为一个词
+    每个起点最多向后检查“最长短语长度”个字符，与词典大小无关
+    """
+    _END = ""
+
+    def __init__(self, phrases=()):
+        self.root = {}
+        self.size = 0
+        for phrase in phrases:
+            self.add(phrase)
+
+    def add(self, phrase):
+        phrase = "".join(phrase.split())
+        if not phrase:
+            return
+        node = self.root
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        if self._END not in node:
+            node[self._END] = True
+            self.size += 1
+
+    def load(self, path):
+        """从文件加载短语（每行一个，空行和#开头的行忽略），返回新增条数"""
+        before = self.size
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    self.add(line)
+        return self.size - before
+
+    def __len__(self):
+        return self.size
+
+    def merge(self, tokens):
+        new_tokens = []
+        i = 0
+        n = len(tokens)
+        while i < n:
+            # 从第i个词开始沿前缀树逐词前进，记录最后一个落在词边界上的完整短语
+            node = self.root
+            best = i
+            j = i
+            while j < n and node is not None:
+                for ch in tokens[j]:
+                    node = node.get(ch)
+                    if node is None:
+                        break
+                else:
+                    j += 1
+                    if self._END in node:
+                        best = j
+            if best > i + 1:
+                new_tokens.append("".join(tokens[i:best]))
+                i = best
+            else:
+                new_tokens.append(tokens[i])
+                i += 1
+        return new_tokens
+
+
 class ZHErrorClassifier:
-    def __init__(self):
+    def __init__(self, pretokenized=False, cache_dir=None, phrase_file=None):
+        # 预分词模式：信任M2 S行的切分（span按其计数），分类只用到切分结果，无需加载Stanza
+        self.pretokenized = pretokenized
         # 初始化Stanza中文模型（复用原代码路径）
-        self.nlp = self.init_stanza()
+        self.nlp = None if pretokenized else self.init_stanza()
+        # Stanza分析结果的持久化缓存（可选）
+        self.cache = AnalysisCache(cache_dir, "zh", STANZA_PROCESSORS) if cache_dir and self.nlp else None
         # 学习者文本分词容错规则（优化嘈杂文本处理）
         self.fault_tolerant_rules = {
             "动宾短语": {"打篮球", "看电影", "写作业"},
             "固定搭配": {"总而言之", "众所周知", "一方面"}
         }
+        # 容错短语只编译一次，分词时单遍最长匹配合并
+        self.phrase_trie = PhraseTrie(set().union(*self.fault_tolerant_rules.values()))
+        # 错误规则只编译一次，每条编辑单遍扫描
+        self.rule_matcher = ZHRuleMatcher()
+        if phrase_file:
+            self.load_phrases(phrase_file)
 
     def init_stanza(self):
         """复用原代码的Stanza初始化逻辑"""
         try:
+            import stanza
             return stanza.Pipeline(
                 lang="zh",
                 dir="./stanza_models",
-                processors="tokenize,pos,lemma,depparse",
+                processors=STANZA_PROCESSORS,
                 use_gpu=False,
                 download_method=None,
                 verbose=False,
@@ -58,51 +191,82 @@ class ZHErrorClassifier:
 
     def fault_tolerant_tokenize(self, text):
         """优化学习者文本分词（解决Stanza对嘈杂文本处理不足）"""
+        return self.fault_tolerant_tokenize_batch([text])[0]
+
+    def fault_tolerant_tokenize_batch(self, texts):
+        """批量容错分词：缓存未命中的句子一次性送入Stanza，重复句子只分析一次"""
+        if self.pretokenized:
+            # 直接使用M2切分，不合并短语，避免切分差异导致span错位
+            return [split_m2_tokens(text, "zh") for text in texts]
         if not self.nlp:
-            return text.split()
+            return [text.split() for text in texts]
         
-        # 第一步：Stanza基础分词
-        doc = self.nlp(text)
-        tokens = [token.text for sent in doc.sentences for token in sent.tokens]
+        # 第一步：Stanza基础分词（优先读取分析缓存）
+        unique = list(dict.fromkeys(texts))
+        analyses = self.cache.get_many(unique) if self.cache is not None else {}
+        todo = [text for text in unique if text not in analyses]
+        if len(todo) == 1:
+            computed = {todo[0]: doc_to_analysis(self.nlp(todo[0]))}
+        else:
+            from stanza import Document
+            docs = self.nlp.bulk_process([Document([], text=text) for text in todo]) if todo else []
+            computed = {text: doc_to_analysis(doc) for text, doc in zip(todo, docs)}
+        if self.cache is not None:
+            self.cache.put_many(computed)
+        analyses.update(computed)
         
         # 第二步：应用容错规则（合并固定短语）
-        new_tokens = []
-        i = 0
-        while i < len(tokens):
-            # 检查是否匹配固定短语
-            matched = False
-            for phrase in self.fault_tolerant_rules["动宾短语"] | self.fault_tolerant_rules["固定搭配"]:
-                phrase_tokens = phrase.split()
-                if i + len(phrase_tokens) <= len(tokens):
-                    current_phrase = "".join(tokens[i:i+len(phrase_tokens)])
-                    if current_phrase == phrase:
-                        new_tokens.append(phrase)
-                        i += len(phrase_tokens)
-                        matched = True
-                        break
-            if not matched:
-                new_tokens.append(tokens[i])
-                i += 1
-        return new_tokens
+        return [self.merge_phrases([word[0] for sent in analyses[text] for word in sent]) for text in texts]
+
+    def merge_phrases(self, tokens):
+        """合并学习者文本中的固定短语（前缀树最长匹配）"""
+        return self.phrase_trie.merge(tokens)
 
-    def classify_error(self, orig_sent, cor_sent, span):
-        """精准分类中文错误类型（深度优化核心）"""
-        # 第一步：容错分词
-        orig_tokens = self.fault_tolerant_tokenize(orig_sent)
-        cor_tokens = self.fault_tolerant_tokenize(cor_sent)
+    def load_phrases(self, path):
+        """从文件追加容错短语（每行一个，#开头为注释）"""
+        count = self.phrase_trie.load(path)
+        print(f"已加载容错短语 {count} 条：{path}")
+        return count
+
+    def classify_error(self, orig_sent, cor_sent, span, orig_tokens=None):
+        """
+        精准分类中文错误类型（深度优化核心）
+        :param orig_tokens: 原始句的容错分词结果（同一句的多条编辑共用，缺省时现场分词）
+        """
+        # 第一步：容错分词（规则只用到修正文本本身，修正文本无需分词）
+        if orig_tokens is None:
+            orig_tokens = self.fault_tolerant_tokenize(orig_sent)
         
-        # 第二步：提取span对应的文本片段
+        # 第二步：提取span对应的文本片段，匹配错误规则（未命中为OTHER）
+        return self.rule_matcher.match(self.span_text(orig_tokens, span), cor_sent)
+
+    @staticmethod
+    def span_text(orig_tokens, span):
+        """span对应的原始文本片段"""
         start, end = map(int, span.split())
-        orig_span_text = "".join(orig_tokens[start:end]) if start < len(orig_tokens) else ""
-        cor_span_text = cor_sent  # 修正文本
-        
-        # 第三步：匹配错误规则
-        for err_type, rule_info in ZH_ERROR_RULES.items():
-            if "rule" in rule_info and rule_info["rule"](orig_span_text, cor_span_text):
-                return err_type
-        
-        # 兜底：未知错误
-        return "OTHER"
+        return "".join(orig_tokens[start:end]) if start < len(orig_tokens) else ""
+
+    def classify_block(self, orig_sent, edits, orig_tokens=None):
+        """
+        分类一个句子块的全部编辑（原始句只分词一次）
+        :param edits: m2_reader.Edit列表
+        :return: 与edits一一对应的错误类型列表
+        """
+        if orig_tokens is None:
+            orig_tokens = self.fault_tolerant_tokenize(orig_sent)
+        return self.classify_blocks([edits], [orig_tokens])[0]
+
+    def classify_blocks(self, edit_lists, token_lists):
+        """
+        批量分类多个句子块的编辑（整批只调用一次规则匹配）
+        :param edit_lists: 每个句子块的m2_reader.Edit列表
+        :param token_lists: 每个句子块原始句的容错分词结果
+        :return: 每个句子块的错误类型列表
+        """
+        pairs = [(self.span_text(orig_tokens, edit.span), edit.cor)
+                 for edits, orig_tokens in zip(edit_lists, token_lists) for edit in edits]
+        err_types = iter(self.rule_matcher.match_many(pairs))
+        return [[next(err_types) for _ in edits] for edits in edit_lists]
 
     def get_error_desc(self, err_type):
         """错误类型中文说明"""
@@ -1,76 +1,122 @@
 import sys
 import os
+import argparse
 from zh_error_classifier import ZHErrorClassifier
+from m2_reader import iter_batches, iter_m2_blocks, parse_edit_line
+from analyzed_corpus import AnalyzedCorpusWriter, sidecar_path_for
+from daemon_client import DEFAULT_ADDRESS, reject_unsupported_options, remote_process
+from profiling import PROFILER, add_profile_arguments, profile_session
 
-def parse_m2(file_path):
-    """解析原有M2文件（复用原代码逻辑）"""
-    data = []
-    current_sent = None
-    current_edits = []
+# 每批一起分词的句子块数
+BATCH_SIZE = 32
+
+def postprocess_block(classifier, block, orig_tokens=None, fine_types=None):
+    """
+    生成一个句子块的优化输出行（S行 + 编辑行 + 空行）
+    :param fine_types: 已批量分类好的错误类型（缺省时现场分类）
+    """
+    # 写入句子行
+    lines = [f"S {block.source}\n"]
     
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("S "):
-                if current_sent is not None:
-                    data.append((current_sent, current_edits))
-                current_sent = line[2:]
-                current_edits = []
-            elif line.startswith("A "):
-                parts = line[2:].split("|||")
-                if len(parts) >= 3:
-                    span = parts[0]
-                    orig_type = parts[1]
-                    correction = parts[2]
-                    current_edits.append((span, orig_type, correction))
-    if current_sent is not None:
-        data.append((current_sent, current_edits))
-    return data
+    # 处理每个编辑
+    if fine_types is None:
+        fine_types = classifier.classify_block(block.source, block.edits, orig_tokens)
+    for edit, fine_type in zip(block.edits, fine_types):
+        # 获取错误说明
+        err_desc = classifier.get_error_desc(fine_type)
+        # 写入优化后的编辑行
+        lines.append(f"A {edit.span}|||{fine_type}|||{edit.cor}|||JP-Errant-ZH-Opt|||REQUIRED|||{err_desc}|||0\n")
+    
+    # 空行分隔
+    lines.append("\n")
+    return lines
 
-def postprocess_m2(orig_m2_path, output_m2_path):
-    """后处理M2文件，补充细粒度中文错误标注"""
+def postprocess_batch(classifier, batch, batch_tokens=None):
+    """
+    整批原始句一起分词、整批编辑一起分类，每句的分词结果由该句所有编辑共用
+    :param batch_tokens: 已分好的各句容错分词结果（缺省时现场分词）
+    """
+    if batch_tokens is None:
+        with PROFILER.stage("analysis", len(batch)):
+            batch_tokens = classifier.fault_tolerant_tokenize_batch([block.source for block in batch])
+    with PROFILER.stage("classify", sum(len(block.edits) for block in batch)):
+        batch_types = classifier.classify_blocks([block.edits for block in batch], batch_tokens)
+    for block, orig_tokens, fine_types in zip(batch, batch_tokens, batch_types):
+        yield postprocess_block(classifier, block, orig_tokens, fine_types)
+
+def postprocess_m2(orig_m2_path, output_m2_path, pretokenized=False, cache_dir=None, batch_size=BATCH_SIZE,
+                   phrase_file=None, write_sidecar=False):
+    """
+    后处理M2文件，补充细粒度中文错误标注
+    :param pretokenized: 信任M2 S行切分（中文按字符），不运行Stanza分词
+    :param cache_dir: Stanza分析结果的持久化缓存目录（可选）
+    :param batch_size: 每批一起分词的句子块数
+    :param phrase_file: 额外的容错短语文件（每行一个，可选）
+    :param write_sidecar: 同时写出预分析旁路文件（输出文件名+.ana，保存容错分词结果），
+                          修改ZH_ERROR_RULES后可用reclassify.py只重跑规则匹配
+    """
     # 初始化分类器
-    classifier = ZHErrorClassifier()
-    
-    # 解析原有M2文件
-    m2_data = parse_m2(orig_m2_path)
+    with PROFILER.stage("init"):
+        classifier = ZHErrorClassifier(pretokenized=pretokenized, cache_dir=cache_dir, phrase_file=phrase_file)
     
-    # 生成优化后的M2文件
+    # 流式读取原有M2文件，生成优化后的M2文件
+    writer = AnalyzedCorpusWriter(sidecar_path_for(output_m2_path)) if write_sidecar else None
     with open(output_m2_path, "w", encoding="utf-8") as f:
-        for sent, edits in m2_data:
-            # 写入句子行
-            f.write(f"S {sent}\n")
-            
-            # 处理每个编辑
-            for span, orig_type, correction in edits:
-                # 精准分类错误类型
-                fine_type = classifier.classify_error(sent, correction, span)
-                # 获取错误说明
-                err_desc = classifier.get_error_desc(fine_type)
-                # 写入优化后的编辑行
-                edit_line = f"A {span}|||{fine_type}|||{correction}|||JP-Errant-ZH-Opt|||REQUIRED|||{err_desc}|||0\n"
-                f.write(edit_line)
-            
-            # 空行分隔
-            f.write("\n")
+        for batch in iter_batches(PROFILER.timed_iter("read", iter_m2_blocks(orig_m2_path)), batch_size):
+            if writer is None:
+                for lines in postprocess_batch(classifier, batch):
+                    with PROFILER.stage("write"):
+                        f.writelines(lines)
+                continue
+            with PROFILER.stage("analysis", len(batch)):
+                batch_tokens = classifier.fault_tolerant_tokenize_batch([block.source for block in batch])
+            for block, orig_tokens, lines in zip(batch, batch_tokens, postprocess_batch(classifier, batch, batch_tokens)):
+                with PROFILER.stage("write"):
+                    f.writelines(lines)
+                    # 容错分词结果按一个子句保存（词性/词元留空）
+                    writer.add_block(block.source, [[(token, None, None) for token in orig_tokens]],
+                                     [parse_edit_line(line.strip()) for line in lines[1:-1]])
+    if writer is not None:
+        writer.close(output_m2_path)
     
+    if classifier.cache is not None:
+        print(classifier.cache.summary())
+        classifier.cache.close()
     print(f" 深度优化完成！输出文件：{output_m2_path}")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("用法：python zh_postprocess.py <原有M2文件路径> <优化后M2文件路径>")
-        print("示例：python zh_postprocess.py docs/data/GEC_European_Datasets/Chinese/zh_annotated.m2 docs/data/GEC_European_Datasets/Chinese/zh_annotated_fine.m2")
-        sys.exit(1)
-    
-    orig_m2 = sys.argv[1]
-    output_m2 = sys.argv[2]
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        usage="python zh_postprocess.py <原有M2文件路径> <优化后M2文件路径> [--pretokenized] [--cache DIR] [--batch-size N] [--phrases FILE] [--write-sidecar] [--daemon [ADDRESS]] [--profile REPORT.json]",
+        epilog="示例：python zh_postprocess.py docs/data/GEC_European_Datasets/Chinese/zh_annotated.m2 docs/data/GEC_European_Datasets/Chinese/zh_annotated_fine.m2"
+    )
+    parser.add_argument("orig_m2", help="原有M2文件路径")
+    parser.add_argument("output_m2", help="优化后M2文件路径")
+    parser.add_argument("--pretokenized", action="store_true", help="信任M2的切分（中文按字符），不运行Stanza分词")
+    parser.add_argument("--cache", help="Stanza分析结果的持久化缓存目录（可选）")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批一起分词的句子块数")
+    parser.add_argument("--phrases", help="额外的容错短语文件（每行一个，如成语表）")
+    parser.add_argument("--write-sidecar", action="store_true", help="同时写出预分析旁路文件，供reclassify.py只重跑规则匹配")
+    parser.add_argument("--daemon", nargs="?", const=DEFAULT_ADDRESS, help="客户端模式：交给常驻守护进程处理（可指定套接字地址）")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.daemon:
+        reject_unsupported_options(parser, args, ("orig_m2", "output_m2", "pretokenized"))
     
     # 检查输入文件是否存在
-    if not os.path.exists(orig_m2):
-        print(f" 输入文件不存在：{orig_m2}")
+    if not os.path.exists(args.orig_m2):
+        print(f" 输入文件不存在：{args.orig_m2}")
         sys.exit(1)
     
     # 执行后处理
-    postprocess_m2(orig_m2, output_m2)
\ No newline at end of file
+    if args.daemon:
+        remote_process("zh_postprocess", args.orig_m2, args.output_m2, {"pretokenized": args.pretokenized}, address=args.daemon)
+        print(f" 深度优化完成！输出文件：{args.output_m2}")
+    else:
+        with profile_session("zh_postprocess", args.profile, args.profile_trace, args.profile_sample):
+            postprocess_m2(args.orig_m2, args.output_m2, pretokenized=args.pretokenized,
+                           cache_dir=args.cache, batch_size=args.batch_size, phrase_file=args.phrases,
+                           write_sidecar=args.write_sidecar)
+
+
+if __name__ == "__main__":
+    main()